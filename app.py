@@ -1,7 +1,15 @@
+import hmac
+import json
 import os
+import threading
+import time
 import traceback
-from flask import Flask, request, jsonify
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from reference import metrics
 from reference.runinference2 import Inference
 
 app = Flask(__name__)
@@ -13,12 +21,89 @@ allowed_origins = os.getenv(
 ).split(",")
 CORS(
     app,
-    resources={r"/chat": {"origins": allowed_origins}},
-    supports_credentials=True
+    resources={r"/chat(/stream|/batch|/followups/.*)?": {"origins": allowed_origins}},
+    supports_credentials=True,
+    expose_headers=["X-Session-Id", "X-Followups-Id"]
 )
 
 # Path to vector store
-vecstore_path = '/home/filesharemount'
+vecstore_path = os.getenv("VECSTORE_PATH", '/home/filesharemount')
+
+# Bulk /chat/batch limits
+batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+batch_max_concurrency = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# How long GET /chat/followups/<id> may hold the request while questions are generated
+followup_wait_default = float(os.getenv("FOLLOWUP_WAIT_SECONDS", "10"))
+followup_wait_max = float(os.getenv("FOLLOWUP_MAX_WAIT_SECONDS", "30"))
+
+
+class EngineManager:
+    """
+    Owns the single Inference engine of this worker process.
+    The retriever, LLM clients and prompt objects are built once (at boot via
+    warm(), or lazily on the first request) and shared by every request.
+    Per-request state such as conversation history is never stored on it.
+    """
+
+    def __init__(self, store_location):
+        self.store_location = store_location
+        self.ready = False
+        self.warmup_seconds = None
+        self._engine = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the shared engine, building it on first use."""
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    self._engine = Inference(storeLocation=self.store_location)
+        return self._engine
+
+    def warm(self):
+        """Build and initialize the engine eagerly, then mark the worker as ready."""
+        start = time.perf_counter()
+        try:
+            complete = self.get().warm_up()
+        except Exception as e:
+            print(f"⚠️ Warning: Engine warm-up failed: {e}")
+            return False
+        self.warmup_seconds = time.perf_counter() - start
+        self.ready = True
+        state = "ready" if complete else "ready (degraded)"
+        print(f"🔥 Engine {state} in {self.warmup_seconds:.2f}s (pid {os.getpid()})")
+        return complete
+
+    def reset(self):
+        """Drop the engine (e.g. after fork) so clients are rebuilt in this process."""
+        with self._lock:
+            self._engine = None
+            self.ready = False
+            self.warmup_seconds = None
+
+
+engine_manager = EngineManager(vecstore_path)
+
+
+# --- Request metrics ---
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_start = metrics.request_started(g.metrics_endpoint)
+
+
+@app.after_request
+def record_response_status(resp):
+    g.metrics_status = resp.status_code
+    return resp
+
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # Runs after the last chunk for streamed responses, so in-flight covers the whole stream
+    if "metrics_start" in g:
+        metrics.request_finished(g.metrics_endpoint, g.get("metrics_status", 500), g.metrics_start)
 
 
 @app.route('/')
@@ -27,12 +112,28 @@ def main_page():
     return 'Hello there! Welcome to MedCopilot — your medical guidelines assistant!'
 
 
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once this worker's engine is warm"""
+    return jsonify(readiness_status()), (200 if engine_manager.ready else 503)
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint (aggregated across gunicorn workers)"""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
 @app.route('/chat', methods=['POST', 'OPTIONS'])
 def chat():
     """Main API endpoint to handle chat messages"""
     if request.method == 'OPTIONS':
         return ('', 204)
 
+    if wants_event_stream(request.headers):
+        return chat_stream()
+
     if not request.is_json:
         return jsonify({"error": "Invalid request. Expected JSON body."}), 400
 
@@ -43,16 +144,43 @@ def chat():
         return jsonify({"error": "Missing 'message' in JSON body."}), 400
 
     print(f"📩 Received message: {message}")
+    # Conversation history is kept per client session, never on the shared engine
+    session = session_id_from(request.headers, body)
+
+    cold = not engine_manager.ready
+    start = time.perf_counter()
 
     try:
-        inference = Inference(storeLocation=vecstore_path)
-        response = inference.run_inference(message)
+        inference = engine_manager.get()
+        # History is per-request state; never keep it on the shared engine
+        response = inference.run_inference(message, maintain_history=False, session_id=session)
         print("✅ DEBUG: Raw response from Inference:", response)
 
-        serialized = serialize(response)
+        if cold:
+            # The first request paid for initialization; later ones are warm
+            engine_manager.ready = True
+
+        with metrics.stage_timer("serialize"):
+            serialized = serialize(response)
         print("✅ DEBUG: Serialized response:", serialized)
 
-        return jsonify(serialized)
+        elapsed = time.perf_counter() - start
+        print(f"⏱️ /chat served {'cold' if cold else 'warm'} in {elapsed:.3f}s")
+
+        resp = jsonify(serialized)
+        resp.headers["X-Engine-State"] = "cold" if cold else "warm"
+        timing_header = server_timing(response)
+        if timing_header:
+            resp.headers["Server-Timing"] = timing_header
+        resp.headers.update(cache_headers(response))
+        resp.headers.update(context_headers(response))
+        if session:
+            resp.headers["X-Session-Id"] = session
+        # Follow-ups are fetched separately, so they never delay the answer
+        followup_id = register_followups(inference, message, response, session)
+        if followup_id:
+            resp.headers["X-Followups-Id"] = followup_id
+        return resp
 
     except Exception as e:
         print("❌ ERROR in /chat handler:")
@@ -65,6 +193,286 @@ def chat():
         return jsonify(error), 500
 
 
+@app.route('/chat/stream', methods=['POST', 'OPTIONS'])
+def chat_stream():
+    """Streaming variant of /chat: sends the answer as Server-Sent Events"""
+    if request.method == 'OPTIONS':
+        return ('', 204)
+
+    if not request.is_json:
+        return jsonify({"error": "Invalid request. Expected JSON body."}), 400
+
+    body = request.get_json(silent=True) or {}
+    message = body.get('message')
+
+    if not message:
+        return jsonify({"error": "Missing 'message' in JSON body."}), 400
+
+    print(f"📩 Received streaming message: {message}")
+    session = session_id_from(request.headers, body)
+    inference = engine_manager.get()
+
+    def generate():
+        try:
+            for event, payload in inference.stream_reasoning(message, maintain_history=False, session_id=session):
+                if event == "context":
+                    yield sse_event("context", {"input": message, "context": serialize_context(payload)})
+                elif event == "token":
+                    yield sse_event("token", {"text": payload})
+                else:
+                    engine_manager.ready = True
+                    followup_id = register_followups(inference, message, payload, session)
+                    yield sse_event("end", {
+                        "answer": payload.get("answer", ""),
+                        "timings": payload.get("timings", {}),
+                        "context_tokens": payload.get("context_tokens"),
+                        "followups": followup_id,
+                        "error": payload.get("error")
+                    })
+                    # Clients that asked for them get the questions as a trailing event
+                    if followup_id and body.get("followups"):
+                        status, questions = inference.get_followups(followup_id, followup_wait(None))
+                        yield sse_event("followups", followup_payload(followup_id, status, questions)[0])
+        except Exception as e:
+            print("❌ ERROR in /chat/stream handler:")
+            print(traceback.format_exc())
+            yield sse_event("end", {"answer": "", "timings": {}, "error": str(e)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+
+@app.route('/chat/followups/<followup_id>', methods=['GET', 'OPTIONS'])
+def chat_followups(followup_id):
+    """Follow-up questions for an answer; waits up to ?wait= seconds for them to be generated"""
+    if request.method == 'OPTIONS':
+        return ('', 204)
+
+    inference = engine_manager.get()
+    status, questions = inference.get_followups(followup_id, followup_wait(request.args.get('wait')))
+    payload, status_code = followup_payload(followup_id, status, questions)
+    return jsonify(payload), status_code
+
+
+@app.route('/chat/batch', methods=['POST', 'OPTIONS'])
+def chat_batch():
+    """
+    Bulk chat: {"messages": ["...", ...], "concurrency": n}
+    Items run on a bounded worker pool and stream back as NDJSON lines in
+    completion order; a failing item reports its error without failing the batch.
+    """
+    if request.method == 'OPTIONS':
+        return ('', 204)
+
+    if not request.is_json:
+        return jsonify({"error": "Invalid request. Expected JSON body."}), 400
+
+    body = request.get_json(silent=True) or {}
+    items, error = parse_batch_items(body.get('messages'))
+    if error:
+        return jsonify({"error": error}), 400
+
+    concurrency, error = parse_batch_concurrency(body.get('concurrency'))
+    if error:
+        return jsonify({"error": error}), 400
+    print(f"📦 Received batch of {len(items)} messages (concurrency {concurrency})")
+    inference = engine_manager.get()
+
+    def run_item(index, item_id, message):
+        start = time.perf_counter()
+        try:
+            response = inference.run_inference(message, maintain_history=False)
+            line = {"index": index, "id": item_id, "status": "ok", "result": serialize(response)}
+            if response.get("error"):
+                line.update(status="error", error=response["error"])
+        except Exception as e:
+            print(f"❌ ERROR in /chat/batch item {index}: {e}")
+            line = {"index": index, "id": item_id, "status": "error", "error": str(e)}
+        line["elapsed"] = round(time.perf_counter() - start, 3)
+        return line
+
+    def generate():
+        start = time.perf_counter()
+        # One upstream embedding call for the whole batch; items then hit the cache
+        inference.prime_embeddings([message for _, _, message in items])
+        errors = 0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chat-batch") as pool:
+            futures = [pool.submit(run_item, *item) for item in items]
+            for future in as_completed(futures):
+                line = future.result()
+                errors += line["status"] != "ok"
+                yield json.dumps(line) + "\n"
+        yield json.dumps({
+            "done": True,
+            "count": len(items),
+            "errors": errors,
+            "elapsed": round(time.perf_counter() - start, 3)
+        }) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={"X-Accel-Buffering": "no"})
+
+
+def parse_batch_concurrency(value):
+    """Return (concurrency clamped to 1..BATCH_MAX_CONCURRENCY, None) or (None, error message)."""
+    if value is None:
+        return batch_max_concurrency, None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None, "'concurrency' must be a positive integer."
+    try:
+        concurrency = int(value)
+    except ValueError:
+        return None, "'concurrency' must be a positive integer."
+    return max(1, min(concurrency, batch_max_concurrency)), None
+
+
+def parse_batch_items(messages):
+    """Normalise batch input to [(index, id, message)]; returns (items, error)."""
+    if not isinstance(messages, list) or not messages:
+        return None, "Expected a non-empty 'messages' list in JSON body."
+    if len(messages) > batch_max_items:
+        return None, f"Too many messages: {len(messages)} (max {batch_max_items})."
+
+    items = []
+    for index, entry in enumerate(messages):
+        if isinstance(entry, dict):
+            item_id, message = entry.get('id', index), entry.get('message')
+        else:
+            item_id, message = index, entry
+        if not isinstance(message, str) or not message:
+            return None, f"Message {index} is missing or not a string."
+        items.append((index, item_id, message))
+    return items, None
+
+
+@app.route('/admin/response-cache', methods=['GET', 'DELETE'])
+def admin_response_cache():
+    """Inspect (GET) or purge (DELETE, optional ?key= or ?older_than=seconds) the response cache"""
+    if not admin_authorized(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+
+    cache = engine_manager.get().response_cache
+    if cache is None:
+        return jsonify({"error": "Response cache is disabled. Set RESPONSE_CACHE_PATH to enable it."}), 404
+
+    if request.method == 'DELETE':
+        purged = cache.purge(
+            key=request.args.get('key'),
+            older_than=request.args.get('older_than', type=float)
+        )
+        print(f"🧹 Purged {purged} response cache entries.")
+        return jsonify({"purged": purged})
+
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({"stats": cache.stats(), "entries": cache.entries(limit)})
+
+
+def admin_authorized(headers):
+    """Admin endpoints require ADMIN_TOKEN to be configured and sent as X-Admin-Token."""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        return False
+    return hmac.compare_digest(headers.get("X-Admin-Token", ""), token)
+
+
+def wants_event_stream(headers):
+    """True when text/event-stream is the client's preferred Accept type (same rule for Flask and ASGI)."""
+    return parse_accept_header(headers.get("Accept", ""), MIMEAccept).best == 'text/event-stream'
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def readiness_status():
+    """Readiness details for this worker, including embedding cache counters."""
+    engine = engine_manager._engine
+    embeddings = getattr(engine, "embeddings", None)
+    coalescer = getattr(embeddings, "embeddings", None)
+    return {
+        "ready": engine_manager.ready,
+        "pid": os.getpid(),
+        "warmup_seconds": engine_manager.warmup_seconds,
+        "embedding_cache": embeddings.stats() if hasattr(embeddings, "stats") else None,
+        "embedding_coalescer": coalescer.stats() if hasattr(coalescer, "stats") else None,
+        "semantic_cache": engine.semantic_cache.stats() if getattr(engine, "semantic_cache", None) else None,
+        "category_router": engine.category_router.stats() if getattr(engine, "category_router", None) else None,
+        "sessions": engine.session_store.stats() if getattr(engine, "session_store", None) else None,
+        "followups": engine.followups.stats() if getattr(engine, "followups", None) else None,
+        "prefetch": engine.prefetcher.stats() if getattr(engine, "prefetcher", None) else None
+    }
+
+
+def register_followups(inference, message, result, session=None):
+    """Follow-up id for an answer, or None when the engine does not provide follow-ups."""
+    register = getattr(inference, "register_followups", None)
+    return register(message, result, session) if register else None
+
+
+def followup_wait(value):
+    try:
+        wait = float(value) if value is not None else followup_wait_default
+    except ValueError:
+        wait = followup_wait_default
+    return min(max(wait, 0.0), followup_wait_max)
+
+
+def followup_payload(followup_id, status, questions):
+    """(JSON body, HTTP status) for a follow-up lookup: 200 when done, 202 while pending."""
+    payload = {"id": followup_id, "status": status, "questions": questions or []}
+    if status == "done":
+        return payload, 200
+    if status == "missing":
+        return dict(payload, error="Unknown or expired follow-up id."), 404
+    if status == "failed":
+        return dict(payload, error="Follow-up generation failed."), 502
+    return payload, 202
+
+
+def session_id_from(headers, body):
+    """Client session id from the X-Session-Id header or the session_id body field; None for stateless requests."""
+    value = headers.get("X-Session-Id") or (body.get("session_id") if isinstance(body, dict) else None)
+    value = str(value).strip()[:128] if value else ""
+    return value or None
+
+
+def server_timing(result):
+    """Render the per-stage timings of an inference result as a Server-Timing header."""
+    timings = result.get('timings') if isinstance(result, dict) else None
+    if not timings:
+        return None
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+
+def cache_headers(result):
+    """Expose semantic and response cache outcomes as response headers."""
+    if not isinstance(result, dict):
+        return {}
+    headers = {}
+    info = result.get('semantic_cache')
+    if info:
+        headers.update({
+            "X-Semantic-Cache": "HIT" if info["hit"] else "MISS",
+            "X-Semantic-Cache-Score": f"{info['score']:.4f}",
+            "X-Semantic-Cache-Hit-Rate": f"{info['hit_rate']:.4f}"
+        })
+    info = result.get('response_cache')
+    if info:
+        headers["X-Response-Cache"] = info["state"].upper() if info["hit"] else "MISS"
+    return headers
+
+
+def context_headers(result):
+    """Expose the context assembly token accounting as response headers."""
+    info = result.get('context_tokens') if isinstance(result, dict) else None
+    if not info:
+        return {}
+    return {
+        "X-Context-Tokens": str(info["tokens_out"]),
+        "X-Context-Tokens-Saved": str(info["tokens_saved"])
+    }
+
+
 def serialize(result):
     """
     Safely convert inference output into a JSON serializable dict.
@@ -76,15 +484,7 @@ def serialize(result):
             input_text = result.get('input', "")
             answer = result.get('answer', str(result))
             context_items = result.get('context', [])
-
-            context_list = []
-            for item in context_items:
-                # Handle structured context items gracefully
-                context_dict = {
-                    "metadata": getattr(item, "metadata", {}),
-                    "page_content": getattr(item, "page_content", str(item))
-                }
-                context_list.append(context_dict)
+            context_list = serialize_context(context_items)
 
             return {
                 "input": input_text,
@@ -113,6 +513,26 @@ def serialize(result):
         }
 
 
+def serialize_context(context_items):
+    """Convert retrieved documents into JSON serializable dicts."""
+    context_list = []
+    for item in context_items:
+        if isinstance(item, dict):
+            # Already serialized (e.g. served from the response cache)
+            context_list.append({
+                "metadata": item.get("metadata", {}),
+                "page_content": item.get("page_content", "")
+            })
+            continue
+        # Handle structured context items gracefully
+        context_dict = {
+            "metadata": getattr(item, "metadata", {}),
+            "page_content": getattr(item, "page_content", str(item))
+        }
+        context_list.append(context_dict)
+    return context_list
+
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port)
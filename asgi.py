@@ -0,0 +1,366 @@
+"""
+Async (ASGI) serving mode for the MedCopilot API.
+
+Serves the same endpoints as app.py, but drives the RAG pipeline with
+ainvoke/astream so one worker process can hold hundreds of in-flight
+/chat requests while waiting on OpenAI. Upstream concurrency is bounded
+by UPSTREAM_CONCURRENCY.
+
+Run with:
+    gunicorn -k uvicorn_worker.UvicornWorker --bind=0.0.0.0 asgi:app
+"""
+import asyncio
+import json
+import os
+import time
+import traceback
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+from app import (
+    admin_authorized,
+    allowed_origins,
+    cache_headers,
+    context_headers,
+    engine_manager,
+    followup_payload,
+    followup_wait,
+    parse_batch_concurrency,
+    parse_batch_items,
+    readiness_status,
+    serialize,
+    serialize_context,
+    server_timing,
+    register_followups,
+    session_id_from,
+    sse_event,
+    wants_event_stream,
+)
+from reference import metrics
+
+# Maximum number of requests talking to OpenAI at the same time in this process
+upstream_limit = asyncio.Semaphore(int(os.getenv("UPSTREAM_CONCURRENCY", "64")))
+
+# Same CORS policy as app.py: only the chat endpoints, credentials allowed
+chat_cors = [
+    Middleware(
+        CORSMiddleware,
+        allow_origins=allowed_origins,
+        allow_credentials=True,
+        allow_methods=["GET", "HEAD", "POST", "OPTIONS", "PUT", "PATCH", "DELETE"],
+        allow_headers=["*"],
+        expose_headers=["X-Session-Id", "X-Followups-Id"],
+    )
+]
+
+
+async def main_page(request):
+    """Basic welcome route"""
+    return PlainTextResponse('Hello there! Welcome to MedCopilot — your medical guidelines assistant!')
+
+
+async def ready(request):
+    """Readiness probe: 200 once this worker's engine is warm"""
+    return JSONResponse(readiness_status(), status_code=200 if engine_manager.ready else 503)
+
+
+async def read_message(request):
+    """Return (message, None) or (None, error response) for a chat request."""
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/json":
+        return None, JSONResponse({"error": "Invalid request. Expected JSON body."}, status_code=400)
+
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    message = body.get('message') if isinstance(body, dict) else None
+
+    if not message:
+        return None, JSONResponse({"error": "Missing 'message' in JSON body."}, status_code=400)
+    return message, None
+
+
+async def read_body(request):
+    """JSON body of a chat request that read_message already parsed (Starlette caches it)."""
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    return body if isinstance(body, dict) else {}
+
+
+async def read_session_id(request):
+    return session_id_from(request.headers, await read_body(request))
+
+
+async def chat(request):
+    """Main API endpoint to handle chat messages"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=204)
+
+    if wants_event_stream(request.headers):
+        return await chat_stream(request)
+
+    message, error = await read_message(request)
+    if error:
+        return error
+
+    print(f"📩 Received message: {message}")
+    session = await read_session_id(request)
+
+    cold = not engine_manager.ready
+    start = time.perf_counter()
+
+    try:
+        inference = engine_manager.get()
+        async with upstream_limit:
+            response = await inference.arun_inference(message, maintain_history=False, session_id=session)
+
+        if cold:
+            engine_manager.ready = True
+
+        with metrics.stage_timer("serialize"):
+            serialized = serialize(response)
+
+        elapsed = time.perf_counter() - start
+        print(f"⏱️ /chat served {'cold' if cold else 'warm'} in {elapsed:.3f}s")
+
+        headers = {"X-Engine-State": "cold" if cold else "warm"}
+        timing_header = server_timing(response)
+        if timing_header:
+            headers["Server-Timing"] = timing_header
+        headers.update(cache_headers(response))
+        headers.update(context_headers(response))
+        if session:
+            headers["X-Session-Id"] = session
+        followup_id = register_followups(inference, message, response, session)
+        if followup_id:
+            headers["X-Followups-Id"] = followup_id
+        return JSONResponse(serialized, headers=headers)
+
+    except Exception as e:
+        print("❌ ERROR in /chat handler:")
+        print(traceback.format_exc())
+
+        error = {
+            "error": "An error occurred while processing your request.",
+            "details": str(e)
+        }
+        return JSONResponse(error, status_code=500)
+
+
+async def chat_stream(request):
+    """Streaming variant of /chat: sends the answer as Server-Sent Events"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=204)
+
+    message, error = await read_message(request)
+    if error:
+        return error
+
+    print(f"📩 Received streaming message: {message}")
+    session = await read_session_id(request)
+    wants_followups = (await read_body(request)).get("followups")
+    inference = engine_manager.get()
+
+    async def generate():
+        followup_id = None
+        try:
+            async with upstream_limit:
+                async for event, payload in inference.astream_reasoning(message, maintain_history=False, session_id=session):
+                    if event == "context":
+                        yield sse_event("context", {"input": message, "context": serialize_context(payload)})
+                    elif event == "token":
+                        yield sse_event("token", {"text": payload})
+                    else:
+                        engine_manager.ready = True
+                        followup_id = register_followups(inference, message, payload, session)
+                        yield sse_event("end", {
+                            "answer": payload.get("answer", ""),
+                            "timings": payload.get("timings", {}),
+                            "context_tokens": payload.get("context_tokens"),
+                            "followups": followup_id,
+                            "error": payload.get("error")
+                        })
+            if followup_id and wants_followups:
+                # Trailing event, sent after the upstream slot is released
+                status, questions = await run_in_threadpool(inference.get_followups, followup_id, followup_wait(None))
+                yield sse_event("followups", followup_payload(followup_id, status, questions)[0])
+        except Exception as e:
+            print("❌ ERROR in /chat/stream handler:")
+            print(traceback.format_exc())
+            yield sse_event("end", {"answer": "", "timings": {}, "error": str(e)})
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=headers)
+
+
+async def chat_followups(request):
+    """Follow-up questions for an answer; waits up to ?wait= seconds for them to be generated"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=204)
+
+    followup_id = request.path_params["followup_id"]
+    wait = followup_wait(request.query_params.get("wait"))
+    status, questions = await run_in_threadpool(engine_manager.get().get_followups, followup_id, wait)
+    payload, status_code = followup_payload(followup_id, status, questions)
+    return JSONResponse(payload, status_code=status_code)
+
+
+async def chat_batch(request):
+    """Bulk chat: items run with bounded concurrency and stream back as NDJSON"""
+    if request.method == 'OPTIONS':
+        return Response(status_code=204)
+
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/json":
+        return JSONResponse({"error": "Invalid request. Expected JSON body."}, status_code=400)
+    try:
+        body = await request.json()
+    except Exception:
+        body = {}
+    if not isinstance(body, dict):
+        body = {}
+
+    items, error = parse_batch_items(body.get('messages'))
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+
+    concurrency, error = parse_batch_concurrency(body.get('concurrency'))
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+    print(f"📦 Received batch of {len(items)} messages (concurrency {concurrency})")
+    inference = engine_manager.get()
+    gate = asyncio.Semaphore(concurrency)
+
+    async def run_item(index, item_id, message):
+        start = time.perf_counter()
+        try:
+            async with gate, upstream_limit:
+                response = await inference.arun_inference(message, maintain_history=False)
+            line = {"index": index, "id": item_id, "status": "ok", "result": serialize(response)}
+            if response.get("error"):
+                line.update(status="error", error=response["error"])
+        except Exception as e:
+            print(f"❌ ERROR in /chat/batch item {index}: {e}")
+            line = {"index": index, "id": item_id, "status": "error", "error": str(e)}
+        line["elapsed"] = round(time.perf_counter() - start, 3)
+        return line
+
+    async def generate():
+        start = time.perf_counter()
+        await run_in_threadpool(inference.prime_embeddings, [message for _, _, message in items])
+        errors = 0
+        for next_done in asyncio.as_completed([run_item(*item) for item in items]):
+            line = await next_done
+            errors += line["status"] != "ok"
+            yield json.dumps(line) + "\n"
+        yield json.dumps({
+            "done": True,
+            "count": len(items),
+            "errors": errors,
+            "elapsed": round(time.perf_counter() - start, 3)
+        }) + "\n"
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson', headers={"X-Accel-Buffering": "no"})
+
+
+async def admin_response_cache(request):
+    """Inspect (GET) or purge (DELETE, optional ?key= or ?older_than=seconds) the response cache"""
+    if not admin_authorized(request.headers):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+
+    cache = engine_manager.get().response_cache
+    if cache is None:
+        return JSONResponse(
+            {"error": "Response cache is disabled. Set RESPONSE_CACHE_PATH to enable it."}, status_code=404
+        )
+
+    if request.method == 'DELETE':
+        purged = await run_in_threadpool(
+            cache.purge,
+            key=request.query_params.get('key'),
+            older_than=query_number(request, 'older_than', float, None)
+        )
+        print(f"🧹 Purged {purged} response cache entries.")
+        return JSONResponse({"purged": purged})
+
+    limit = query_number(request, 'limit', int, 100)
+    stats, entries = await run_in_threadpool(lambda: (cache.stats(), cache.entries(limit)))
+    return JSONResponse({"stats": stats, "entries": entries})
+
+
+def query_number(request, name, kind, default):
+    """Like Flask's args.get(name, default, type=kind): unparsable values fall back to the default."""
+    try:
+        return kind(request.query_params[name])
+    except (KeyError, ValueError):
+        return default
+
+
+async def prometheus_metrics(request):
+    """Prometheus scrape endpoint (aggregated across gunicorn workers)"""
+    body, content_type = metrics.render()
+    return Response(body, headers={"Content-Type": content_type})
+
+
+class RequestMetricsMiddleware:
+    """Counts in-flight requests and records latency and status per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        endpoint = route_template(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = metrics.request_started(endpoint)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.request_finished(endpoint, status, start)
+
+
+def route_template(scope):
+    """Label by route path (/chat/followups/{followup_id}), never by raw URL."""
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Build and warm the engine off the event loop before taking traffic
+    await run_in_threadpool(engine_manager.warm)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/', main_page),
+        Route('/ready', ready),
+        Route('/metrics', prometheus_metrics),
+        Route('/admin/response-cache', admin_response_cache, methods=['GET', 'DELETE']),
+        Route('/chat', chat, methods=['POST', 'OPTIONS'], middleware=chat_cors),
+        Route('/chat/stream', chat_stream, methods=['POST', 'OPTIONS'], middleware=chat_cors),
+        Route('/chat/batch', chat_batch, methods=['POST', 'OPTIONS'], middleware=chat_cors),
+        Route('/chat/followups/{followup_id}', chat_followups, methods=['GET', 'OPTIONS'], middleware=chat_cors),
+    ],
+    middleware=[Middleware(RequestMetricsMiddleware)],
+    lifespan=lifespan,
+)
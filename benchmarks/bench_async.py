@@ -0,0 +1,129 @@
+"""
+Compare the sync (Flask) and async (ASGI) /chat serving modes against a
+stubbed LLM and retriever with fixed latency.
+
+The sync mode mirrors the Dockerfile default (one sync gunicorn worker,
+no threads) unless --sync-workers is raised; the async mode pushes every
+request through one event loop with --concurrency requests in flight.
+
+Usage:
+    python benchmarks/bench_async.py
+    python benchmarks/bench_async.py --requests 400 --concurrency 200 --llm-latency 0.5
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import app as app_module
+import asgi as asgi_module
+from reference.runinference2 import Inference
+
+
+class StubChatModel(FakeListChatModel):
+    """Fake chat model that sleeps like an upstream call (blocking or awaitable)"""
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.sleep is not None:
+            await asyncio.sleep(self.sleep)
+        message = AIMessage(content=self.responses[0])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class StubRetriever:
+    """Retriever that sleeps like an embedding call plus a vector search"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.docs = [Document(page_content="Stub guideline text.", metadata={"source": "stub.pdf"})]
+
+    def invoke(self, query):
+        time.sleep(self.latency)
+        return self.docs
+
+    async def ainvoke(self, query):
+        await asyncio.sleep(self.latency)
+        return self.docs
+
+
+def build_engine(args):
+    engine = Inference(storeLocation="unused")
+    engine.retriever = StubRetriever(args.retrieval_latency)
+    engine.llm = StubChatModel(responses=["Other"], sleep=args.llm_latency)
+    app_module.engine_manager._engine = engine
+    app_module.engine_manager.ready = True
+    return engine
+
+
+def summarize(mode, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{mode:<6} requests={len(latencies):<5} wall={elapsed:7.2f}s "
+        f"throughput={len(latencies) / elapsed:8.1f} req/s "
+        f"p50={statistics.median(latencies) * 1000:7.0f}ms p99={p99 * 1000:7.0f}ms"
+    )
+
+
+def run_sync(args):
+    """Flask app, args.sync_workers requests at a time (sync gunicorn workers)."""
+    client = app_module.app.test_client()
+
+    def one(i):
+        start = time.perf_counter()
+        response = client.post('/chat', json={"message": f"question {i}"})
+        assert response.status_code == 200
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sync_workers) as pool:
+        latencies = list(pool.map(one, range(args.requests)))
+    summarize("sync", latencies, time.perf_counter() - start)
+
+
+async def run_async(args):
+    """ASGI app, args.concurrency requests in flight on one event loop."""
+    transport = httpx.ASGITransport(app=asgi_module.app)
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i):
+            async with gate:
+                start = time.perf_counter()
+                response = await client.post('/chat', json={"message": f"question {i}"})
+                assert response.status_code == 200
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(args.requests)))
+    summarize("async", latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async /chat serving")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per mode (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=100, help="In-flight requests for async mode (default: 100)")
+    parser.add_argument("--sync-workers", type=int, default=1, help="Concurrent requests for sync mode (default: 1)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per stub LLM call (default: 0.2)")
+    parser.add_argument("--retrieval-latency", type=float, default=0.05, help="Seconds per stub retrieval (default: 0.05)")
+    args = parser.parse_args()
+
+    build_engine(args)
+    run_sync(args)
+    asyncio.run(run_async(args))
+
+
+if __name__ == "__main__":
+    main()
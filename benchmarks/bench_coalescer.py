@@ -0,0 +1,80 @@
+"""
+Load test for the embedding coalescer against the local stub embedding
+server: many concurrent "requests" each embed one new question, with and
+without coalescing. Reports requests/sec, p50/p99 latency and how many
+upstream embedding calls were made.
+
+Usage:
+    python benchmarks/bench_coalescer.py
+    python benchmarks/bench_coalescer.py --requests 2000 --concurrency 128 --window-ms 10
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_openai import OpenAIEmbeddings
+
+from benchmarks.stub_openai import StubOpenAIServer
+from reference.embeddingcoalescer import CoalescingEmbeddings
+
+
+def run(label, embeddings, server, args):
+    server.reset_counters()
+
+    def one(i):
+        start = time.perf_counter()
+        embeddings.embed_query(f"guideline question number {i}")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = sorted(pool.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{label:<12} {args.requests / elapsed:8.1f} req/s  "
+        f"p50={statistics.median(latencies) * 1000:6.0f}ms  p99={p99 * 1000:6.0f}ms  "
+        f"upstream_calls={server.embedding_requests}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding coalescing against a stub server")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--window-ms", type=float, default=10)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--embed-latency", type=float, default=0.1, help="Stub seconds per upstream request")
+    parser.add_argument("--max-connections", type=int, default=16,
+                        help="Upstream HTTP connections, like a real client pool (default: 16)")
+    args = parser.parse_args()
+
+    server = StubOpenAIServer(embed_latency=args.embed_latency).start()
+    try:
+        import httpx
+
+        client = httpx.Client(limits=httpx.Limits(max_connections=args.max_connections))
+        upstream = OpenAIEmbeddings(
+            base_url=server.base_url,
+            api_key="stub",
+            check_embedding_ctx_length=False,
+            http_client=client,
+        )
+        run("direct", upstream, server, args)
+        coalesced = CoalescingEmbeddings(upstream, window_ms=args.window_ms, max_batch=args.max_batch,
+                                         workers=args.max_connections)
+        run("coalesced", coalesced, server, args)
+        print(f"mean batch size: {coalesced.stats()['mean_batch_size']}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-request Python overhead of building the generation prompt and chain:
+the previous approach (copy the system prompt, check for {context}, re-parse
+ChatPromptTemplate.from_messages and build a new LCEL chain per call, with
+history spliced in as template messages) against the precompiled
+PromptRegistry (lookup plus MessagesPlaceholder).
+
+Each iteration formats the full prompt (prompt.invoke) so both sides do the
+same message work; the LLM is not called.
+
+Usage:
+    python benchmarks/bench_prompts.py
+    python benchmarks/bench_prompts.py --iterations 5000 --history-turns 6
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
+
+from reference.promptcategories import PromptCategories
+from reference.promptregistry import PromptRegistry
+
+CATEGORY = "Treatment Recommendation"
+CONTEXT = "ACG guideline: PPI therapy for GERD. " * 40
+
+
+def rebuilt(categories, llm, history, query):
+    """The per-request construction query_reasoning used to do."""
+    messages = [("system", categories.get_prompt(CATEGORY))]
+    for msg in history:
+        messages.append(("human" if isinstance(msg, HumanMessage) else "ai", msg.content))
+    messages.append(("human", "{input}"))
+    if "{context}" not in messages[0][1]:
+        messages[0] = ("system", f"{messages[0][1]}\n\nContext:\n{{context}}")
+    prompt = ChatPromptTemplate.from_messages(messages)
+    rag_chain = prompt | llm | StrOutputParser()
+    classify_prompt = PromptTemplate(input_variables=["query", "context"],
+                                     template=categories.get_classification_template())
+    classify_chain = classify_prompt | llm | StrOutputParser()
+    prompt.invoke({"context": CONTEXT, "input": query})
+    return rag_chain, classify_chain
+
+
+def precompiled(registry, llm, history, query):
+    rag_chain = registry.rag_chain(CATEGORY, llm)
+    classify_chain = registry.chain("classification", llm)
+    registry.rag_prompt(CATEGORY).invoke({"context": CONTEXT, "input": query, PromptRegistry.HISTORY: history})
+    return rag_chain, classify_chain
+
+
+def measure(label, fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<12} p50={statistics.median(samples):8.1f}us  p99={p99:8.1f}us  mean={statistics.mean(samples):8.1f}us")
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt/chain construction overhead per request")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--history-turns", type=int, default=4, help="Conversation turns replayed into the prompt")
+    args = parser.parse_args()
+
+    categories = PromptCategories()
+    llm = FakeListChatModel(responses=["stub"])
+    history = []
+    for i in range(args.history_turns):
+        history += [HumanMessage(f"Follow-up question {i}?"), AIMessage("Answer paragraph. " * 30)]
+    query = "How is GERD treated?"
+
+    compile_start = time.perf_counter()
+    registry = PromptRegistry(categories)
+    registry.bind(llm)
+    print(f"Registry compiled {len(categories.get_categories())} categories in "
+          f"{(time.perf_counter() - compile_start) * 1000:.1f}ms (once per process)")
+
+    before = measure("rebuilt", lambda: rebuilt(categories, llm, history, query), args.iterations)
+    after = measure("precompiled", lambda: precompiled(registry, llm, history, query), args.iterations)
+    print(f"Saved {before - after:.1f}us per request ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Recall@k and latency of vector-only, BM25-only and hybrid (RRF) retrieval.
+
+By default a synthetic guideline corpus is built in a temp Chroma store.
+Every chunk mentions one rare exact term (a drug or gene name) and three
+clinical concepts amid shared vocabulary. Half the queries ask about the
+exact term, which BM25 finds and the embedding blurs; the other half
+describe the concepts in synonyms that never occur in the corpus, which
+only the embedding (the offline fake backend, taught the synonyms) can
+match. Scores are reported overall and per query kind.
+
+The synthetic set only shows how fusion trades the two kinds off. The
+supported way to judge a real deployment is --store (a store built by
+reference.ingest) with a --queries JSONL file of
+{"question": ..., "source": "<relevant source>"}.
+
+Usage:
+    python benchmarks/bench_retrieval.py
+    python benchmarks/bench_retrieval.py --docs 5000 --queries-count 300 --exact-share 0.3
+    python benchmarks/bench_retrieval.py --store vectorstore --queries eval.jsonl
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from reference.bm25index import BM25Index
+from reference.fakebackends import FakeEmbeddings
+from reference.hybridretriever import HybridRetriever
+from reference.ingest import make_embeddings
+
+FILLER = ("patients therapy guideline recommendation evidence disease treatment risk screening dose "
+          "management clinical outcome trial adults symptoms diagnosis follow-up monitoring").split()
+
+
+def pseudo_term(rng):
+    syllables = ["ve", "do", "li", "zu", "mab", "ti", "ra", "ne", "xo", "ci", "pa", "gli", "flo", "zin"]
+    return "".join(rng.choice(syllables) for _ in range(4)) + rng.choice(["mab", "nib", "tide", "-1", "2"])
+
+
+def concept_word(rng, prefix):
+    return prefix + "".join(rng.choice("bcdfgklmnprstvz") + rng.choice("aeiou") for _ in range(3))
+
+
+class SynonymEmbeddings(FakeEmbeddings):
+    """Fake embeddings that read a concept's query wording as its corpus wording, like a semantic model would."""
+
+    def __init__(self, synonyms, **kwargs):
+        super().__init__(**kwargs)
+        self.synonyms = synonyms
+
+    def _vector(self, text):
+        return super()._vector(" ".join(self.synonyms.get(word, word) for word in str(text).lower().split()))
+
+
+def synthetic_corpus(docs, queries, exact_share=0.5, concepts=400, seed=7):
+    """(chunks, evaluation, synonyms); evaluation items carry a "kind" of "exact" or "semantic"."""
+    rng = random.Random(seed)
+    terms = [pseudo_term(rng) for _ in range(docs)]
+    corpus_words = [concept_word(rng, "co") for _ in range(concepts)]
+    query_words = [concept_word(rng, "qu") for _ in range(concepts)]
+    chunks, topics = [], []
+    for i, term in enumerate(terms):
+        topic = rng.sample(range(concepts), 3)
+        words = rng.sample(FILLER, 10) + [corpus_words[c] for c in topic]
+        rng.shuffle(words)
+        words.insert(rng.randrange(len(words)), term)
+        chunks.append(Document(id=f"chunk-{i}", page_content=" ".join(words), metadata={"source": f"guideline-{i}.pdf"}))
+        topics.append(topic)
+    evaluation = []
+    for n, i in enumerate(rng.sample(range(docs), queries)):
+        if n < queries * exact_share:
+            question = f"What is the recommended {rng.choice(FILLER)} for {terms[i]} in {rng.choice(FILLER)}?"
+            kind = "exact"
+        else:
+            question = f"What is the recommended {rng.choice(FILLER)} for {' '.join(query_words[c] for c in topics[i])}?"
+            kind = "semantic"
+        evaluation.append({"question": question, "source": f"guideline-{i}.pdf", "kind": kind})
+    return chunks, evaluation, dict(zip(query_words, corpus_words))
+
+
+def evaluate(label, search, evaluation, ks):
+    found = []
+    latencies = []
+    for item in evaluation:
+        start = time.perf_counter()
+        results = search(item["question"], max(ks))
+        latencies.append((time.perf_counter() - start) * 1000)
+        sources = [doc.metadata.get("source") for doc in results]
+        found.append((item.get("kind"), [item["source"] in sources[:k] for k in ks]))
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<10} {recall_line(found, ks)}  p50={statistics.median(latencies):6.1f}ms  p95={p95:6.1f}ms")
+    for kind in sorted({kind for kind, _ in found if kind}):
+        print(f"  {kind:<8} {recall_line([f for f in found if f[0] == kind], ks)}")
+
+
+def recall_line(found, ks):
+    return "  ".join(f"R@{k}={sum(hits[n] for _, hits in found) / len(found):.2f}" for n, k in enumerate(ks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hybrid BM25 + vector retrieval")
+    parser.add_argument("--docs", type=int, default=2000, help="Synthetic corpus size")
+    parser.add_argument("--queries-count", type=int, default=200, help="Synthetic queries")
+    parser.add_argument("--exact-share", type=float, default=0.5,
+                        help="Share of synthetic queries that name an exact term (the rest paraphrase concepts)")
+    parser.add_argument("--dim", type=int, default=256, help="Fake embedding dimension for the synthetic corpus")
+    parser.add_argument("--store", default=None, help="Existing Chroma store with a bm25.sqlite3 index")
+    parser.add_argument("--queries", default=None, help="JSONL evaluation set for --store")
+    parser.add_argument("--candidates", type=int, default=20)
+    args = parser.parse_args()
+    ks = (1, 3, 5, 10)
+
+    if args.store:
+        vectorstore = Chroma(collection_name="medcopilot", persist_directory=args.store,
+                             embedding_function=make_embeddings(args.store))
+        index = BM25Index(str(Path(args.store) / "bm25.sqlite3"))
+        with open(args.queries, encoding="utf-8") as handle:
+            evaluation = [json.loads(line) for line in handle if line.strip()]
+    else:
+        chunks, evaluation, synonyms = synthetic_corpus(args.docs, args.queries_count, args.exact_share)
+        store = tempfile.mkdtemp(prefix="bench-retrieval-")
+        vectorstore = Chroma(collection_name="medcopilot", persist_directory=store,
+                             embedding_function=SynonymEmbeddings(synonyms, size=args.dim))
+        for start in range(0, len(chunks), 500):
+            vectorstore.add_documents(chunks[start:start + 500], ids=[c.id for c in chunks[start:start + 500]])
+        index = BM25Index(str(Path(store) / "bm25.sqlite3"))
+        index.add(chunks)
+        print(f"Synthetic corpus: {len(chunks)} chunks, {len(evaluation)} queries "
+              f"({args.exact_share:.0%} exact-term), {args.dim}-d fake embeddings")
+
+    def vector_search(query, k):
+        return vectorstore.similarity_search(query, k=k)
+
+    def bm25_search(query, k):
+        return index.get_documents([doc_id for doc_id, _ in index.search(query, k=k)])
+
+    def hybrid_search(query, k):
+        retriever = HybridRetriever(vectorstore=vectorstore, index=index, k=k, candidates=args.candidates)
+        return retriever.invoke(query)
+
+    evaluate("vector", vector_search, evaluation, ks)
+    evaluate("bm25", bm25_search, evaluation, ks)
+    evaluate("hybrid", hybrid_search, evaluation, ks)
+
+
+if __name__ == "__main__":
+    main()
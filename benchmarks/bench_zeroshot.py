@@ -0,0 +1,91 @@
+"""
+Queries/sec of the zero-shot category classifier on CPU, one query per
+forward pass versus micro-batched concurrent queries.
+
+Needs transformers and torch (plus optimum[onnxruntime] for --backend onnx).
+
+Usage:
+    python benchmarks/bench_zeroshot.py
+    python benchmarks/bench_zeroshot.py --backend int8 --queries 128 --concurrency 32
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from reference.zeroshotclassifier import ZeroShotClassifier
+
+CATEGORIES = [
+    "Diagnosis and Differential Diagnosis",
+    "Treatment Recommendations",
+    "Drug Information",
+    "Patient Education and Counseling",
+    "Medical News and Research",
+    "Prevention and Screening",
+]
+
+QUESTIONS = [
+    "What is the best modality to screen for Barrett's esophagus?",
+    "How should moderate ulcerative colitis be treated?",
+    "What are the side effects of long-term PPI use?",
+    "How do I explain a colonoscopy prep to a patient?",
+    "What is new in the treatment of eosinophilic esophagitis?",
+    "When should colorectal cancer screening start?",
+    "How is acute pancreatitis diagnosed?",
+    "Does clopidogrel interact with omeprazole?",
+]
+
+
+def run_single(classifier, queries):
+    start = time.perf_counter()
+    for query in queries:
+        classifier.classify_batch([query])
+    return len(queries) / (time.perf_counter() - start)
+
+
+def run_batched(classifier, queries, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(classifier.classify, queries))
+    return len(queries) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark single vs micro-batched zero-shot classification")
+    parser.add_argument("--backend", choices=["torch", "int8", "onnx"], default="torch")
+    parser.add_argument("--onnx-dir", default=None, help="Where the exported ONNX graph is stored")
+    parser.add_argument("--queries", type=int, default=64, help="Queries per mode (default: 64)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent callers in batched mode (default: 16)")
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    classifier = ZeroShotClassifier(
+        CATEGORIES,
+        backend=args.backend,
+        onnx_dir=args.onnx_dir,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+    )
+    start = time.perf_counter()
+    classifier.warm_up()
+    print(f"model load: {time.perf_counter() - start:.1f}s (paid once per process)")
+
+    queries = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.queries)]
+    classifier.classify_batch(queries[:2])  # first forward pass allocates buffers
+
+    single = run_single(classifier, queries)
+    print(f"single   {single:8.2f} queries/s")
+
+    classifier.batches = classifier.queries = 0
+    batched = run_batched(classifier, queries, args.concurrency)
+    print(f"batched  {batched:8.2f} queries/s  (mean batch {classifier.stats()['mean_batch_size']})")
+    print(f"speedup  {batched / single:8.2f}x  backend={args.backend}")
+
+
+if __name__ == "__main__":
+    main()
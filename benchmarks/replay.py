@@ -0,0 +1,345 @@
+"""
+Replay a JSONL corpus of chat requests against the app and report
+throughput plus p50/p95/p99 latency per pipeline stage.
+
+Each corpus line is a JSON object; the question is taken from its
+"message", "question", "prompt" or "title" field (in that order), so the
+repo's requests.jsonl works as-is.
+
+Targets:
+    inprocess   the Flask app through its test client, with OpenAI chat and
+                embeddings served by the local stub (benchmarks/stub_openai.py),
+                or by reference/fakebackends.py with --backend fake
+    http://...  a running server (start it against the stub yourself)
+
+Load shapes:
+    --concurrency N   closed loop: N clients send back to back
+    --qps R           open loop: requests start on a fixed schedule; latency
+                      is measured from the scheduled start so queueing counts
+
+Per-stage timings come from the Server-Timing header of every response;
+"client" is the end-to-end latency seen by the caller. Results are written
+as JSON (--output) and can be compared with an earlier run (--baseline).
+
+Usage:
+    python benchmarks/replay.py --requests 200 --concurrency 16
+    python benchmarks/replay.py --qps 20 --duration 30 --chat-latency lognormal:-0.7,0.4
+    python benchmarks/replay.py --target http://127.0.0.1:8000 --concurrency 32 --baseline old.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.stub_openai import StubOpenAIServer
+
+MESSAGE_FIELDS = ("message", "question", "prompt", "title")
+
+
+# --- Corpus ---
+def load_corpus(path):
+    """Read questions from a JSONL file, skipping blank or unusable lines."""
+    messages = []
+    with open(path, encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            for field in MESSAGE_FIELDS:
+                if isinstance(record.get(field), str) and record[field].strip():
+                    messages.append(record[field].strip())
+                    break
+    if not messages:
+        raise SystemExit(f"No usable messages in {path}")
+    return messages
+
+
+def parse_server_timing(header):
+    """'classify;dur=12.3, retrieve;dur=40.0' -> {'classify': 12.3, 'retrieve': 40.0} (ms)."""
+    timings = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+# --- Targets ---
+class InProcessTarget:
+    """Posts to the Flask app through its test client (one client per thread)."""
+
+    def __init__(self):
+        import app as app_module
+
+        self.app_module = app_module
+        self._local = threading.local()
+
+    def warm(self):
+        self.app_module.engine_manager.warm()
+
+    def post(self, message):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app_module.app.test_client()
+        response = client.post("/chat", json={"message": message})
+        return response.status_code, response.headers.get("Server-Timing")
+
+
+class HTTPTarget:
+    """Posts to a running server over HTTP."""
+
+    def __init__(self, base_url, timeout):
+        import httpx
+
+        self.url = base_url.rstrip("/") + "/chat"
+        self.client = httpx.Client(timeout=timeout, limits=httpx.Limits(max_connections=512))
+
+    def warm(self):
+        pass
+
+    def post(self, message):
+        response = self.client.post(self.url, json={"message": message})
+        return response.status_code, response.headers.get("Server-Timing")
+
+
+# --- Load generation ---
+class Recorder:
+    def __init__(self):
+        self.stages = {"client": []}
+        self.status_codes = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency, status, timing_header, error=None):
+        with self._lock:
+            self.stages["client"].append(latency * 1000)
+            key = str(status) if error is None else type(error).__name__
+            self.status_codes[key] = self.status_codes.get(key, 0) + 1
+            if error is not None or status >= 400:
+                self.errors += 1
+            for stage, ms in parse_server_timing(timing_header).items():
+                self.stages.setdefault(stage, []).append(ms)
+
+
+def send(target, recorder, message, started):
+    try:
+        status, timing_header = target.post(message)
+        recorder.record(time.perf_counter() - started, status, timing_header)
+    except Exception as e:
+        recorder.record(time.perf_counter() - started, 0, None, error=e)
+
+
+def run_closed_loop(target, recorder, messages, args):
+    counter = iter(range(10 ** 12))
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + args.duration if args.duration else None
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter)
+            if (args.requests and i >= args.requests) or (stop_at and time.perf_counter() >= stop_at):
+                return
+            send(target, recorder, messages[i % len(messages)], time.perf_counter())
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_open_loop(target, recorder, messages, args):
+    total = args.requests or int(args.qps * args.duration)
+    interval = 1.0 / args.qps
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.max_in_flight) as pool:
+        for i in range(total):
+            scheduled = start + i * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, target, recorder, messages[i % len(messages)], scheduled)
+
+
+# --- Reporting ---
+def summarize(recorder, elapsed, args, stub):
+    stages = {}
+    for stage, values in recorder.stages.items():
+        values = sorted(values)
+        if not values:
+            continue
+        stages[stage] = {
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values), 2),
+            "p50_ms": round(percentile(values, 50), 2),
+            "p95_ms": round(percentile(values, 95), 2),
+            "p99_ms": round(percentile(values, 99), 2)
+        }
+    completed = len(recorder.stages["client"])
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "target": args.target,
+            "backend": args.backend,
+            "corpus": str(args.corpus),
+            "mode": "open" if args.qps else "closed",
+            "qps": args.qps,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration": args.duration,
+            "chat_latency": args.chat_latency,
+            "first_token_latency": args.first_token_latency,
+            "embed_latency": args.embed_latency
+        },
+        "requests": completed,
+        "errors": recorder.errors,
+        "status_codes": recorder.status_codes,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+        "stages": stages
+    }
+    if stub is not None:
+        results["upstream"] = {"chat_requests": stub.chat_requests, "embedding_requests": stub.embedding_requests}
+    return results
+
+
+def print_report(results, baseline=None):
+    print(f"\n{results['requests']} requests in {results['elapsed_s']}s "
+          f"-> {results['throughput_rps']} req/s, {results['errors']} errors")
+    if "upstream" in results:
+        print(f"upstream calls: {results['upstream']}")
+    print(f"\n{'stage':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, row in results["stages"].items():
+        line = f"{stage:<14}{row['count']:>7}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous and previous.get("p95_ms"):
+            change = (row["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+            line += f"   p95 {change:+.1f}% vs {str(baseline.get('commit'))[:8]}"
+        print(line)
+    if baseline and baseline.get("throughput_rps"):
+        change = (results["throughput_rps"] - baseline["throughput_rps"]) / baseline["throughput_rps"] * 100
+        print(f"\nthroughput {change:+.1f}% vs baseline")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a JSONL corpus against the chat API")
+    parser.add_argument("--corpus", default=ROOT / "requests.jsonl", type=Path)
+    parser.add_argument("--target", default="inprocess", help="'inprocess' or a base URL such as http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=0, help="Total requests (default: one pass over the corpus)")
+    parser.add_argument("--duration", type=float, default=0, help="Seconds to run instead of a request count")
+    parser.add_argument("--concurrency", type=int, default=8, help="Closed-loop clients")
+    parser.add_argument("--qps", type=float, default=0, help="Open-loop arrival rate (overrides --concurrency)")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="Open-loop cap on outstanding requests")
+    parser.add_argument("--timeout", type=float, default=120, help="HTTP timeout in seconds")
+    parser.add_argument("--backend", choices=("stub", "fake"), default="stub",
+                        help="In-process stand-ins: the HTTP stub server or the in-process fake backends")
+    parser.add_argument("--chat-latency", default="lognormal:-0.7,0.4", help="Stub chat completion latency")
+    parser.add_argument("--first-token-latency", default="uniform:0.2,0.5", help="Stub streamed first-token latency")
+    parser.add_argument("--embed-latency", default="uniform:0.05,0.15", help="Stub embeddings latency")
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--store", default=None, help="Vector store directory for in-process runs (default: empty temp dir)")
+    parser.add_argument("--output", default="replay_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--verbose", dest="quiet", action="store_false", help="Keep the app's per-request logging")
+    args = parser.parse_args()
+
+    messages = load_corpus(args.corpus)
+    if not args.requests and not args.duration:
+        args.requests = len(messages)
+    if args.qps and not args.requests and not args.duration:
+        raise SystemExit("--qps needs --requests or --duration")
+
+    stub = None
+    if args.target == "inprocess" and args.backend == "fake":
+        # reference/fakebackends.py in-process: no HTTP hop, FAKE_* env vars set latency
+        os.environ["MEDCOPILOT_LLM_BACKEND"] = "fake"
+        os.environ["VECSTORE_PATH"] = args.store or tempfile.mkdtemp(prefix="replay-store-")
+        target = InProcessTarget()
+    elif args.target == "inprocess":
+        stub = StubOpenAIServer(
+            embed_latency=args.embed_latency,
+            chat_latency=args.chat_latency,
+            first_token_latency=args.first_token_latency,
+            dim=args.embedding_dim,
+        ).start()
+        # Must be set before the app module and its engine are created
+        os.environ["OPENAI_BASE_URL"] = stub.base_url
+        os.environ["OPENAI_API_BASE"] = stub.base_url
+        os.environ["OPENAI_API_KEY"] = "stub"
+        os.environ["EMBEDDING_CHECK_CTX_LENGTH"] = "0"
+        os.environ["VECSTORE_PATH"] = args.store or tempfile.mkdtemp(prefix="replay-store-")
+        target = InProcessTarget()
+    else:
+        target = HTTPTarget(args.target, args.timeout)
+
+    try:
+        print(f"Warming up {args.target} ...")
+        target.warm()
+        if stub is not None:
+            stub.reset_counters()
+
+        recorder = Recorder()
+        mode = f"{args.qps} qps open loop" if args.qps else f"{args.concurrency} clients closed loop"
+        print(f"Replaying {len(messages)} corpus messages ({mode}) ...")
+        # The app logs every request to stdout; keep the report readable
+        log = open(os.devnull, "w") if args.quiet else sys.stdout
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            if args.qps:
+                run_open_loop(target, recorder, messages, args)
+            else:
+                run_closed_loop(target, recorder, messages, args)
+        elapsed = time.perf_counter() - start
+
+        results = summarize(recorder, elapsed, args, stub)
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+    print_report(results, baseline)
+
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+Local stand-in for the OpenAI HTTP API used by the benchmarks.
+
+Serves POST /v1/embeddings with deterministic hash-based vectors and
+POST /v1/chat/completions (plain or streamed) with canned answers, each
+after a delay drawn from a configurable latency distribution, and counts
+upstream requests so benchmarks can show how many calls a client made.
+
+Optional rate limits (requests and tokens per rate_window seconds) reject
+excess embeddings requests with 429 and OpenAI-style x-ratelimit-* and
+retry-after headers, which successful responses carry too.
+
+Latency distributions are written as "fixed:0.2", "uniform:0.1,0.4",
+"normal:0.3,0.05" or "lognormal:-1.2,0.4" (seconds; lognormal takes the
+mu/sigma of the underlying normal).
+
+Usage (standalone):
+    python benchmarks/stub_openai.py --port 8765 --embed-latency uniform:0.05,0.2 --chat-latency lognormal:0,0.5
+Then point clients at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LatencyDistribution:
+    """Samples simulated upstream latencies in seconds."""
+
+    def __init__(self, kind="fixed", params=(0.0,)):
+        self.kind = kind
+        self.params = tuple(params)
+        self._random = random.Random(42)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec):
+        if isinstance(spec, LatencyDistribution):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("fixed", (float(spec),))
+        kind, _, raw = str(spec).partition(":")
+        if not raw:
+            return cls("fixed", (float(kind),))
+        params = tuple(float(p) for p in raw.split(","))
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        return cls(kind, params)
+
+    def sample(self):
+        with self._lock:
+            if self.kind == "uniform":
+                value = self._random.uniform(*self.params)
+            elif self.kind == "normal":
+                value = self._random.gauss(*self.params)
+            elif self.kind == "lognormal":
+                value = self._random.lognormvariate(*self.params)
+            else:
+                value = self.params[0]
+        return max(0.0, value)
+
+    def __str__(self):
+        return f"{self.kind}:{','.join(str(p) for p in self.params)}"
+
+
+def stub_vector(text, dim):
+    """Deterministic unit-ish vector for text."""
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend((b - 127.5) / 127.5 for b in digest)
+        counter += 1
+    return values[:dim]
+
+
+class StubOpenAIServer:
+    """Threaded HTTP server imitating the OpenAI endpoints the app uses."""
+
+    def __init__(self, host="127.0.0.1", port=0, embed_latency=0.1, dim=256,
+                 chat_latency=0.5, first_token_latency=0.2, answer_words=200,
+                 request_limit=None, token_limit=None, rate_window=60.0):
+        self.embed_latency = LatencyDistribution.parse(embed_latency)
+        self.chat_latency = LatencyDistribution.parse(chat_latency)
+        self.first_token_latency = LatencyDistribution.parse(first_token_latency)
+        self.dim = dim
+        self.answer_words = answer_words
+        self.embedding_requests = 0
+        self.embedded_texts = 0
+        self.chat_requests = 0
+        self.rate_limited = 0
+        self.request_limit = request_limit
+        self.token_limit = token_limit
+        self.rate_window = rate_window
+        self._window = deque()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.embedding_requests = 0
+            self.embedded_texts = 0
+            self.chat_requests = 0
+            self.rate_limited = 0
+            self._window.clear()
+
+    # --- Endpoint implementations ---
+    def embeddings(self, body):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        tokens = sum(len(str(text).split()) for text in inputs)
+        allowed, limit_headers = self._admit(tokens)
+        if not allowed:
+            return 429, limit_headers, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+        with self._lock:
+            self.embedding_requests += 1
+            self.embedded_texts += len(inputs)
+
+        time.sleep(self.embed_latency.sample())
+        data = [
+            {"object": "embedding", "index": i, "embedding": stub_vector(str(text), self.dim)}
+            for i, text in enumerate(inputs)
+        ]
+        return 200, limit_headers, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        }
+
+    def _admit(self, tokens):
+        """Sliding-window rate limiter; returns (allowed, x-ratelimit headers)."""
+        if self.request_limit is None and self.token_limit is None:
+            return True, {}
+        with self._lock:
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] >= self.rate_window:
+                self._window.popleft()
+            used_requests = len(self._window)
+            used_tokens = sum(t for _, t in self._window)
+            allowed = (
+                (self.request_limit is None or used_requests + 1 <= self.request_limit)
+                and (self.token_limit is None or used_tokens + tokens <= self.token_limit)
+            )
+            if allowed:
+                self._window.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+            else:
+                self.rate_limited += 1
+            reset = self.rate_window - (now - self._window[0][0]) if self._window else 0.0
+
+        headers = {"x-ratelimit-reset-requests": f"{reset:.3f}s", "x-ratelimit-reset-tokens": f"{reset:.3f}s"}
+        if self.request_limit is not None:
+            headers["x-ratelimit-limit-requests"] = str(self.request_limit)
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.request_limit - used_requests))
+        if self.token_limit is not None:
+            headers["x-ratelimit-limit-tokens"] = str(self.token_limit)
+            headers["x-ratelimit-remaining-tokens"] = str(max(0, self.token_limit - used_tokens))
+        if not allowed:
+            headers["retry-after-ms"] = str(int(reset * 1000))
+            headers["retry-after"] = f"{reset:.3f}"
+        return allowed, headers
+
+    def chat_completion_text(self, body):
+        """Canned completion: a category label for classification prompts, else a long answer."""
+        prompt = " ".join(str(m.get("content", "")) for m in body.get("messages", []))
+        if "classifying medical text" in prompt:
+            return "Other"
+        words = ["Guideline-based", "recommendation", "with", "supporting", "rationale."]
+        return " ".join(words[i % len(words)] for i in range(self.answer_words))
+
+    def chat_completions(self, body):
+        with self._lock:
+            self.chat_requests += 1
+        text = self.chat_completion_text(body)
+        model = body.get("model", "stub-chat")
+        created = int(time.time())
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in body.get("messages", [])),
+            "completion_tokens": len(text.split())
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        if not body.get("stream"):
+            time.sleep(self.chat_latency.sample())
+            return 200, {}, {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage
+            }
+
+        def events():
+            # First token after first_token_latency, the rest spread over chat_latency
+            time.sleep(self.first_token_latency.sample())
+            pieces = [word + " " for word in text.split()]
+            per_piece = self.chat_latency.sample() / max(1, len(pieces))
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(per_piece)
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return 200, {}, events()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.endswith("/embeddings"):
+                    status, headers, payload = server.embeddings(body)
+                elif self.path.endswith("/chat/completions"):
+                    status, headers, payload = server.chat_completions(body)
+                else:
+                    status, headers, payload = 404, {}, {"error": {"message": f"Unknown path {self.path}"}}
+
+                if isinstance(payload, dict):
+                    self._send(status, headers, payload)
+                else:
+                    self._stream(status, headers, payload)
+
+            def _stream(self, status, headers, events):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/event-stream")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                for event in events:
+                    self.wfile.write(event.encode("utf-8"))
+                    self.wfile.flush()
+                self.close_connection = True
+
+            def _send(self, status, headers, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stub of the OpenAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embed-latency", default="0.1", help="Latency distribution per embeddings request")
+    parser.add_argument("--chat-latency", default="0.5", help="Latency distribution per chat completion")
+    parser.add_argument("--first-token-latency", default="0.2", help="Latency distribution to the first streamed token")
+    parser.add_argument("--answer-words", type=int, default=200, help="Words per canned answer")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimensions")
+    parser.add_argument("--request-limit", type=int, default=None, help="Embeddings requests allowed per window")
+    parser.add_argument("--token-limit", type=int, default=None, help="Embedding tokens allowed per window")
+    parser.add_argument("--rate-window", type=float, default=60.0, help="Rate-limit window in seconds")
+    args = parser.parse_args()
+
+    server = StubOpenAIServer(
+        args.host,
+        args.port,
+        embed_latency=args.embed_latency,
+        chat_latency=args.chat_latency,
+        first_token_latency=args.first_token_latency,
+        answer_words=args.answer_words,
+        dim=args.dim,
+        request_limit=args.request_limit,
+        token_limit=args.token_limit,
+        rate_window=args.rate_window,
+    ).start()
+    print(f"Stub OpenAI API listening on {server.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Gunicorn picks this file up automatically from the working directory.
+# Each worker builds and warms its own Inference engine once, so HTTP clients
+# are never shared across forked processes and the first /chat request does
+# not pay for Chroma/OpenAI setup.
+import os
+import shutil
+import tempfile
+
+# Workers write Prometheus samples here so /metrics aggregates all of them.
+# Must be set before any worker imports prometheus_client.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "medcopilot-metrics"))
+
+
+def on_starting(server):
+    # Samples left by a previous master would be counted again
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def post_fork(server, worker):
+    # With --preload the master may already hold an engine; never reuse it
+    from app import engine_manager
+
+    engine_manager.reset()
+
+
+def post_worker_init(worker):
+    from app import engine_manager
+
+    engine_manager.warm()
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's in-flight gauge; its counters and histograms stay in the totals
+    from reference import metrics
+
+    metrics.mark_process_dead(worker.pid)
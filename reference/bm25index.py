@@ -0,0 +1,153 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from langchain_core.documents import Document
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[-/.]\w+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what when "
+    "which who why will with should does do can".split()
+)
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords; hyphenated, slashed and dotted terms (5-ASA, IL-6) stay whole."""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+# --- Persistent BM25 inverted index ---
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of the Chroma collection, stored in SQLite.
+
+    postings holds (term, chunk id, term frequency); corpus size and total
+    length live in a meta table, so add() and delete() update the index
+    incrementally in one transaction and searches from any process see a
+    consistent snapshot (WAL mode). Chunk ids are the same content hashes
+    the vector store uses.
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._db = self._open_db(path)
+
+    # --- Updates ---
+    def add(self, documents):
+        """Index documents (each with an id); ids already present are skipped."""
+        with self._lock, self._db:
+            added, total_length = 0, 0
+            for doc in documents:
+                if self._db.execute("SELECT 1 FROM docs WHERE id = ?", (doc.id,)).fetchone():
+                    continue
+                terms = Counter(tokenize(doc.page_content))
+                length = sum(terms.values())
+                self._db.execute(
+                    "INSERT INTO docs (id, length, content, metadata) VALUES (?, ?, ?, ?)",
+                    (doc.id, length, doc.page_content, json.dumps(doc.metadata or {}))
+                )
+                self._db.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    [(term, doc.id, tf) for term, tf in terms.items()]
+                )
+                added += 1
+                total_length += length
+            self._bump(added, total_length)
+        return added
+
+    def delete(self, ids):
+        with self._lock, self._db:
+            removed, total_length = 0, 0
+            for doc_id in ids:
+                row = self._db.execute("SELECT length FROM docs WHERE id = ?", (doc_id,)).fetchone()
+                if not row:
+                    continue
+                self._db.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                self._db.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+                removed += 1
+                total_length += row[0]
+            self._bump(-removed, -total_length)
+        return removed
+
+    def update_metadata(self, metadatas):
+        """Replace the metadata of indexed chunks ({id: metadata})."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE docs SET metadata = ? WHERE id = ?",
+                [(json.dumps(metadata), doc_id) for doc_id, metadata in metadatas.items()]
+            )
+
+    def __len__(self):
+        return self._meta()[0]
+
+    # --- Search ---
+    def search(self, query, k=10):
+        """Return the top k (chunk id, score) pairs for the query."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs, total_length = self._meta()
+            if not n_docs:
+                return []
+            placeholders = ",".join("?" * len(terms))
+            df = dict(self._db.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall())
+            if not df:
+                return []
+            rows = self._db.execute(
+                f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.id = p.doc_id "
+                f"WHERE p.term IN ({','.join('?' * len(df))})", list(df)
+            ).fetchall()
+
+        avgdl = total_length / n_docs
+        idf = {term: math.log((n_docs - count + 0.5) / (count + 0.5) + 1.0) for term, count in df.items()}
+        scores = {}
+        for term, doc_id, tf, length in rows:
+            norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avgdl))
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf[term] * norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def get_documents(self, ids):
+        """Documents for ids, in the given order."""
+        if not ids:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, content, metadata FROM docs WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+            ).fetchall()
+        found = {row[0]: Document(id=row[0], page_content=row[1], metadata=json.loads(row[2])) for row in rows}
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    # --- Storage ---
+    def _meta(self):
+        row = self._db.execute("SELECT n_docs, total_length FROM meta WHERE id = 0").fetchone()
+        return row if row else (0, 0)
+
+    def _bump(self, docs, length):
+        if docs or length:
+            self._db.execute(
+                "UPDATE meta SET n_docs = n_docs + ?, total_length = total_length + ? WHERE id = 0", (docs, length)
+            )
+
+    @staticmethod
+    def _open_db(path):
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, length INTEGER NOT NULL, "
+                   "content TEXT NOT NULL, metadata TEXT NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+                   "PRIMARY KEY (term, doc_id)) WITHOUT ROWID")
+        db.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY, n_docs INTEGER NOT NULL, "
+                   "total_length INTEGER NOT NULL)")
+        db.execute("INSERT OR IGNORE INTO meta (id, n_docs, total_length) VALUES (0, 0, 0)")
+        db.commit()
+        return db
@@ -0,0 +1,103 @@
+import os
+import threading
+
+import numpy as np
+
+
+# --- Local prompt category router ---
+class CategoryRouter:
+    """
+    Picks a PromptCategories label from the query embedding instead of an
+    LLM call.
+
+    Every category is embedded once (its name plus a few exemplar questions)
+    into a normalised NumPy matrix. Routing a query is one matrix-vector
+    product: the category of the best matching row wins. A result is only
+    trusted when the best score clears min_score and beats the runner-up
+    category by min_margin; otherwise the caller falls back to the LLM.
+    A query that matches nothing (best score below other_below) is off
+    topic and goes straight to "Other" without an LLM call.
+    """
+
+    def __init__(self, embeddings, exemplars, min_score=0.5, min_margin=0.02, other_below=0.25):
+        self.embeddings = embeddings
+        self.exemplars = exemplars
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.other_below = other_below
+        self.categories = list(exemplars.keys())
+        self.routed = 0
+        self.fallbacks = 0
+        self._matrix = None
+        self._labels = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, embeddings, prompt_categories):
+        """Build the router from CATEGORY_ROUTER_* environment variables; None when disabled."""
+        if os.getenv("CATEGORY_ROUTER", "1").lower() in ("0", "false", "off"):
+            return None
+        return cls(
+            embeddings,
+            prompt_categories.get_category_exemplars(),
+            min_score=float(os.getenv("CATEGORY_ROUTER_MIN_SCORE", "0.5")),
+            min_margin=float(os.getenv("CATEGORY_ROUTER_MIN_MARGIN", "0.02")),
+            other_below=float(os.getenv("CATEGORY_ROUTER_OTHER_BELOW", "0.25")),
+        )
+
+    def fit(self):
+        """Embed every category name and exemplar in a single embed_documents call."""
+        texts, labels = [], []
+        for index, category in enumerate(self.categories):
+            for text in [category] + list(self.exemplars[category]):
+                texts.append(text)
+                labels.append(index)
+
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        with self._lock:
+            self._matrix = vectors / norms
+            self._labels = np.asarray(labels)
+        print(f"🧭 Category router ready: {len(self.categories)} categories, {len(texts)} exemplars.")
+        return self
+
+    @property
+    def ready(self):
+        return self._matrix is not None
+
+    def route(self, vector):
+        """Return (category, score, confident) for a query embedding."""
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self._matrix @ query
+        # Best exemplar score per category
+        per_category = np.full(len(self.categories), -1.0, dtype=np.float32)
+        np.maximum.at(per_category, self._labels, scores)
+
+        order = np.argsort(per_category)[::-1]
+        best = float(per_category[order[0]])
+        runner_up = float(per_category[order[1]]) if len(order) > 1 else -1.0
+        confident = best >= self.min_score and best - runner_up >= self.min_margin
+        category = self.categories[order[0]]
+        if best < self.other_below and "Other" in self.categories:
+            category, confident = "Other", True
+
+        if confident:
+            self.routed += 1
+        else:
+            self.fallbacks += 1
+        return category, best, confident
+
+    def stats(self):
+        return {
+            "categories": len(self.categories),
+            "routed": self.routed,
+            "llm_fallbacks": self.fallbacks,
+            "min_score": self.min_score,
+            "min_margin": self.min_margin,
+            "other_below": self.other_below
+        }
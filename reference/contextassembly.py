@@ -0,0 +1,156 @@
+import os
+import re
+
+from reference.embeddingscheduler import make_token_counter
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text, size=5):
+    """Hashed word n-grams of text (the whole text as one shingle when it is shorter than size)."""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return {hash(tuple(words))} if words else set()
+    return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+def overlap(a, b):
+    """Share of the smaller shingle set found in the other, so a chunk contained in a longer one counts as a duplicate."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def join_overlapping(first, second, min_overlap=32):
+    """first + second without the text they share when second starts with a tail of first; None if they do not touch."""
+    probe = second[:min_overlap]
+    if len(probe) < min_overlap:
+        return None
+    position = first.find(probe)
+    while position != -1:
+        if second.startswith(first[position:]):
+            return first + second[len(first) - position:]
+        position = first.find(probe, position + 1)
+    return None
+
+
+# --- Token-budgeted context assembly ---
+class ContextAssembler:
+    """
+    Turns retrieved chunks into the {context} string sent to the LLM.
+
+    Chunks are taken in retrieval (relevance) order. Near-duplicates, whose
+    word shingles mostly overlap a chunk already taken, are dropped; chunks
+    from the same source and page that overlap at their edges (the splitter's
+    chunk_overlap) are merged into one passage; passages then fill
+    token_budget in order of their best-ranked chunk. Stats are returned
+    alongside the text so callers can report tokens saved, and select()
+    also returns the chunks that reached the text, so citations match what
+    the model saw.
+    """
+
+    def __init__(self, token_budget=3000, dedup_threshold=0.8, shingle_size=5, model="gpt-4o", token_counter=None):
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.shingle_size = shingle_size
+        self.model = model
+        self._count_tokens = token_counter
+
+    @classmethod
+    def from_env(cls, model="gpt-4o"):
+        """Build the assembler from CONTEXT_* environment variables; None when CONTEXT_ASSEMBLY is off."""
+        if os.getenv("CONTEXT_ASSEMBLY", "1").lower() in ("0", "false", "off"):
+            return None
+        return cls(
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+            dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8")),
+            shingle_size=int(os.getenv("CONTEXT_SHINGLE_SIZE", "5")),
+            model=model,
+        )
+
+    def count_tokens(self, text):
+        # The tokenizer is loaded on first use, not when the engine is built
+        if self._count_tokens is None:
+            self._count_tokens = make_token_counter(self.model)
+        return self._count_tokens(text)
+
+    def assemble(self, docs):
+        """Return (context text, stats) for docs in relevance order."""
+        text, _, stats = self.select(docs)
+        return text, stats
+
+    def select(self, docs):
+        """Return (context text, the docs whose text it contains, stats) for docs in relevance order."""
+        texts = [getattr(doc, "page_content", str(doc)) for doc in docs]
+        tokens_in = self.count_tokens("\n\n".join(texts)) if texts else 0
+
+        kept, duplicates = self._deduplicate(docs, texts)
+        passages, merged = self._merge(kept)
+        selected, used, dropped, tokens_out = self._fill(passages)
+
+        stats = {
+            "chunks": len(texts),
+            "duplicates": duplicates,
+            "merged": merged,
+            "dropped": dropped,
+            "tokens_in": tokens_in,
+            "tokens_out": tokens_out,
+            "tokens_saved": max(0, tokens_in - tokens_out),
+            "budget": self.token_budget
+        }
+        return "\n\n".join(selected), [docs[index] for index in sorted(used)], stats
+
+    # --- Stages ---
+    def _deduplicate(self, docs, texts):
+        kept, seen, duplicates = [], [], 0
+        for index, (doc, text) in enumerate(zip(docs, texts)):
+            signature = shingles(text, self.shingle_size)
+            if any(overlap(signature, other) >= self.dedup_threshold for other in seen):
+                duplicates += 1
+                continue
+            seen.append(signature)
+            kept.append((self._location(doc), text, index))
+        return kept, duplicates
+
+    def _merge(self, kept):
+        """Merge chunks that continue one another on the same page; a passage keeps the rank of its first chunk."""
+        passages, merged = [], 0
+        for location, text, index in kept:
+            for passage in passages:
+                if location is None or passage[0] != location:
+                    continue
+                joined = join_overlapping(passage[1], text) or join_overlapping(text, passage[1])
+                if joined:
+                    passage[1] = joined
+                    passage[2].append(index)
+                    merged += 1
+                    break
+            else:
+                passages.append([location, text, [index]])
+        return [(text, indices) for _, text, indices in passages], merged
+
+    def _fill(self, passages):
+        selected, sources, dropped, used = [], [], 0, 0
+        separator = self.count_tokens("\n\n")
+        for text, indices in passages:
+            cost = self.count_tokens(text) + (separator if selected else 0)
+            if used + cost <= self.token_budget:
+                selected.append(text)
+                sources.extend(indices)
+                used += cost
+            elif not selected:
+                # The most relevant passage alone is over budget: keep its head
+                text = text[:max(1, len(text) * self.token_budget // max(1, cost))]
+                selected.append(text)
+                sources.extend(indices)
+                used = self.count_tokens(text)
+            else:
+                dropped += 1
+        return selected, sources, dropped, used
+
+    @staticmethod
+    def _location(doc):
+        metadata = getattr(doc, "metadata", None) or {}
+        if "source" not in metadata:
+            return None
+        return metadata["source"], metadata.get("page")
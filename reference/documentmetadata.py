@@ -0,0 +1,239 @@
+import datetime
+import os
+import re
+
+# Bump when extraction changes so ingestion re-annotates unchanged documents
+EXTRACTOR_VERSION = "meta-1"
+
+SOCIETIES = {
+    "AGA": "American Gastroenterological Association",
+    "ACG": "American College of Gastroenterology",
+    "ASGE": "American Society for Gastrointestinal Endoscopy",
+    "AASLD": "American Association for the Study of Liver Diseases",
+    "ACR": "American College of Rheumatology",
+    "ACP": "American College of Physicians",
+    "ACS": "American Cancer Society",
+    "ADA": "American Diabetes Association",
+    "AHA": "American Heart Association",
+    "ASCO": "American Society of Clinical Oncology",
+    "BSG": "British Society of Gastroenterology",
+    "EASL": "European Association for the Study of the Liver",
+    "ECCO": "European Crohn's and Colitis Organisation",
+    "ESGE": "European Society of Gastrointestinal Endoscopy",
+    "ESMO": "European Society for Medical Oncology",
+    "IDSA": "Infectious Diseases Society of America",
+    "NCCN": "National Comprehensive Cancer Network",
+    "NICE": "National Institute for Health and Care Excellence",
+    "USMSTF": "US Multi-Society Task Force",
+    "USPSTF": "US Preventive Services Task Force",
+    "WHO": "World Health Organization",
+}
+
+# First match wins, so the more specific phrases come first
+DOC_TYPES = [
+    ("clinical practice update", "practice update"),
+    ("practice update", "practice update"),
+    ("position statement", "position statement"),
+    ("position paper", "position statement"),
+    ("consensus", "consensus"),
+    ("guideline", "guideline"),
+    ("recommendation statement", "guideline"),
+    ("systematic review", "systematic review"),
+    ("meta-analysis", "systematic review"),
+    ("randomized", "trial"),
+    ("randomised", "trial"),
+    ("review", "review"),
+]
+
+RECOMMENDATION_TYPES = ["guideline", "consensus", "position statement", "practice update"]
+EVIDENCE_TYPES = ["trial", "systematic review", "review"]
+
+# Prompt categories whose answers should preferably come from a particular kind of document
+CATEGORY_DOC_TYPES = {
+    "Treatment Recommendation": RECOMMENDATION_TYPES,
+    "Diagnosis & Workup": RECOMMENDATION_TYPES,
+    "Screening & Surveillance": RECOMMENDATION_TYPES,
+    "Drug Therapy": RECOMMENDATION_TYPES,
+    "Procedural & Surgical Considerations": RECOMMENDATION_TYPES,
+    "Emerging Research & Novel Therapies": EVIDENCE_TYPES,
+}
+
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+                "nine": 9, "ten": 10}
+YEAR = r"(19[89]\d|20\d\d)"
+SPAN = r"(\d+|" + "|".join(NUMBER_WORDS) + r")\s+years?"
+
+# Words that make a time span or a society acronym about the literature rather
+# than the patient ("colonoscopy within 5 years", "ACS risk" are not filters)
+PUBLICATION_TERMS = (r"(?:guidelines?|guidance|recommendations?|consensus|statements?|position papers?|papers?|"
+                     r"publications?|literature|evidence|studies|trials?|reviews?|meta-analys[ie]s)")
+RECOMMENDATION_TERMS = PUBLICATION_TERMS[:-1] + r"|recommends?|recommended|advises?|endorses?|says?|states?)"
+
+
+def current_year():
+    return datetime.date.today().year
+
+
+def _valid_year(value):
+    return 1980 <= value <= current_year() + 1
+
+
+# --- Ingestion-side extraction ---
+def extract_metadata(text, source=""):
+    """
+    Publication year, issuing society and document type from a document's
+    first page and file name. Keys that cannot be determined are omitted
+    (Chroma metadata values cannot be None).
+    """
+    metadata = {}
+    head = text[:4000]
+    name = os.path.basename(source)
+
+    dated = [int(y) for y in re.findall(r"(?:published|accepted|received|copyright|©|\(c\))\D{0,30}" + YEAR, head, re.I)]
+    years = [y for y in dated if _valid_year(y)] or [int(y) for y in re.findall(YEAR, name) if _valid_year(int(y))]
+    if not years:
+        years = [int(y) for y in re.findall(r"\b" + YEAR + r"\b", head) if _valid_year(int(y))]
+    if years:
+        metadata["year"] = max(years)
+
+    society = find_societies(f"{name} {head}")
+    if society:
+        metadata["society"] = society[0]
+
+    lowered = f"{name} {head}".lower()
+    for phrase, doc_type in DOC_TYPES:
+        if phrase in lowered:
+            metadata["doc_type"] = doc_type
+            break
+    return metadata
+
+
+def find_societies(text, acronyms=True):
+    """Societies mentioned in text (by acronym unless acronyms is False, or by full name), in order of first appearance."""
+    found = []
+    for acronym, name in SOCIETIES.items():
+        match = acronyms and re.search(r"(?<![A-Za-z])" + acronym + r"(?![A-Za-z])", text)
+        match = match or re.search(re.escape(name), text, re.I)
+        if match:
+            found.append((match.start(), acronym))
+    return [acronym for _, acronym in sorted(found)]
+
+
+# --- Query-side filters ---
+def publication_span(text):
+    """
+    Years in a "guidelines from the last 2 years" style phrase, or None.
+    A span has to sit next to publication wording: "repeat EGD within
+    2 years" is a clinical interval, not a hint about the literature.
+    """
+    match = (
+        re.search(r"\b" + PUBLICATION_TERMS + r"\s+(?:(?:published|issued|released|updated)\s+)?"
+                  r"(?:from|in|within|over|during|of)\s+(?:the\s+)?(?:(?:last|past)\s+)?" + SPAN, text)
+        or re.search(r"\b(?:last|past)\s+" + SPAN + r"(?:'s?|\u2019s?)?\s+(?:of\s+)?" + PUBLICATION_TERMS + r"\b", text)
+    )
+    if not match:
+        return None
+    span = match.group(1)
+    return int(span) if span.isdigit() else NUMBER_WORDS[span]
+
+
+YEAR_OPERATORS = {"since": "$gte", "from": "$gte", "after": "$gt", "before": "$lt", "prior to": "$lt"}
+
+
+def publication_year(text):
+    """
+    Chroma year condition from a "guidelines since 2020" or "the 2019 AGA
+    guideline" style phrase, or None. Like spans, a year has to sit next to
+    publication wording: "colonoscopy in 2019" is the patient's history.
+    """
+    match = re.search(r"\b" + PUBLICATION_TERMS + r"\s+(?:(?:published|issued|released|updated)\s+)?"
+                      r"(?:(since|from|after|before|prior to|in|of)\s+)?" + YEAR + r"\b", text)
+    if match:
+        operator, value = match.group(1), int(match.group(2))
+    else:
+        qualifiers = "|".join([acronym.lower() for acronym in SOCIETIES] + ["clinical", "practice", "joint", "updated"])
+        match = re.search(r"\b" + YEAR + r"(?:'s?|\u2019s?)?\s+(?:(?:" + qualifiers + r")\s+){0,3}" + PUBLICATION_TERMS + r"\b",
+                          text)
+        if not match:
+            return None
+        operator, value = None, int(match.group(1))
+    if operator in YEAR_OPERATORS:
+        return {YEAR_OPERATORS[operator]: value}
+    return value
+
+
+def query_filter(question, recent_years=5):
+    """
+    Chroma `where` filter from the question's year/society hints, or None
+    when there is nothing to filter on.
+    """
+    conditions = []
+    text = question.lower()
+    year = current_year()
+
+    span = publication_span(text)
+    published = publication_year(text)
+    if span is not None:
+        conditions.append({"year": {"$gte": year - span}})
+    elif published is not None:
+        conditions.append({"year": published})
+    elif re.search(r"\b(?:latest|most recent|newest|current|updated)\s+(?:[a-z]+\s+){0,2}?" + PUBLICATION_TERMS + r"\b",
+                   text):
+        conditions.append({"year": {"$gte": year - recent_years}})
+
+    # Acronyms are ambiguous ("ACS risk" is acute coronary syndrome); full names are not
+    societies = find_societies(question, acronyms=bool(re.search(r"\b" + RECOMMENDATION_TERMS + r"\b", text)))
+    if len(societies) == 1:
+        conditions.append({"society": societies[0]})
+    elif societies:
+        conditions.append({"society": {"$in": societies}})
+
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def prefer_doc_types(docs, category):
+    """
+    Stable reorder putting chunks of the category's document types first.
+    Not a filter: many chunks carry no doc_type, and excluding them would
+    let weak labelled matches beat relevant unlabelled ones.
+    """
+    preferred = CATEGORY_DOC_TYPES.get(category)
+    if not preferred:
+        return docs
+    return sorted(docs, key=lambda doc: (getattr(doc, "metadata", None) or {}).get("doc_type") not in preferred)
+
+
+def matches(metadata, where):
+    """Evaluate a Chroma-style where filter against a metadata dict (for stores without native filtering)."""
+    if not where:
+        return True
+    if "$and" in where:
+        return all(matches(metadata, clause) for clause in where["$and"])
+    if "$or" in where:
+        return any(matches(metadata, clause) for clause in where["$or"])
+    for key, condition in where.items():
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if value is None:
+                return False
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+            if op == "$gt" and not value > expected:
+                return False
+            if op == "$gte" and not value >= expected:
+                return False
+            if op == "$lt" and not value < expected:
+                return False
+            if op == "$lte" and not value <= expected:
+                return False
+    return True
@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from hashlib import sha256
+
+from langchain_core.embeddings import Embeddings
+
+from reference import metrics
+
+
+# --- Caching embeddings wrapper ---
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings implementation (normally OpenAIEmbeddings) with a
+    bounded in-memory LRU + TTL cache and an optional SQLite tier that all
+    gunicorn workers on the host can share.
+
+    Keys combine the embedding model name with the text, so a model change
+    can never serve vectors produced by the previous model. Query keys use
+    the normalised text (case and spacing do not change what a user asks);
+    document keys use the exact text.
+    """
+
+    def __init__(self, embeddings, model_name=None, max_entries=2048, ttl_seconds=86400, persist_path=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = self._open_db(persist_path) if persist_path else None
+
+    @classmethod
+    def from_env(cls, embeddings):
+        """Build the cache from EMBEDDING_CACHE_SIZE / _TTL / _PATH environment variables."""
+        return cls(
+            embeddings,
+            max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+            ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL", "86400")),
+            persist_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+        )
+
+    # --- Embeddings interface ---
+    def embed_query(self, text):
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            with metrics.timed("embed"):
+                vector = self.embeddings.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            with metrics.timed("embed"):
+                vector = await self.embeddings.aembed_query(text)
+            self._put(key, vector)
+        return vector
+
+    def embed_documents(self, texts):
+        return self._embed_many(texts, [self._document_key(t) for t in texts])
+
+    async def aembed_documents(self, texts):
+        keys = [self._document_key(t) for t in texts]
+        vectors = [self._get(k) for k in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            with metrics.timed("embed"):
+                fresh = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+                self._put(keys[i], vector)
+        return vectors
+
+    def embed_queries(self, texts):
+        """Embed many queries in one upstream call, cached under their query keys (batch priming)."""
+        return self._embed_many(texts, [self._key(t) for t in texts])
+
+    def _embed_many(self, texts, keys):
+        vectors = [self._get(k) for k in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            # One upstream call for every text not already cached
+            with metrics.timed("embed"):
+                fresh = self.embeddings.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+                self._put(keys[i], vector)
+        return vectors
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self._memory),
+            "max_entries": self.max_entries,
+            "persistent": self._db is not None
+        }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings WHERE model = ?", (self.model_name,))
+                self._db.commit()
+
+    # --- Cache internals ---
+    @staticmethod
+    def normalize(text):
+        """Normalise a query for keying: unicode form, case and whitespace."""
+        return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+    def _key(self, text):
+        return sha256(f"{self.model_name}\x00{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def _document_key(self, text):
+        return sha256(f"{self.model_name}\x00document\x00{text}".encode("utf-8")).hexdigest()
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, vector = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    metrics.cache_lookup("embedding", True)
+                    return vector
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[0] <= self.ttl_seconds:
+                    vector = array("d", row[1]).tolist()
+                    self._remember(key, vector, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    metrics.cache_lookup("embedding", True)
+                    return vector
+
+            self.misses += 1
+            metrics.cache_lookup("embedding", False)
+            return None
+
+    def _put(self, key, vector):
+        created = time.time()
+        with self._lock:
+            self._remember(key, vector, created)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, model, created, vector) VALUES (?, ?, ?, ?)",
+                        (key, self.model_name, created, array("d", vector).tobytes())
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Warning: Could not persist embedding: {e}")
+
+    def _remember(self, key, vector, created):
+        self._memory[key] = (created, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _open_db(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, created REAL NOT NULL, vector BLOB NOT NULL)"
+        )
+        # Expired rows are never served; drop them so the shared file stays bounded
+        db.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - self.ttl_seconds,))
+        db.commit()
+        return db
@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+from langchain_core.embeddings import Embeddings
+
+from reference.microbatch import MicroBatcher
+
+
+# --- Embedding request coalescer ---
+class CoalescingEmbeddings(Embeddings):
+    """
+    Merges concurrent embed_query calls into one upstream embed_documents
+    request.
+
+    Queries arriving within window_ms of each other (up to max_batch) are
+    sent as a single batch and every caller receives its own vector, which
+    cuts upstream request count and rate-limit pressure at peak traffic.
+    A lone query waits at most window_ms longer than it would have.
+    """
+
+    def __init__(self, embeddings, window_ms=10, max_batch=64, workers=4):
+        self.embeddings = embeddings
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.upstream_calls = 0
+        self._batcher = MicroBatcher(
+            self._embed_batch, max_batch=max_batch, max_wait_ms=window_ms, workers=workers, name="embed-coalescer"
+        )
+
+    @classmethod
+    def from_env(cls, embeddings):
+        """Wrap embeddings per EMBEDDING_COALESCE_* settings; window 0 disables coalescing."""
+        window_ms = float(os.getenv("EMBEDDING_COALESCE_WINDOW_MS", "10"))
+        if window_ms <= 0:
+            return embeddings
+        return cls(
+            embeddings,
+            window_ms=window_ms,
+            max_batch=int(os.getenv("EMBEDDING_COALESCE_MAX_BATCH", "64")),
+            workers=int(os.getenv("EMBEDDING_COALESCE_WORKERS", "4")),
+        )
+
+    @property
+    def model(self):
+        # CachedEmbeddings keys vectors by the underlying model name
+        return getattr(self.embeddings, "model", None)
+
+    def embed_query(self, text):
+        return self._batcher.submit(text).result()
+
+    async def aembed_query(self, text):
+        return await asyncio.wrap_future(self._batcher.submit(text))
+
+    def embed_documents(self, texts):
+        # Callers with their own batches (ingestion, routers) go straight upstream
+        self.upstream_calls += 1
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        self.upstream_calls += 1
+        return await self.embeddings.aembed_documents(texts)
+
+    def stats(self):
+        return dict(self._batcher.stats(), upstream_calls=self.upstream_calls, window_ms=self.window_ms)
+
+    def _embed_batch(self, texts):
+        self.upstream_calls += 1
+        return self.embeddings.embed_documents(texts)
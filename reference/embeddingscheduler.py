@@ -0,0 +1,313 @@
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+from langchain_core.embeddings import Embeddings
+
+
+# --- Token counting ---
+def make_token_counter(model):
+    """tiktoken length for the model; a 4-characters-per-token estimate when tiktoken is unavailable."""
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return lambda text: max(1, len(text) // 4)
+
+
+def pack_batches(items, count_tokens, max_tokens, max_size):
+    """Group (index, text) items into batches under max_tokens and max_size, keeping order."""
+    batch, batch_tokens = [], 0
+    for index, text in items:
+        tokens = count_tokens(text)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_size):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append((index, text))
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+
+def parse_duration(value):
+    """OpenAI reset headers look like '1s', '6m0s', '250ms' or a bare number of seconds."""
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    for amount, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total or None
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.retry_after = retry_after
+
+
+# --- Rate-limit aware bulk embedding scheduler ---
+class EmbeddingScheduler(Embeddings):
+    """
+    Bulk embedder for ingestion that tries to use the whole embeddings quota
+    without a storm of 429s.
+
+    embed_documents() skips texts already in the checkpoint database, packs
+    the rest into batches of at most max_batch_tokens tokens, and sends
+    several batches at once. Concurrency follows AIMD: it grows by one
+    after a full window of successful batches while the x-ratelimit-remaining
+    headers show headroom and latency stays under latency_ceiling, and halves
+    on a 429 or a slow batch. Failed batches retry with full-jitter
+    exponential backoff, honouring retry-after. Every completed batch is
+    committed to SQLite, so a crashed run never pays twice for a vector;
+    forget() drops the rows once the caller has stored the vectors itself.
+    """
+
+    def __init__(self, model="text-embedding-ada-002", client=None, checkpoint_path=None,
+                 max_batch_tokens=50000, max_batch_size=512, initial_concurrency=2, max_concurrency=16,
+                 max_retries=8, backoff_base=0.5, backoff_cap=30.0, latency_ceiling=20.0, token_counter=None):
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.latency_ceiling = latency_ceiling
+        self.count_tokens = token_counter or make_token_counter(model)
+        self.concurrency = float(initial_concurrency)
+        self.peak_concurrency = initial_concurrency
+        self.batches = 0
+        self.tokens = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.reused = 0
+        self._client = client
+        self._in_flight = 0
+        self._successes = 0
+        self._pause_until = 0.0
+        self._cond = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed-scheduler")
+        self._db = self._open_db(checkpoint_path) if checkpoint_path else None
+        self._db_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, checkpoint_path=None):
+        """Build the scheduler from EMBEDDING_SCHEDULER_* environment variables."""
+        return cls(
+            model=os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002"),
+            checkpoint_path=os.getenv("EMBEDDING_SCHEDULER_CHECKPOINT") or checkpoint_path,
+            max_batch_tokens=int(os.getenv("EMBEDDING_SCHEDULER_MAX_BATCH_TOKENS", "50000")),
+            max_batch_size=int(os.getenv("EMBEDDING_SCHEDULER_MAX_BATCH_SIZE", "512")),
+            initial_concurrency=int(os.getenv("EMBEDDING_SCHEDULER_CONCURRENCY", "2")),
+            max_concurrency=int(os.getenv("EMBEDDING_SCHEDULER_MAX_CONCURRENCY", "16")),
+            max_retries=int(os.getenv("EMBEDDING_SCHEDULER_MAX_RETRIES", "8")),
+        )
+
+    # --- Embeddings interface ---
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = [None] * len(texts)
+        todo = []
+        for index, text in enumerate(texts):
+            vector = self._load(text)
+            if vector is None:
+                todo.append((index, text))
+            else:
+                vectors[index] = vector
+                with self._stats_lock:
+                    self.reused += 1
+
+        futures = []
+        for batch, tokens in pack_batches(todo, self.count_tokens, self.max_batch_tokens, self.max_batch_size):
+            self._acquire()
+            futures.append((batch, self._pool.submit(self._run_batch, batch, tokens)))
+        for batch, future in futures:
+            for (index, _), vector in zip(batch, future.result()):
+                vectors[index] = vector
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        with self._stats_lock, self._cond:
+            return {
+                "model": self.model,
+                "batches": self.batches,
+                "tokens": self.tokens,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "reused": self.reused,
+                "concurrency": round(self.concurrency, 2),
+                "peak_concurrency": self.peak_concurrency
+            }
+
+    def forget(self, texts):
+        """Delete the checkpoint rows of texts whose vectors are now stored elsewhere (e.g. a committed document)."""
+        if self._db is None:
+            return
+        keys = [(self._key(text),) for text in texts]
+        with self._db_lock, self._db:
+            self._db.executemany("DELETE FROM vectors WHERE key = ?", keys)
+
+    # --- Concurrency control (AIMD) ---
+    def _acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self.concurrency):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _on_success(self, latency, headers):
+        with self._cond:
+            if latency > self.latency_ceiling:
+                self._decrease()
+                return
+            if not self._has_headroom(headers):
+                return
+            # Additive increase: +1 per `concurrency` successful batches
+            self._successes += 1
+            if self._successes >= int(self.concurrency):
+                self._successes = 0
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                self.peak_concurrency = max(self.peak_concurrency, int(self.concurrency))
+                self._cond.notify_all()
+
+    def _on_rate_limit(self, retry_after):
+        with self._cond:
+            self.rate_limited += 1
+            self._decrease()
+            if retry_after:
+                self._pause_until = max(self._pause_until, time.monotonic() + retry_after)
+
+    def _decrease(self):
+        self._successes = 0
+        self.concurrency = max(1.0, self.concurrency / 2)
+
+    def _has_headroom(self, headers):
+        """False when either x-ratelimit-remaining header is under 10% of its limit."""
+        for kind in ("requests", "tokens"):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                if limit and remaining is not None and int(remaining) < 0.1 * int(limit):
+                    return False
+            except ValueError:
+                continue
+        return True
+
+    # --- Upstream calls ---
+    def _run_batch(self, batch, tokens):
+        try:
+            texts = [text for _, text in batch]
+            for attempt in range(self.max_retries + 1):
+                # A 429 pauses every worker, not just the one that saw it
+                wait = self._pause_until - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                start = time.perf_counter()
+                try:
+                    vectors, headers = self._request(texts)
+                except RateLimited as e:
+                    self._on_rate_limit(e.retry_after)
+                    delay = max(e.retry_after or 0.0, self._backoff(attempt))
+                except Exception as e:
+                    if attempt >= self.max_retries or not self._retryable(e):
+                        raise
+                    delay = self._backoff(attempt)
+                else:
+                    self._on_success(time.perf_counter() - start, headers)
+                    self._store(texts, vectors)
+                    with self._stats_lock:
+                        self.batches += 1
+                        self.tokens += tokens
+                    return vectors
+                if attempt >= self.max_retries:
+                    break
+                with self._stats_lock:
+                    self.retries += 1
+                time.sleep(delay)
+            raise RuntimeError(f"Embedding batch still rate limited after {self.max_retries} retries")
+        finally:
+            self._release()
+
+    def _backoff(self, attempt):
+        """Full jitter: uniform(0, min(cap, base * 2^attempt))."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retryable(error):
+        import openai
+
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+    def _request(self, texts):
+        import openai
+
+        try:
+            raw = self._get_client().embeddings.with_raw_response.create(model=self.model, input=texts)
+        except openai.RateLimitError as e:
+            headers = e.response.headers
+            if headers.get("retry-after-ms"):
+                raise RateLimited(float(headers["retry-after-ms"]) / 1000.0)
+            raise RateLimited(parse_duration(headers.get("retry-after"))
+                              or parse_duration(headers.get("x-ratelimit-reset-requests")))
+        response = raw.parse()
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        return vectors, raw.headers
+
+    def _get_client(self):
+        if self._client is None:
+            import openai
+
+            # Retries are ours: the SDK's own would hide 429s from the AIMD loop
+            self._client = openai.OpenAI(max_retries=0)
+        return self._client
+
+    # --- Checkpoint database ---
+    def _key(self, text):
+        return sha256(f"{self.model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _load(self, text):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute("SELECT vector FROM vectors WHERE key = ?", (self._key(text),)).fetchone()
+        return list(array("d", row[0])) if row else None
+
+    def _store(self, texts, vectors):
+        if self._db is None:
+            return
+        rows = [(self._key(text), self.model, array("d", vector).tobytes()) for text, vector in zip(texts, vectors)]
+        with self._db_lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO vectors (key, model, vector) VALUES (?, ?, ?)", rows)
+
+    @staticmethod
+    def _open_db(path):
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)")
+        return db
@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+DEFAULT_ANSWER_TEMPLATE = (
+    "Summary: offline answer to \"{question}\". "
+    "Recommendation: follow the retrieved guideline excerpts ({context_chars} characters of context). "
+    "References: fake backend."
+)
+
+
+# --- Backend selection ---
+def llm_backend():
+    """'openai' (default) or 'fake', from MEDCOPILOT_LLM_BACKEND."""
+    return os.getenv("MEDCOPILOT_LLM_BACKEND", "openai").lower()
+
+
+def embeddings_backend():
+    """MEDCOPILOT_EMBEDDINGS_BACKEND, defaulting to the LLM backend."""
+    return os.getenv("MEDCOPILOT_EMBEDDINGS_BACKEND", llm_backend()).lower()
+
+
+# --- Deterministic embeddings ---
+class FakeEmbeddings(Embeddings):
+    """
+    Offline stand-in for OpenAIEmbeddings.
+
+    Vectors are built by feature hashing: every lower-cased word adds a
+    signed unit to one of `size` buckets, then the vector is normalised.
+    The same text always gives the same vector, and texts sharing words
+    have a positive cosine similarity, so routing and caching behave
+    sensibly without a network.
+    """
+
+    def __init__(self, size=1536, latency_ms=0.0, model="fake-embedding"):
+        self.size = size
+        self.latency = latency_ms / 1000.0
+        self.model = model
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            size=int(os.getenv("FAKE_EMBEDDING_DIM", "1536")),
+            latency_ms=float(os.getenv("FAKE_EMBED_LATENCY_MS", "0")),
+        )
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+    def _vector(self, text):
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", str(text).lower()):
+            digest = hashlib.sha256(word.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector))
+        if not norm:
+            vector[0] = norm = 1.0
+        return [v / norm for v in vector]
+
+
+# --- Canned chat model ---
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOpenAI.
+
+    Classification prompts get `category`; every other prompt gets
+    answer_template filled with the question (the last human message) and
+    the size of the prompt context. latency_ms simulates the whole call;
+    when streaming, the first chunk arrives after first_token_ms and the
+    remaining words share the rest of latency_ms.
+    """
+
+    model_name: str = "fake-chat"
+    answer_template: str = DEFAULT_ANSWER_TEMPLATE
+    category: str = "Other"
+    latency_ms: float = 0.0
+    first_token_ms: float = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            answer_template=os.getenv("FAKE_LLM_TEMPLATE", DEFAULT_ANSWER_TEMPLATE),
+            category=os.getenv("FAKE_LLM_CATEGORY", "Other"),
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+            first_token_ms=float(os.getenv("FAKE_LLM_TTFT_MS", "0")),
+        )
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def complete(self, messages):
+        """The deterministic completion for a list of messages."""
+        if any("classifying medical text" in str(m.content) for m in messages):
+            return self.category
+        human = [m for m in messages if m.type == "human"]
+        question = str(human[-1].content if human else messages[-1].content).strip()
+        context_chars = sum(len(str(m.content)) for m in messages if m.type == "system")
+        return self.answer_template.format(question=question[:200], context_chars=context_chars)
+
+    # --- Blocking ---
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.complete(messages)))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        pieces, first, rest = self._stream_plan(messages)
+        for i, piece in enumerate(pieces):
+            time.sleep(first if i == 0 else rest)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    # --- Async ---
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.complete(messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        pieces, first, rest = self._stream_plan(messages)
+        for i, piece in enumerate(pieces):
+            await asyncio.sleep(first if i == 0 else rest)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    def _stream_plan(self, messages):
+        """Word-sized chunks plus the delay before the first and each later chunk (seconds)."""
+        pieces = re.findall(r"\S+\s*", self.complete(messages)) or [""]
+        first = self.first_token_ms / 1000.0
+        rest = max(0.0, self.latency_ms - self.first_token_ms) / 1000.0 / max(1, len(pieces) - 1)
+        return pieces, first, rest
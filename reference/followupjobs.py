@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+from reference import metrics
+
+
+def job_id(question, answer):
+    """Same question and answer, same id: a repeated (or cached) answer reuses its follow-ups."""
+    normalized = " ".join(unicodedata.normalize("NFKC", question).casefold().split())
+    return sha256(f"{normalized}\x00{answer}".encode("utf-8")).hexdigest()[:32]
+
+
+def parse_questions(text):
+    """
+    Questions from the follow-up prompt's output, which asks for loose JSON
+    ({ question: ..., question: ... }) but often comes back as a list.
+    """
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", (text or "").strip())
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    values = list(data.values()) if isinstance(data, dict) else data if isinstance(data, list) else []
+    parsed = [value.strip() for value in values if isinstance(value, str) and value.strip()]
+    if parsed:
+        return parsed
+    questions = []
+    for line in text.split("\n"):
+        line = re.sub(r'^\s*(?:[-*\u2022]|\d+[.)])?\s*(?:"?question"?\s*:)?\s*', "", line, flags=re.I)
+        line = line.strip().rstrip(",").strip().strip('"').strip()
+        if line and line not in ("{", "}", "[", "]"):
+            questions.append(line)
+    return questions
+
+
+# --- Background follow-up question jobs ---
+class FollowupJobs:
+    """
+    Follow-up questions generated off the request path.
+
+    create() only records the question, answer and context under an id the
+    client gets back with its answer; nothing is generated until someone
+    asks for that id (unless eager is set), so clients that never show
+    follow-ups cost no LLM call. get() claims a pending job atomically,
+    runs generate(question, answer, context) on a bounded thread pool and
+    waits up to `wait` seconds for it. Jobs and their results live in
+    SQLite, so any gunicorn worker can serve the follow-up request and a
+    finished result is reused until ttl_seconds. on_done(key, questions,
+    session_id), when given, runs after each successful generation (the
+    follow-up prefetcher hooks in there).
+    """
+
+    def __init__(self, path, generate, max_workers=2, max_queue=32, ttl_seconds=3600,
+                 stuck_seconds=120, max_context_chars=6000, eager=False, on_done=None):
+        self.path = path
+        self.generate = generate
+        self.max_queue = max_queue
+        self.ttl_seconds = ttl_seconds
+        self.stuck_seconds = stuck_seconds
+        self.max_context_chars = max_context_chars
+        self.eager = eager
+        self.on_done = on_done
+        self.created = 0
+        self.generated = 0
+        self.reused = 0
+        self.failed = 0
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="followups")
+        self._db = self._open_db(path)
+
+    @classmethod
+    def from_env(cls, generate, on_done=None):
+        """Build the job store from FOLLOWUP_* environment variables; None when FOLLOWUPS is off."""
+        if os.getenv("FOLLOWUPS", "1").lower() in ("0", "false", "off"):
+            return None
+        return cls(
+            # Per-process unless a path shared by the workers is configured
+            os.getenv("FOLLOWUP_STORE_PATH", ":memory:"),
+            generate,
+            max_workers=int(os.getenv("FOLLOWUP_WORKERS", "2")),
+            max_queue=int(os.getenv("FOLLOWUP_MAX_QUEUE", "32")),
+            ttl_seconds=float(os.getenv("FOLLOWUP_TTL_SECONDS", "3600")),
+            eager=os.getenv("FOLLOWUP_EAGER", "0").lower() in ("1", "true", "on"),
+            on_done=on_done,
+        )
+
+    # --- Jobs ---
+    def create(self, question, answer, context="", session_id=None):
+        """Register follow-ups for an answer and return their id (generation is deferred)."""
+        key = job_id(question, answer)
+        now = time.time()
+        with self._db_lock, self._db:
+            inserted = self._db.execute(
+                "INSERT INTO jobs (id, question, answer, context, session, status, created) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?) "
+                "ON CONFLICT(id) DO UPDATE SET question = excluded.question, context = excluded.context, "
+                "session = excluded.session, status = 'pending', questions = NULL, created = excluded.created "
+                "WHERE jobs.created < ? OR jobs.status = 'failed'",
+                (key, question, answer, context[:self.max_context_chars], session_id, now, now - self.ttl_seconds)
+            ).rowcount
+        if inserted:
+            self.created += 1
+            if self.created % 100 == 0:
+                self._prune(now)
+        else:
+            self.reused += 1
+        if self.eager:
+            self._start(key)
+        return key
+
+    def get(self, key, wait=0.0):
+        """Return (status, questions): status is "done", "pending", "running", "failed" or "missing"."""
+        deadline = time.monotonic() + wait
+        self._start(key)
+        while True:
+            row = self._row(key)
+            if row is None:
+                return "missing", None
+            status, questions = row
+            if status in ("done", "failed") or time.monotonic() >= deadline:
+                return status, json.loads(questions) if questions else None
+            time.sleep(0.05)
+
+    def stats(self):
+        return {"created": self.created, "reused": self.reused, "generated": self.generated,
+                "failed": self.failed, "queued": self._queued}
+
+    # --- Execution ---
+    def _start(self, key):
+        """Claim a pending (or stuck) job and queue it; a full queue leaves it pending for the next request."""
+        with self._lock:
+            if self._queued >= self.max_queue:
+                return False
+            now = time.time()
+            with self._db_lock, self._db:
+                claimed = self._db.execute(
+                    "UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND created >= ? "
+                    "AND (status = 'pending' OR (status = 'running' AND started < ?))",
+                    (now, key, now - self.ttl_seconds, now - self.stuck_seconds)
+                ).rowcount
+            if not claimed:
+                return False
+            self._queued += 1
+        self._pool.submit(self._run, key)
+        return True
+
+    def _run(self, key):
+        try:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT question, answer, context, session FROM jobs WHERE id = ?", (key,)
+                ).fetchone()
+            questions = [q.strip() for q in self.generate(*row[:3]) if q and q.strip()]
+            self._finish(key, "done", questions)
+            self.generated += 1
+        except Exception as e:
+            print(f"⚠️ Warning: Follow-up generation failed: {e}")
+            metrics.upstream_error("followups", e)
+            self._finish(key, "failed", None)
+            self.failed += 1
+            return
+        finally:
+            with self._lock:
+                self._queued -= 1
+        if self.on_done is not None:
+            try:
+                self.on_done(key, questions, row[3])
+            except Exception as e:
+                print(f"⚠️ Warning: Follow-up callback failed: {e}")
+
+    def _finish(self, key, status, questions):
+        with self._db_lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, questions = ?, finished = ? WHERE id = ?",
+                (status, json.dumps(questions) if questions is not None else None, time.time(), key)
+            )
+
+    def _prune(self, now):
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM jobs WHERE created < ? AND status != 'running'", (now - self.ttl_seconds,))
+
+    def _row(self, key):
+        with self._db_lock:
+            return self._db.execute(
+                "SELECT status, questions FROM jobs WHERE id = ? AND created >= ?",
+                (key, time.time() - self.ttl_seconds)
+            ).fetchone()
+
+    @staticmethod
+    def _open_db(path):
+        db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL, "
+                   "context TEXT NOT NULL, session TEXT, status TEXT NOT NULL, questions TEXT, created REAL NOT NULL, "
+                   "started REAL, finished REAL)")
+        try:
+            db.execute("ALTER TABLE jobs ADD COLUMN session TEXT")
+        except sqlite3.OperationalError:
+            pass  # created with the column, or already migrated
+        db.commit()
+        return db
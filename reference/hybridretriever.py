@@ -0,0 +1,86 @@
+import asyncio
+import os
+from hashlib import sha256
+
+from langchain_core.retrievers import BaseRetriever
+
+from reference.bm25index import BM25Index
+from reference.documentmetadata import matches
+
+
+def doc_key(doc):
+    """Chunk identity shared by Chroma and the BM25 index (content hash for legacy chunks without an id)."""
+    return doc.id or doc.metadata.get("chunk_hash") or sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """
+    Fuse ranked lists of keys: score(key) = sum of 1 / (rrf_k + rank) over the
+    lists it appears in. Equal scores go to the key with the best single
+    rank, then to the smaller key, so no list wins ties by coming first.
+    """
+    scores = {}
+    best = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            best[key] = min(best.get(key, rank), rank)
+    return sorted(scores, key=lambda key: (-scores[key], best[key], str(key)))
+
+
+# --- Hybrid BM25 + vector retriever ---
+class HybridRetriever(BaseRetriever):
+    """
+    Runs the Chroma similarity search and the BM25 index over the same
+    chunks, each for `candidates` results, and returns the top k after
+    reciprocal rank fusion. Exact terms (drug names, AGA/ACG, gene names)
+    that the embedding blurs are still found by BM25, so a small k keeps
+    the recall of a much larger vector-only k.
+    """
+
+    vectorstore: object
+    index: object
+    k: int = 4
+    candidates: int = 20
+    rrf_k: int = 60
+
+    @classmethod
+    def from_env(cls, vectorstore, store_location):
+        """Hybrid retriever when HYBRID_RETRIEVAL is on and the store has a BM25 index; None otherwise."""
+        path = os.path.join(store_location, "bm25.sqlite3")
+        if os.getenv("HYBRID_RETRIEVAL", "1").lower() in ("0", "false", "off") or not os.path.exists(path):
+            return None
+        index = BM25Index(path)
+        if not len(index):
+            return None
+        return cls(
+            vectorstore=vectorstore,
+            index=index,
+            k=int(os.getenv("HYBRID_K", "4")),
+            candidates=int(os.getenv("HYBRID_CANDIDATES", "20")),
+            rrf_k=int(os.getenv("HYBRID_RRF_K", "60")),
+        )
+
+    def _get_relevant_documents(self, query, *, run_manager=None, filter=None):
+        vector_docs = self.vectorstore.similarity_search(query, k=self.candidates, filter=filter)
+        return self._fuse(vector_docs, self._lexical(query, filter))
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None, filter=None):
+        # BM25 lookups are blocking SQLite calls: run them in a thread, alongside the vector search
+        vector_docs, lexical_docs = await asyncio.gather(
+            self.vectorstore.asimilarity_search(query, k=self.candidates, filter=filter),
+            asyncio.to_thread(self._lexical, query, filter),
+        )
+        return self._fuse(vector_docs, lexical_docs)
+
+    def _lexical(self, query, filter):
+        """BM25 candidates as documents; a metadata filter is applied to a deeper result list."""
+        depth = self.candidates * 5 if filter else self.candidates
+        docs = self.index.get_documents([doc_id for doc_id, _ in self.index.search(query, k=depth)])
+        return [doc for doc in docs if matches(doc.metadata, filter)][:self.candidates]
+
+    def _fuse(self, vector_docs, lexical_docs):
+        by_key = {doc_key(doc): doc for doc in vector_docs}
+        fused = reciprocal_rank_fusion([list(by_key), [doc.id for doc in lexical_docs]], self.rrf_k)[:self.k]
+        by_key.update({doc.id: doc for doc in lexical_docs if doc.id not in by_key})
+        return [by_key[key] for key in fused]
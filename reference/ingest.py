@@ -0,0 +1,387 @@
+"""
+Incremental ingestion of guideline documents into the medcopilot Chroma
+collection.
+
+Documents stream through load -> split -> embed -> upsert as a chain of
+generators, so memory stays flat however large the library is. Every chunk
+id is a content hash, so a re-run only embeds new or changed chunks. A
+manifest next to chroma.sqlite3 remembers each document's file hash, so
+unchanged documents are skipped without being parsed. Chunks of documents
+that have been removed from the source directory are deleted.
+
+The manifest also records the directory the store was first built from.
+Sources are keyed relative to that root, so a run on a subdirectory
+(./guidelines/gi after ./guidelines) only syncs, and only prunes, the
+documents under it.
+
+With --workers above 1, PDFs are parsed and split in a process pool while
+the main process embeds and upserts finished documents, with at most
+--queue-size parsed documents waiting. A document is checkpointed in the
+manifest once all its chunks are stored, so an interrupted run resumes
+with the next document (and chunks already upserted are not re-embedded).
+
+Usage:
+    python -m reference.ingest ./guidelines --store vectorstore
+    python -m reference.ingest ./guidelines --store vectorstore --chunk-size 1000 --batch-size 512
+    python -m reference.ingest ./guidelines --store vectorstore --workers 8 --queue-size 16
+    python -m reference.ingest ./guidelines/gi --store vectorstore
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from hashlib import sha256
+
+from langchain_core.documents import Document
+
+from reference.bm25index import BM25Index
+from reference.documentmetadata import EXTRACTOR_VERSION, extract_metadata
+from reference.embeddingscheduler import EmbeddingScheduler
+from reference.fakebackends import FakeEmbeddings, embeddings_backend
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+
+# --- Pipeline stages ---
+def discover(source_dir):
+    """Yield (relative source path, absolute path) for every supported file, in a stable order."""
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, source_dir).replace(os.sep, "/"), path
+
+
+def file_hash(path):
+    digest = sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_pages(source, path):
+    """Yield one Document per page (PDF) or per file (text)."""
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        for number, page in enumerate(reader.pages):
+            text = page.extract_text() or ""
+            if text.strip():
+                yield Document(page_content=text, metadata={"source": source, "page": number})
+    else:
+        with open(path, encoding="utf-8", errors="replace") as handle:
+            yield Document(page_content=handle.read(), metadata={"source": source, "page": 0})
+
+
+def annotate(pages):
+    """Copy the year/society/doc_type found on a document's first page onto all of its pages."""
+    document_metadata = None
+    for page in pages:
+        if document_metadata is None:
+            document_metadata = extract_metadata(page.page_content, page.metadata["source"])
+        page.metadata.update(document_metadata)
+        yield page
+
+
+def split_pages(pages, splitter):
+    """Yield chunks page by page, tagging each with its content-hash id."""
+    for page in pages:
+        for chunk in splitter.split_documents([page]):
+            chunk.id = chunk_id(chunk.metadata["source"], chunk.page_content)
+            chunk.metadata["chunk_hash"] = chunk.id
+            yield chunk
+
+
+def parse_document(source, path, splitter):
+    """Load and split a whole document in a worker process; returns (page count, chunks)."""
+    pages = list(annotate(load_pages(source, path)))
+    return len(pages), list(split_pages(pages, splitter))
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunk_id(source, text):
+    return sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def make_splitter(chunk_size=1000, chunk_overlap=200):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def make_embeddings(store_location):
+    """
+    The embedding backend of the serving path (see runinference2): fake, or
+    OpenAI through the rate-limit aware scheduler with its checkpoint in the store.
+    """
+    if embeddings_backend() == "fake":
+        return FakeEmbeddings.from_env()
+    return EmbeddingScheduler.from_env(os.path.join(store_location, "embedding_checkpoint.sqlite3"))
+
+
+# --- Ingestion ---
+class Ingestor:
+    """
+    Syncs a directory of documents into a Chroma collection.
+
+    For each changed document the pages are split into chunks, chunks whose
+    id is already stored are skipped, the rest are embedded and upserted in
+    batches, and stale chunks of the previous version are deleted.
+    """
+
+    def __init__(self, store_location, collection_name="medcopilot", embeddings=None, splitter=None, batch_size=512,
+                 workers=1, queue_size=None):
+        from langchain_chroma import Chroma
+
+        os.makedirs(store_location, exist_ok=True)
+        self.store_location = store_location
+        self.batch_size = batch_size
+        self.workers = workers
+        self.queue_size = queue_size or 2 * max(1, workers)
+        self.splitter = splitter or make_splitter()
+        self.embeddings = embeddings or make_embeddings(store_location)
+        self.vectorstore = Chroma(
+            collection_name=collection_name,
+            persist_directory=store_location,
+            embedding_function=self.embeddings
+        )
+        # Lexical index over the same chunk ids, for hybrid retrieval
+        self.index = BM25Index(os.path.join(store_location, "bm25.sqlite3"))
+        self._manifest = self._open_manifest(os.path.join(store_location, "ingest_manifest.sqlite3"))
+        self.stats = {}
+
+    def run(self, source_dir):
+        """Ingest source_dir; returns the run statistics."""
+        self.stats = {"documents": 0, "skipped": 0, "removed": 0, "pages": 0, "chunks": 0,
+                      "embedded": 0, "deleted": 0}
+        start = time.perf_counter()
+        seen = set()
+        prefix = self._source_prefix(source_dir)
+        self.backfill_index()
+
+        pending = []
+        for relative, path in discover(source_dir):
+            source = prefix + relative
+            seen.add(source)
+            self.stats["documents"] += 1
+            # The extractor version is part of the fingerprint, so a new one re-annotates every document
+            digest = f"{file_hash(path)}:{EXTRACTOR_VERSION}"
+            if self._manifest_hash(source) == digest:
+                self.stats["skipped"] += 1
+            else:
+                pending.append((source, path, digest))
+
+        if self.workers > 1 and len(pending) > 1:
+            self._ingest_parallel(pending)
+        else:
+            for source, path, digest in pending:
+                self.ingest_document(source, self._counted(annotate(load_pages(source, path))), digest)
+
+        # Only documents under the synced directory can have been removed from it
+        for source in self._manifest_sources(prefix) - seen:
+            self.remove_document(source)
+            self.stats["removed"] += 1
+
+        elapsed = time.perf_counter() - start
+        self.stats["seconds"] = round(elapsed, 2)
+        self.stats["pages_per_sec"] = round(self.stats["pages"] / elapsed, 2) if elapsed else 0.0
+        self.stats["chunks_per_sec"] = round(self.stats["chunks"] / elapsed, 2) if elapsed else 0.0
+        print(
+            f"✅ Ingested {self.stats['documents']} documents ({self.stats['skipped']} unchanged, "
+            f"{self.stats['removed']} removed) in {elapsed:.1f}s: "
+            f"{self.stats['pages_per_sec']} pages/s, {self.stats['chunks_per_sec']} chunks/s, "
+            f"{self.stats['embedded']} chunks embedded, {self.stats['deleted']} deleted."
+        )
+        return self.stats
+
+    def _ingest_parallel(self, pending):
+        """Parse in a process pool; embed each document as soon as it is parsed."""
+        # spawn: the parent holds Chroma/HTTP client threads that must not be forked
+        context = multiprocessing.get_context("spawn")
+        documents = iter(pending)
+        in_flight = {}
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            while True:
+                # Bounded queue: never more than queue_size documents parsed or being parsed ahead
+                while len(in_flight) < self.queue_size:
+                    item = next(documents, None)
+                    if item is None:
+                        break
+                    source, path, digest = item
+                    in_flight[pool.submit(parse_document, source, path, self.splitter)] = (source, digest)
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source, digest = in_flight.pop(future)
+                    pages, chunks = future.result()
+                    self.stats["pages"] += pages
+                    self.ingest_chunks(source, chunks, digest)
+
+    def _counted(self, pages):
+        for page in pages:
+            self.stats["pages"] += 1
+            yield page
+
+    def ingest_document(self, source, pages, digest):
+        """Split, embed and upsert one document's pages as a stream."""
+        self.ingest_chunks(source, split_pages(pages, self.splitter), digest)
+
+    def ingest_chunks(self, source, chunks, digest):
+        """Embed and upsert the new chunks of one document, drop its stale ones, then checkpoint it."""
+        stored = self.vectorstore.get(where={"source": source}, include=["metadatas"])
+        existing = dict(zip(stored["ids"], stored["metadatas"]))
+        current = set()
+        embedded_texts = []
+
+        for batch in batched(chunks, self.batch_size):
+            self.stats["chunks"] += len(batch)
+            fresh, relabelled = [], {}
+            for chunk in batch:
+                if chunk.id in current:
+                    continue
+                if chunk.id not in existing:
+                    fresh.append(chunk)
+                elif existing[chunk.id] != chunk.metadata:
+                    relabelled[chunk.id] = chunk.metadata
+                current.add(chunk.id)
+            if fresh:
+                self.vectorstore.add_documents(fresh, ids=[chunk.id for chunk in fresh])
+                self.stats["embedded"] += len(fresh)
+                embedded_texts.extend(chunk.page_content for chunk in fresh)
+            if relabelled:
+                # Same text, new metadata: update in place without re-embedding
+                self.vectorstore._collection.update(ids=list(relabelled), metadatas=list(relabelled.values()))
+                self.index.update_metadata(relabelled)
+            # Every chunk, not just fresh ones: a run interrupted between the two stores heals here
+            self.index.add({chunk.id: chunk for chunk in batch}.values())
+
+        stale = set(existing) - current
+        if stale:
+            self.vectorstore.delete(ids=list(stale))
+            self.index.delete(stale)
+            self.stats["deleted"] += len(stale)
+        self._manifest_put(source, digest, len(current))
+        # The document is committed: its vectors no longer need the scheduler's crash checkpoint
+        forget = getattr(self.embeddings, "forget", None)
+        if forget is not None and embedded_texts:
+            forget(embedded_texts)
+
+    def remove_document(self, source):
+        ids = self.vectorstore.get(where={"source": source}, include=[])["ids"]
+        if ids:
+            self.vectorstore.delete(ids=ids)
+            self.index.delete(ids)
+            self.stats["deleted"] += len(ids)
+        with self._manifest:
+            self._manifest.execute("DELETE FROM documents WHERE source = ?", (source,))
+
+    def backfill_index(self, page_size=1000):
+        """Build the BM25 index from the collection when the store predates it."""
+        if len(self.index):
+            return
+        offset = 0
+        while True:
+            page = self.vectorstore.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            self.index.add(
+                Document(id=doc_id, page_content=text or "", metadata=metadata or {})
+                for doc_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+            )
+            offset += len(page["ids"])
+        if offset:
+            print(f"🔎 BM25 index backfilled with {offset} chunks.")
+
+    # --- Manifest ---
+    def _manifest_hash(self, source):
+        row = self._manifest.execute("SELECT sha256 FROM documents WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def _manifest_sources(self, prefix=""):
+        return {row[0] for row in self._manifest.execute("SELECT source FROM documents") if row[0].startswith(prefix)}
+
+    def _source_prefix(self, source_dir):
+        """
+        Prefix that makes source paths relative to the store's root directory
+        ("" for the root itself, "gi/" for its gi subdirectory). The first run
+        records its directory as the root.
+        """
+        directory = os.path.realpath(source_dir)
+        row = self._manifest.execute("SELECT value FROM settings WHERE key = 'root'").fetchone()
+        if row is None:
+            with self._manifest:
+                self._manifest.execute("INSERT INTO settings (key, value) VALUES ('root', ?)", (directory,))
+            return ""
+        relative = os.path.relpath(directory, row[0])
+        if relative == os.curdir:
+            return ""
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            raise ValueError(
+                f"{source_dir} is outside {row[0]}, the directory this store was built from; "
+                f"ingest that directory (or a subdirectory of it), or use a separate --store."
+            )
+        return relative.replace(os.sep, "/") + "/"
+
+    def _manifest_put(self, source, digest, chunks):
+        with self._manifest:
+            self._manifest.execute(
+                "INSERT OR REPLACE INTO documents (source, sha256, chunks, ingested) VALUES (?, ?, ?, ?)",
+                (source, digest, chunks, time.time())
+            )
+
+    @staticmethod
+    def _open_manifest(path):
+        db = sqlite3.connect(path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "source TEXT PRIMARY KEY, sha256 TEXT NOT NULL, chunks INTEGER NOT NULL, ingested REAL NOT NULL)"
+        )
+        db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        db.commit()
+        return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync a directory of guideline documents into Chroma")
+    parser.add_argument("source_dir", help="Directory of .pdf/.txt/.md documents")
+    parser.add_argument("--store", default="vectorstore", help="Chroma persist directory")
+    parser.add_argument("--collection", default="medcopilot")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=512,
+                        help="Chunks per upsert; the scheduler splits them into token-budgeted embedding requests")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parsing processes (1 parses inline)")
+    parser.add_argument("--queue-size", type=int, default=None, help="Parsed documents buffered ahead of embedding")
+    args = parser.parse_args()
+
+    ingestor = Ingestor(
+        args.store,
+        collection_name=args.collection,
+        splitter=make_splitter(args.chunk_size, args.chunk_overlap),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        queue_size=args.queue_size,
+    )
+    ingestor.run(args.source_dir)
+
+
+if __name__ == "__main__":
+    main()
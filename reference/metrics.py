@@ -0,0 +1,173 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+# Prometheus metrics. With PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py sets
+# a default) every worker writes its samples to files there and /metrics
+# aggregates all workers; it must be set before prometheus_client is imported.
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, \
+        generate_latest
+    from prometheus_client import multiprocess
+except ImportError:  # metrics are optional: every recorder below becomes a no-op
+    Counter = Gauge = Histogram = None
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+
+def _metric(kind, name, documentation, labels, **kwargs):
+    if kind is None:
+        return _NoopMetric()
+    return kind(name, documentation, labels, **kwargs)
+
+
+STAGE_SECONDS = _metric(
+    Histogram, "medcopilot_stage_seconds",
+    "Wall time of each pipeline stage (init, embed, classify, retrieve, vector_search, prepare, ttft, generate, "
+    "serialize, total)",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = _metric(
+    Histogram, "medcopilot_request_seconds", "HTTP request latency (streams: until the last event)",
+    ["endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = _metric(Counter, "medcopilot_requests_total", "HTTP requests by endpoint and status", ["endpoint", "status"])
+IN_FLIGHT = _metric(
+    Gauge, "medcopilot_in_flight_requests", "Requests currently being served", ["endpoint"],
+    **({"multiprocess_mode": "livesum"} if Gauge is not None else {})
+)
+CACHE_LOOKUPS = _metric(
+    Counter, "medcopilot_cache_lookups_total", "Cache lookups by cache (embedding, semantic, response) and result",
+    ["cache", "result"]
+)
+UPSTREAM_ERRORS = _metric(
+    Counter, "medcopilot_upstream_errors_total", "Failed upstream (LLM or embeddings) operations",
+    ["operation", "error"]
+)
+
+
+# --- Recorders ---
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def observe_timings(timings):
+    """Record every stage of an inference result's timings dict."""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def upstream_error(operation, error):
+    UPSTREAM_ERRORS.labels(operation, type(error).__name__).inc()
+
+
+@contextmanager
+def upstream_call(operation):
+    """Count an exception raised inside the block as a failed upstream call, then re-raise it."""
+    try:
+        yield
+    except Exception as e:
+        upstream_error(operation, e)
+        raise
+
+
+@contextmanager
+def stage_timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+# --- Per-request stage timings from deeper layers ---
+# (timings dict, enclosing block's [nested seconds]) for the request being prepared
+_request_timings = contextvars.ContextVar("medcopilot_request_timings", default=None)
+
+
+@contextmanager
+def collect_timings(timings):
+    """Let timed() blocks in this context (and threads/tasks started from it) add to timings."""
+    token = _request_timings.set((timings, [0.0]))
+    try:
+        yield
+    finally:
+        _request_timings.reset(token)
+
+
+@contextmanager
+def timed(stage):
+    """
+    Add the block's own time to the current request's timings[stage]. Time
+    spent in nested timed() blocks (an embedding inside a similarity search)
+    counts only for the nested stage. A no-op outside collect_timings.
+    """
+    current = _request_timings.get()
+    if current is None:
+        yield
+        return
+    timings, parent = current
+    nested = [0.0]
+    token = _request_timings.set((timings, nested))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _request_timings.reset(token)
+        timings[stage] = timings.get(stage, 0.0) + max(0.0, elapsed - nested[0])
+        parent[0] += elapsed
+
+
+def request_started(endpoint):
+    IN_FLIGHT.labels(endpoint).inc()
+    return time.perf_counter()
+
+
+def request_finished(endpoint, status, start):
+    IN_FLIGHT.labels(endpoint).dec()
+    REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+    REQUESTS.labels(endpoint, str(status)).inc()
+
+
+# --- Exposition ---
+def enabled():
+    return Counter is not None
+
+
+def render():
+    """(body, content type) of the Prometheus text exposition, aggregated over workers in multiprocess mode."""
+    if not enabled():
+        return b"# prometheus_client is not installed\n", CONTENT_TYPE_LATEST
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """gunicorn child_exit hook: drop a dead worker's live gauges."""
+    if enabled() and os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# --- Generic micro-batcher ---
+class MicroBatcher:
+    """
+    Collects items submitted from many threads into batches.
+
+    A batch closes when it holds max_batch items or max_wait_ms after its
+    first item arrived, whichever comes first. process_batch(items) must
+    return one result per item, in order; it runs on a thread pool of
+    `workers` threads so a slow batch does not stop the next one forming.
+    """
+
+    def __init__(self, process_batch, max_batch=16, max_wait_ms=10, workers=1, name="microbatch"):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._collector = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """Queue one item; returns a concurrent.futures.Future for its result."""
+        self._ensure_collector()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0
+        }
+
+    def _ensure_collector(self):
+        if self._collector is None:
+            with self._lock:
+                if self._collector is None:
+                    self._collector = threading.Thread(target=self._collect, name=f"{self.name}-collector", daemon=True)
+                    self._collector.start()
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._pool.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            results = list(self.process_batch([item for item, _ in batch]))
+            if len(results) != len(batch):
+                raise ValueError(f"{self.name}: process_batch returned {len(results)} results for {len(batch)} items")
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                # A cancelled caller (asyncio.wrap_future) must not fail its batch-mates
+                if future.set_running_or_notify_cancel():
+                    future.set_result(result)
+        except Exception as e:
+            # Never leave a caller blocked on result(); resolved futures keep their result
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
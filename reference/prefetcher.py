@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from reference.embeddingscheduler import make_token_counter
+from reference.responsecache import ResponseCache
+
+
+# --- Speculative follow-up prefetch ---
+class FollowupPrefetcher:
+    """
+    Warms the caches for follow-up questions the user is likely to click.
+
+    In "retrieval" mode the questions are embedded in one batch and each
+    is retrieved through engine.prefetch_documents; the documents wait
+    here (keyed by question and store generation) until the click's
+    retrieval takes them. In "answer" mode each question is also answered
+    through engine.run_inference, which puts the answer in the response
+    and semantic caches. Only follow-ups of stateless
+    requests get answers, because a click that carries session history
+    bypasses those caches. Prefetching runs on a small pool off the
+    request path. Answer spend is capped per session (or per originating
+    answer) and per minute.
+
+    stats() reports prefetched retrievals and answers, clicks served from
+    them (hits), and estimated tokens spent on answers that were never
+    clicked (waste).
+    These counts are per process.
+    """
+
+    def __init__(self, engine, mode="retrieval", max_tokens_per_session=8000, max_answers_per_minute=20,
+                 max_tokens_per_minute=60000, workers=1, max_queue=16, max_documents=256, token_counter=None):
+        self.engine = engine
+        self.mode = mode
+        self.max_tokens_per_session = max_tokens_per_session
+        self.max_answers_per_minute = max_answers_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.max_queue = max_queue
+        self.max_documents = max_documents
+        self.embedded = 0
+        self.retrieved = 0
+        self.retrieval_hits = 0
+        self.answers = 0
+        self.already_cached = 0
+        self.tokens_spent = 0
+        self.hits = 0
+        self.hit_tokens = 0
+        self.over_budget = 0
+        self.dropped = 0
+        self._count_tokens = token_counter
+        self._queued = 0
+        self._recent = deque()
+        self._session_spend = OrderedDict()
+        self._prefetched = OrderedDict()
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+
+    @classmethod
+    def from_env(cls, engine):
+        """Build the prefetcher from PREFETCH_* environment variables; None unless PREFETCH is retrieval or answer."""
+        mode = os.getenv("PREFETCH", "off").lower()
+        if mode not in ("retrieval", "answer"):
+            return None
+        return cls(
+            engine,
+            mode=mode,
+            max_tokens_per_session=int(os.getenv("PREFETCH_MAX_TOKENS_PER_SESSION", "8000")),
+            max_answers_per_minute=int(os.getenv("PREFETCH_MAX_ANSWERS_PER_MINUTE", "20")),
+            max_tokens_per_minute=int(os.getenv("PREFETCH_MAX_TOKENS_PER_MINUTE", "60000")),
+            workers=int(os.getenv("PREFETCH_WORKERS", "1")),
+            max_queue=int(os.getenv("PREFETCH_MAX_QUEUE", "16")),
+            max_documents=int(os.getenv("PREFETCH_MAX_DOCUMENTS", "256")),
+        )
+
+    def count_tokens(self, text):
+        if self._count_tokens is None:
+            self._count_tokens = make_token_counter("gpt-4o")
+        return self._count_tokens(text)
+
+    # --- Scheduling ---
+    def submit(self, questions, origin, stateless=True):
+        """Queue a prefetch of questions; dropped when the queue is full. origin keys the per-session budget."""
+        questions = [q for q in questions if q]
+        if not questions:
+            return False
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self.dropped += 1
+                return False
+            self._queued += 1
+        self._pool.submit(self._run, questions, origin, stateless)
+        return True
+
+    def _run(self, questions, origin, stateless):
+        try:
+            # One batched upstream call; each click then hits the embedding cache
+            self.engine.prime_embeddings(questions)
+            self.embedded += len(questions)
+            for question in questions:
+                self._retrieve(question)
+            # Answers only pay off when a click can be served from a cache
+            caches = getattr(self.engine, "response_cache", None) or getattr(self.engine, "semantic_cache", None)
+            if self.mode != "answer" or not stateless or caches is None:
+                return
+            for question in questions:
+                if not self._admit(origin):
+                    self.over_budget += 1
+                    break
+                self._answer(question, origin)
+        except Exception as e:
+            print(f"⚠️ Warning: Follow-up prefetch failed: {e}")
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+    def _retrieve(self, question):
+        generation, docs = self.engine.prefetch_documents(question)
+        with self._lock:
+            self.retrieved += 1
+            self._documents[ResponseCache.normalize(question)] = (generation, docs)
+            self._documents.move_to_end(ResponseCache.normalize(question))
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def take_documents(self, question, generation):
+        """Documents prefetched for question against this store generation (each set is served once), else None."""
+        with self._lock:
+            entry = self._documents.pop(ResponseCache.normalize(question), None)
+            if entry is None or entry[0] != generation:
+                return None
+            self.retrieval_hits += 1
+        print(f"🔮 Prefetched retrieval hit for: {question}")
+        return entry[1]
+
+    def _answer(self, question, origin):
+        with self._lock:
+            if ResponseCache.normalize(question) in self._prefetched:
+                self.already_cached += 1
+                return
+        results = self.engine.run_inference(question, maintain_history=False)
+        if results.get("error"):
+            return
+        if (results.get("response_cache") or {}).get("hit") or (results.get("semantic_cache") or {}).get("hit"):
+            self.already_cached += 1
+            return
+        context_tokens = (results.get("context_tokens") or {}).get("tokens_out", 0)
+        tokens = context_tokens + self.count_tokens(question) + self.count_tokens(results.get("answer", ""))
+        now = time.monotonic()
+        with self._lock:
+            self.answers += 1
+            self.tokens_spent += tokens
+            self._recent.append((now, tokens))
+            self._session_spend[origin] = self._session_spend.get(origin, 0) + tokens
+            self._session_spend.move_to_end(origin)
+            self._prefetched[ResponseCache.normalize(question)] = tokens
+            for bounded in (self._session_spend, self._prefetched):
+                while len(bounded) > 10000:
+                    bounded.popitem(last=False)
+        print(f"🔮 Prefetched an answer for: {question} (~{tokens} tokens)")
+
+    def _admit(self, origin):
+        """True while the origin's budget and the per-minute caps leave room for another answer."""
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0][0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_answers_per_minute:
+                return False
+            if sum(tokens for _, tokens in self._recent) >= self.max_tokens_per_minute:
+                return False
+            return self._session_spend.get(origin, 0) < self.max_tokens_per_session
+
+    # --- Metrics ---
+    def record_hit(self, question):
+        """Count a cache hit on a prefetched answer (each prefetched answer counts once)."""
+        with self._lock:
+            tokens = self._prefetched.pop(ResponseCache.normalize(question), None)
+            if tokens is None:
+                return False
+            self.hits += 1
+            self.hit_tokens += tokens
+        print(f"🔮 Prefetch hit for: {question}")
+        return True
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "embedded": self.embedded,
+            "retrieved": self.retrieved,
+            "retrieval_hits": self.retrieval_hits,
+            "answers": self.answers,
+            "already_cached": self.already_cached,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.answers, 4) if self.answers else 0.0,
+            "tokens_spent": self.tokens_spent,
+            "wasted_tokens": self.tokens_spent - self.hit_tokens,
+            "over_budget": self.over_budget,
+            "dropped": self.dropped
+        }
@@ -537,6 +537,13 @@ class PromptCategories:
         "Make your JSON output concise and valid."
         )
     
+    summary_template = (
+        "Summarize this conversation between a physician and a clinical assistant in at most {max_words} words. "
+        "Keep the patient details, the questions asked and the recommendations given; drop pleasantries.\n"
+        "Earlier summary: {summary}\n"
+        "Recent turns:\n{turns}"
+        )
+
     references_template = (
         "You are an expert at identifying the relevant medical literature metadata for a given query"
         "List most recent medical guidelines and publications that are relevant to the query."
@@ -594,6 +601,111 @@ class PromptCategories:
                 "Medication Safety & Drug Interactions" : medication_safety,
                 "Other" : other
             }
+
+    # Example questions used by the local embedding router (categoryrouter.py)
+    category_exemplars = {
+                "Disease Overview & Learning About a Condition" : [
+                    "What is eosinophilic esophagitis?",
+                    "Give me an overview of ulcerative colitis",
+                    "Explain celiac disease and how it presents",
+                ],
+                "Treatment Recommendation" : [
+                    "What is the first-line treatment for hypertension?",
+                    "How should moderate to severe Crohn's disease be treated?",
+                    "What is the recommended therapy for H. pylori infection?",
+                ],
+                "Diagnosis & Workup" : [
+                    "How do you diagnose acute pancreatitis?",
+                    "What is the workup for iron deficiency anemia?",
+                    "Which tests confirm a diagnosis of celiac disease?",
+                ],
+                "Screening & Surveillance" : [
+                    "When should colorectal cancer screening start?",
+                    "What is the surveillance interval for Barrett's esophagus without dysplasia?",
+                    "Who should be screened for hepatocellular carcinoma?",
+                ],
+                "Drug Therapy" : [
+                    "What is the dosing of vedolizumab for ulcerative colitis?",
+                    "Which biologic is preferred for perianal Crohn's disease?",
+                    "How long should proton pump inhibitors be continued for GERD?",
+                ],
+                "Procedural & Surgical Considerations" : [
+                    "When is colectomy indicated in ulcerative colitis?",
+                    "What are the indications for ERCP in choledocholithiasis?",
+                    "How should anticoagulation be managed before endoscopy?",
+                ],
+                "Risk Factors & Preventive Strategies" : [
+                    "What are the risk factors for gastric cancer?",
+                    "How can recurrence of diverticulitis be prevented?",
+                    "Does aspirin reduce the risk of colorectal cancer?",
+                ],
+                "Artificial Intelligence in Medicine" : [
+                    "How is artificial intelligence used in colonoscopy?",
+                    "What is the evidence for computer-aided polyp detection?",
+                    "Can machine learning predict GI bleeding outcomes?",
+                ],
+                "Clinical Decision-Making" : [
+                    "Should this patient with cirrhosis receive a TIPS or repeat paracentesis?",
+                    "How do I choose between surgery and medical therapy for achalasia?",
+                    "What is the best next step for a patient with refractory GERD?",
+                ],
+                "Patient Counseling & Education" : [
+                    "How do I explain a colonoscopy prep to a patient?",
+                    "What should patients with IBS know about their diet?",
+                    "How do I counsel a patient newly diagnosed with hepatitis B?",
+                ],
+                "Emerging Research & Novel Therapies" : [
+                    "What new therapies are in trials for eosinophilic esophagitis?",
+                    "What is the latest research on fecal microbiota transplantation?",
+                    "Are there novel treatments for MASH?",
+                ],
+                "Pathophysiology & Mechanisms of Disease" : [
+                    "What is the mechanism of hepatic encephalopathy?",
+                    "How does portal hypertension develop in cirrhosis?",
+                    "What is the pathophysiology of irritable bowel syndrome?",
+                ],
+                "Biomarkers & Diagnostic Tools" : [
+                    "How useful is fecal calprotectin in IBD?",
+                    "What is the role of elastography in liver fibrosis?",
+                    "Which biomarkers predict response to anti-TNF therapy?",
+                ],
+                "Lifestyle & Diet in Disease Management" : [
+                    "Does a low FODMAP diet help IBS?",
+                    "What lifestyle changes are recommended for fatty liver disease?",
+                    "Which foods should be avoided with GERD?",
+                ],
+                "Complementary & Alternative Medicine" : [
+                    "Do probiotics help ulcerative colitis?",
+                    "Is peppermint oil effective for irritable bowel syndrome?",
+                    "Is acupuncture useful for functional dyspepsia?",
+                ],
+                "Public Health & Epidemiology" : [
+                    "What is the incidence of colorectal cancer in young adults?",
+                    "How prevalent is hepatitis C worldwide?",
+                    "What are the trends in inflammatory bowel disease incidence?",
+                ],
+                "Healthcare Policy & Cost Considerations" : [
+                    "Is colorectal cancer screening with FIT cost-effective?",
+                    "How does insurance coverage affect access to biologics?",
+                    "What are the costs of hepatitis C treatment?",
+                ],
+                "Special Populations" : [
+                    "How should IBD be managed during pregnancy?",
+                    "What are the considerations for GI bleeding in elderly patients?",
+                    "How is celiac disease managed in children?",
+                ],
+                "Medication Safety & Drug Interactions" : [
+                    "What are the side effects of long-term PPI use?",
+                    "Does clopidogrel interact with omeprazole?",
+                    "Is methotrexate safe in patients with liver disease?",
+                ],
+                "Other" : [
+                    "What is the weather forecast for tomorrow?",
+                    "Write a short poem about the ocean",
+                    "How do I reset my password?",
+                    "Who won the football game last night?",
+                ],
+            }
     
     def get_prompt(self, category):
         #return self.prompt_categories[category]
@@ -602,6 +714,9 @@ class PromptCategories:
     
     def get_categories(self):
         return list(self.prompt_categories.keys())
+
+    def get_category_exemplars(self):
+        return self.category_exemplars
     
     def get_followup_template(self):
         return self.followup_template
@@ -609,5 +724,8 @@ class PromptCategories:
     def get_classification_template(self):
         return self.classification_template
 
+    def get_summary_template(self):
+        return self.summary_template
+
     def get_references_template(self):  
         return self.references_template
\ No newline at end of file
@@ -0,0 +1,94 @@
+import threading
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+
+
+def compile_text(text, variables):
+    """
+    Template text with every brace escaped except {variable} for the named
+    variables, so literal braces (the JSON example of the follow-up prompt)
+    are not parsed as inputs. Tuples of strings are joined first.
+    """
+    if isinstance(text, (tuple, list)):
+        text = "".join(text)
+    escaped = text.replace("{", "{{").replace("}", "}}")
+    for name in variables:
+        escaped = escaped.replace("{{" + name + "}}", "{" + name + "}")
+    return escaped
+
+
+# --- Precompiled prompts and chains ---
+class PromptRegistry:
+    """
+    Every PromptCategories prompt parsed once: a RAG ChatPromptTemplate per
+    category (system prompt with {context}, a MessagesPlaceholder for the
+    conversation history, then the question), plus the classification,
+    follow-up and summary templates. Chains (prompt | llm | parser) are
+    built for all of them the first time an LLM is bound, and rebuilt only
+    if the LLM object changes.
+    """
+
+    HISTORY = "history"
+
+    def __init__(self, prompt_categories):
+        self.prompt_categories = prompt_categories
+        self.rag_prompts = {}
+        by_text = {}
+        for category in prompt_categories.get_categories():
+            system_prompt = prompt_categories.get_prompt(category)
+            # Categories sharing a system prompt share one compiled template
+            if system_prompt not in by_text:
+                by_text[system_prompt] = self._rag_prompt(system_prompt)
+            self.rag_prompts[category] = by_text[system_prompt]
+        self.default_prompt = self._rag_prompt(prompt_categories.get_prompt(None))
+
+        self.prompts = {
+            "classification": PromptTemplate.from_template(
+                compile_text(prompt_categories.get_classification_template(), ["query", "context"])
+            ),
+            "followup": PromptTemplate.from_template(
+                compile_text(prompt_categories.get_followup_template(),
+                             ["original_question", "previous_answer", "context"])
+            ),
+            "summary": PromptTemplate.from_template(
+                compile_text(prompt_categories.get_summary_template(), ["max_words", "summary", "turns"])
+            ),
+        }
+        self._llm = None
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def _rag_prompt(self, system_prompt):
+        system = compile_text(system_prompt, ["context"])
+        # Add context if missing
+        if "{context}" not in system:
+            system = f"{system}\n\nContext:\n{{context}}"
+        return ChatPromptTemplate.from_messages([
+            ("system", system),
+            MessagesPlaceholder(self.HISTORY, optional=True),
+            ("human", "{input}"),
+        ])
+
+    def rag_prompt(self, category):
+        return self.rag_prompts.get(category, self.default_prompt)
+
+    # --- Chains ---
+    def rag_chain(self, category, llm):
+        chains = self.bind(llm)
+        return chains["rag"].get(id(self.rag_prompt(category)))
+
+    def chain(self, name, llm):
+        """The classification, followup or summary chain for llm."""
+        return self.bind(llm)[name]
+
+    def bind(self, llm):
+        """Chains for llm, built for every prompt on the first call and whenever the LLM changes."""
+        with self._lock:
+            if llm is not self._llm or not self._chains:
+                parser = StrOutputParser()
+                prompts = {id(p): p for p in list(self.rag_prompts.values()) + [self.default_prompt]}
+                chains = {"rag": {key: prompt | llm | parser for key, prompt in prompts.items()}}
+                chains.update({name: prompt | llm | parser for name, prompt in self.prompts.items()})
+                self._llm, self._chains = llm, chains
+            return self._chains
@@ -0,0 +1,230 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from hashlib import sha256
+
+
+def to_payload(results):
+    """Reduce an inference result to the JSON shape /chat returns (see app.serialize)."""
+    return {
+        "input": results.get("input", ""),
+        "answer": results.get("answer", ""),
+        "context": [
+            item if isinstance(item, dict) else {
+                "metadata": getattr(item, "metadata", {}),
+                "page_content": getattr(item, "page_content", str(item))
+            }
+            for item in results.get("context", [])
+        ]
+    }
+
+
+# --- Exact-match response cache ---
+class ResponseCache:
+    """
+    Deterministic /chat response cache stored in SQLite, so every gunicorn
+    worker (and the next deployment) shares it.
+
+    The key combines the normalised question, the resolved prompt category,
+    the vector store generation and the LLM model name. Entries older than
+    max_age_seconds are never served, and the least recently used entries
+    are evicted once the payloads exceed max_bytes. Entries older than
+    fresh_seconds are "stale": hot ones (swr_min_hits or more hits) are
+    still served while the caller refreshes them in the background.
+    Hit counts and access times are buffered in memory and written at most
+    every hit_flush_seconds, so a hit is a read, not a write transaction.
+    """
+
+    def __init__(self, path, max_age_seconds=7 * 86400, max_bytes=256 * 1024 * 1024,
+                 fresh_seconds=86400, swr_min_hits=3, hit_flush_seconds=5):
+        self.path = path
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.swr_min_hits = swr_min_hits
+        self.hit_flush_seconds = hit_flush_seconds
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._pending_hits = {}
+        self._last_flush = time.time()
+        self._db = self._open_db(path)
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache from RESPONSE_CACHE_* environment variables; None unless RESPONSE_CACHE_PATH is set."""
+        path = os.getenv("RESPONSE_CACHE_PATH")
+        if not path:
+            return None
+        return cls(
+            path,
+            max_age_seconds=float(os.getenv("RESPONSE_CACHE_MAX_AGE", str(7 * 86400))),
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            fresh_seconds=float(os.getenv("RESPONSE_CACHE_FRESH_TTL", "86400")),
+            swr_min_hits=int(os.getenv("RESPONSE_CACHE_SWR_MIN_HITS", "3")),
+            hit_flush_seconds=float(os.getenv("RESPONSE_CACHE_HIT_FLUSH_SECONDS", "5")),
+        )
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+    def make_key(self, question, category, generation, model):
+        raw = "\x00".join([self.normalize(question), str(category), str(generation), str(model)])
+        return sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Return (payload, state) where state is "fresh", "stale" or "miss".
+        Stale entries that are not hot enough are reported as misses.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT payload, created, hits FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None, "miss"
+
+            payload, created, hits = row
+            age = now - created
+            if age > self.max_age_seconds:
+                self._pending_hits.pop(key, None)
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None, "miss"
+
+            pending = self._pending_hits.get(key, (0, now))[0]
+            if age > self.fresh_seconds and hits + pending < self.swr_min_hits:
+                return None, "miss"
+
+            self._pending_hits[key] = (pending + 1, now)
+            if now - self._last_flush >= self.hit_flush_seconds:
+                self._flush_hits()
+
+        state = "fresh" if age <= self.fresh_seconds else "stale"
+        return json.loads(payload), state
+
+    def put(self, key, payload, category=None, model=None):
+        data = json.dumps(payload)
+        now = time.time()
+        with self._lock:
+            self._flush_hits()
+            self._db.execute(
+                "INSERT INTO responses (key, question, category, model, payload, size, created, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0) "
+                "ON CONFLICT(key) DO UPDATE SET payload = excluded.payload, size = excluded.size, "
+                "created = excluded.created, last_access = excluded.last_access",
+                (key, payload.get("input", ""), category, model, data, len(data), now, now)
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def begin_refresh(self, key):
+        """Claim a background refresh for key; False if one is already running in this process."""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    # --- Admin helpers ---
+    def stats(self):
+        with self._lock:
+            self._flush_hits()
+            count, total, hits = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM responses"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "entries": count,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "max_age_seconds": self.max_age_seconds,
+            "fresh_seconds": self.fresh_seconds,
+            "swr_min_hits": self.swr_min_hits
+        }
+
+    def entries(self, limit=100):
+        now = time.time()
+        with self._lock:
+            self._flush_hits()
+            rows = self._db.execute(
+                "SELECT key, question, category, model, size, created, last_access, hits "
+                "FROM responses ORDER BY last_access DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [
+            {
+                "key": key,
+                "question": question,
+                "category": category,
+                "model": model,
+                "bytes": size,
+                "age_seconds": round(now - created, 1),
+                "idle_seconds": round(now - last_access, 1),
+                "hits": hits
+            }
+            for key, question, category, model, size, created, last_access, hits in rows
+        ]
+
+    def purge(self, key=None, older_than=None):
+        """Delete one entry, entries older than older_than seconds, or everything. Returns the count."""
+        with self._lock:
+            self._flush_hits()
+            if key is not None:
+                cursor = self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            elif older_than is not None:
+                cursor = self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - older_than,))
+            else:
+                cursor = self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            return cursor.rowcount
+
+    # --- Internals ---
+    def _flush_hits(self):
+        """Write buffered hit counts and access times (caller holds the lock)."""
+        self._last_flush = time.time()
+        if not self._pending_hits:
+            return
+        self._db.executemany(
+            "UPDATE responses SET hits = hits + ?, last_access = MAX(last_access, ?) WHERE key = ?",
+            [(count, accessed, key) for key, (count, accessed) in self._pending_hits.items()]
+        )
+        self._pending_hits.clear()
+        self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age_seconds,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the payloads fit again
+        for key, size in self._db.execute(
+            "SELECT key, size FROM responses ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def _open_db(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, question TEXT, category TEXT, model TEXT, payload TEXT NOT NULL, "
+            "size INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        db.commit()
+        return db
@@ -25,7 +25,7 @@ from langchain.chains import LLMChain
 import getpass
 import os
 
-from transformers import pipeline
+from reference.zeroshotclassifier import get_zero_shot_classifier
 from langchain.callbacks import get_openai_callback
 
 
@@ -117,7 +117,7 @@ class Inference:
         
         print(f"Vectorstore initialized with documents.")
         
-        #TBD: Pass hints to the retriever to use the metadata for the search
+        #TBD: Pass hints to the retriever to use the metadata for the search (only runinference2 filters on them)
         self.retriever = vectorstore.as_retriever()
         self.llm = ChatOpenAI(model="gpt-4o")
         self.rag_chains = {}
@@ -249,15 +249,13 @@ class Inference:
     Classify the given query into a category
     '''
     def classify_query(self, query):
-        ''' 
-        # Load a pre-trained model and tokenizer
-        classifier = pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
-        # Use the classifier to predict the category
-        result = classifier(query, candidate_labels=categories)
-        # Get the category with the highest score
-        category = result['labels'][0]
-        '''
-        return "Diagnosis and Differential Diagnosis"
+        # The bart-large-mnli pipeline is loaded once per process and shared;
+        # concurrent queries are micro-batched into one forward pass
+        try:
+            return get_zero_shot_classifier(categories).classify(query)
+        except Exception as e:
+            print(f"Error classifying query, using default category: {e}")
+            return "Diagnosis and Differential Diagnosis"
 
     '''
     Create a RAG chain 
@@ -1,6 +1,10 @@
 #from datetime import datetime
+import asyncio
 import sys
-#import os
+import os
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -16,15 +20,29 @@ if sys.platform == "linux":
 
 # LangChain and project imports
 from reference.promptcategories import PromptCategories
+from reference.promptregistry import PromptRegistry
+from reference.embeddingcache import CachedEmbeddings
+from reference.embeddingcoalescer import CoalescingEmbeddings
+from reference.semanticcache import SemanticCache
+from reference.responsecache import ResponseCache, to_payload
+from reference.categoryrouter import CategoryRouter
+from reference.storeversion import get_store_generation
+from reference.hybridretriever import HybridRetriever
+from reference.documentmetadata import prefer_doc_types, query_filter
+from reference.contextassembly import ContextAssembler
+from reference.sessionstore import SessionStore
+from reference.followupjobs import FollowupJobs, parse_questions
+from reference.prefetcher import FollowupPrefetcher
+from reference.zeroshotclassifier import get_zero_shot_classifier
+from reference import metrics
+from reference.fakebackends import FakeChatModel, FakeEmbeddings, embeddings_backend, llm_backend
 
 # LangChain 1.0 imports - use split packages and LCEL
-from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.documents import Document
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
 
 
 # --- Mock retriever for fallback ---
@@ -34,6 +52,10 @@ class MockRetriever:
         """LangChain 1.0 uses invoke instead of get_relevant_documents"""
         return [Document(page_content="This is a mock document for testing purposes.", metadata={})]
     
+    async def ainvoke(self, query):
+        """Async counterpart of invoke"""
+        return self.invoke(query)
+
     def get_relevant_documents(self, query):
         """Backwards compatibility"""
         return self.invoke(query)
@@ -48,7 +70,33 @@ class Inference:
         self.conversation_history = []
         self.retriever = None
         self.llm = None
+        self.embeddings = None
         self.promt_categories = PromptCategories()
+        # Every prompt is parsed once here; chains are built once per LLM
+        self.prompts = PromptRegistry(self.promt_categories)
+        self.semantic_cache = SemanticCache.from_env(lambda: get_store_generation(self.storeLocation))
+        self.response_cache = ResponseCache.from_env()
+        self.category_router = None
+        # LLM classifications by normalised question, so a repeat skips the call
+        self._classifications = OrderedDict()
+        self._classifications_lock = threading.Lock()
+        # Optional local zero-shot model tried before the LLM classifier
+        self.zero_shot = (
+            get_zero_shot_classifier(self.promt_categories.get_categories())
+            if os.getenv("ZERO_SHOT_CLASSIFIER", "0").lower() in ("1", "true", "on") else None
+        )
+        # Year/society/category hints become Chroma where filters (see _retrieve)
+        self.metadata_filters = os.getenv("METADATA_FILTERS", "1").lower() not in ("0", "false", "off")
+        self.recent_years = int(os.getenv("METADATA_RECENT_YEARS", "5"))
+        # Deduplicated, merged and token-budgeted {context} (see _assemble_context)
+        self.context_assembler = ContextAssembler.from_env()
+        # Per-client conversation history, keyed by session id (see _history)
+        self.session_store = SessionStore.from_env(self._summarize_turns)
+        # Follow-up questions are generated off the request path, on demand
+        self.followups = FollowupJobs.from_env(self._followup_lines, on_done=self._prefetch_followups)
+        # Optional speculative warm-up of the caches for likely follow-up clicks
+        self.prefetcher = FollowupPrefetcher.from_env(self)
+        self._init_lock = threading.Lock()
 
     # --- Initialize Chroma and LLM lazily ---
     def _initialize_components(self):
@@ -56,45 +104,115 @@ class Inference:
         if self.retriever and self.llm:
             return  # Already initialized
 
+        # Threaded workers may race on the first request; build clients once
+        with self._init_lock:
+            if self.retriever and self.llm:
+                return
+            with metrics.stage_timer("init"):
+                self._build_components()
+
+    async def _ainitialize_components(self):
+        """Async counterpart: client construction blocks, so it runs off the event loop."""
+        if self.retriever and self.llm:
+            return
+        await asyncio.to_thread(self._initialize_components)
+
+    def _build_components(self):
+        """Create whichever of the retriever and LLM clients are still missing (called under _init_lock)."""
         # ✅ Initialize Chroma
-        try:
-            if not os.path.exists(self.storeLocation):
-                print(f"Creating missing vectorstore directory: {self.storeLocation}")
-                os.makedirs(self.storeLocation, exist_ok=True)
-
-            print("Initializing Chroma vectorstore...")
-            vectorstore = Chroma(
-                collection_name="medcopilot",
-                persist_directory=self.storeLocation,
-                embedding_function=OpenAIEmbeddings()
-            )
-            self.retriever = vectorstore.as_retriever()
-            print("✅ Chroma vectorstore initialized successfully.")
-        except Exception as e:
-            print(f"⚠️ Warning: Could not initialize vectorstore: {e}")
-            print("Fallback: Using MockRetriever.")
-            self.retriever = MockRetriever()
+        if self.retriever is None:
+            try:
+                if not os.path.exists(self.storeLocation):
+                    print(f"Creating missing vectorstore directory: {self.storeLocation}")
+                    os.makedirs(self.storeLocation, exist_ok=True)
+
+                print("Initializing Chroma vectorstore...")
+                # Repeated questions skip the embedding round trip; concurrent
+                # new ones share one upstream request
+                if embeddings_backend() == "fake":
+                    upstream = FakeEmbeddings.from_env()
+                else:
+                    # EMBEDDING_CHECK_CTX_LENGTH=0 skips client-side tiktoken chunking of
+                    # queries (short questions never reach the context limit)
+                    upstream = OpenAIEmbeddings(
+                        check_embedding_ctx_length=os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "1") != "0"
+                    )
+                self.embeddings = CachedEmbeddings.from_env(CoalescingEmbeddings.from_env(upstream))
+                vectorstore = Chroma(
+                    collection_name="medcopilot",
+                    persist_directory=self.storeLocation,
+                    embedding_function=self.embeddings
+                )
+                # BM25 + vector fusion when ingestion has built the lexical index
+                self.retriever = (
+                    HybridRetriever.from_env(vectorstore, self.storeLocation) or vectorstore.as_retriever()
+                )
+                print("✅ Chroma vectorstore initialized successfully.")
+                self._build_router()
+            except Exception as e:
+                print(f"⚠️ Warning: Could not initialize vectorstore: {e}")
+                print("Fallback: Using MockRetriever.")
+                self.retriever = MockRetriever()
 
         # ✅ Initialize LLM (ChatOpenAI)
+        if self.llm is None and llm_backend() == "fake":
+            print("Using the offline fake LLM backend.")
+            self.llm = FakeChatModel.from_env()
+        if self.llm is None:
+            try:
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise ValueError("Missing OPENAI_API_KEY environment variable.")
+
+                print("Initializing ChatOpenAI model...")
+                self.llm = ChatOpenAI(model="gpt-4o", temperature=0.3)
+                print("✅ ChatOpenAI initialized successfully.")
+            except Exception as e:
+                print(f"⚠️ Warning: Could not initialize ChatOpenAI: {e}")
+                self.llm = None
+
+        # Build every chain now rather than on the first request
+        if self.llm is not None:
+            self.prompts.bind(self.llm)
+
+    def _build_router(self):
+        """Embed the prompt categories once so classification needs no LLM call."""
         try:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                raise ValueError("Missing OPENAI_API_KEY environment variable.")
+            router = CategoryRouter.from_env(self.embeddings, self.promt_categories)
+            self.category_router = router.fit() if router else None
+        except Exception as e:
+            print(f"⚠️ Warning: Could not build category router, using LLM classification: {e}")
+            self.category_router = None
 
-            print("Initializing ChatOpenAI model...")
-            self.llm = ChatOpenAI(model="gpt-4o", temperature=0.3)
-            print("✅ ChatOpenAI initialized successfully.")
+    def warm_up(self):
+        """Eagerly build the retriever and LLM clients so the first request is not cold."""
+        self._initialize_components()
+        return self.retriever is not None and self.llm is not None
+
+    def prime_embeddings(self, queries):
+        """Embed many queries in one upstream call so later per-query lookups hit the embedding cache."""
+        self._initialize_components()
+        if not isinstance(self.embeddings, CachedEmbeddings) or not queries:
+            return
+        try:
+            self.embeddings.embed_queries(list(queries))
         except Exception as e:
-            print(f"⚠️ Warning: Could not initialize ChatOpenAI: {e}")
-            self.llm = None
+            print(f"⚠️ Warning: Could not pre-embed batch queries: {e}")
 
     # --- Main inference runner ---
-    def run_inference(self, query, maintain_history=True):
+    def run_inference(self, query, maintain_history=True, session_id=None):
         print(f"Running inference for query: {query}")
         self._initialize_components()
 
         try:
-            results = self.query_reasoning(query, maintain_history)
+            history = self._history(maintain_history, session_id)
+            timings = {}
+            cached, vector, cache_info = self._semantic_lookup(query, history, timings)
+            if cached is not None:
+                self._remember(query, cached, maintain_history, session_id)
+                return cached
+            results = self.query_reasoning(query, maintain_history, session_id, timings=timings)
+            self._semantic_store(vector, results, cache_info)
         except Exception as e:
             print(f"❌ Error during inference: {e}")
             results = {
@@ -105,74 +223,635 @@ class Inference:
 
         return results
 
-    # --- Reasoning logic ---
-    def query_reasoning(self, query, maintain_history=True):
+    async def arun_inference(self, query, maintain_history=True, session_id=None):
+        """Async counterpart of run_inference (ainvoke end to end)."""
+        print(f"Running async inference for query: {query}")
+        await self._ainitialize_components()
+
         try:
-            prompt_category = self.classify_prompt_category(query)[0]
-            system_prompt = self.promt_categories.get_prompt(prompt_category)
-            print(f"🧠 System prompt category: {prompt_category}")
+            history = await self._ahistory(maintain_history, session_id)
+            timings = {}
+            cached, vector, cache_info = await self._asemantic_lookup(query, history, timings)
+            if cached is not None:
+                await self._aremember(query, cached, maintain_history, session_id)
+                return cached
+            results = await self.aquery_reasoning(query, maintain_history, session_id, timings=timings)
+            self._semantic_store(vector, results, cache_info)
+        except Exception as e:
+            print(f"❌ Error during inference: {e}")
+            results = {
+                "input": query,
+                "context": [],
+                "answer": "An internal error occurred while generating a response."
+            }
 
-            messages = [("system", system_prompt)]
+        return results
 
-            # Maintain conversation history
-            if maintain_history and self.conversation_history:
-                for msg in self.conversation_history:
-                    if isinstance(msg, HumanMessage):
-                        messages.append(("human", msg.content))
-                    elif isinstance(msg, AIMessage):
-                        messages.append(("ai", msg.content))
+    # --- Reasoning logic ---
+    def query_reasoning(self, query, maintain_history=True, session_id=None, timings=None):
+        """timings: stage timings recorded so far (run_inference passes the semantic lookup's embedding)."""
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        try:
+            history = self._history(maintain_history, session_id)
+            prepared, cache_key, results = self._prepare(query, history, timings, start)
+            if results is None:
+                rag_chain, inputs, docs, assembly = self._build_chain(query, prepared, history)
+
+                # The documents retrieved above feed both {context} and the response
+                generate_start = time.perf_counter()
+                with metrics.upstream_call("generate"):
+                    answer = rag_chain.invoke(inputs)
+                timings["generate"] = time.perf_counter() - generate_start
+
+                results = self._results(query, answer, docs, timings, assembly)
+                self._response_cache_store(cache_key, results, prepared)
+            self._remember(query, results, maintain_history, session_id)
+        except Exception as e:
+            print(f"❌ An error occurred in query_reasoning: {e}")
+            results = self._error_results(query, timings, e)
 
-            messages.append(("human", "{input}"))
+        self._finish_timings(timings, start)
+        return results
 
-            # Add context if missing
-            if "{context}" not in messages[0][1]:
-                messages[0] = ("system", f"{messages[0][1]}\n\nContext:\n{{context}}")
+    async def aquery_reasoning(self, query, maintain_history=True, session_id=None, timings=None):
+        """Async counterpart of query_reasoning."""
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        try:
+            history = await self._ahistory(maintain_history, session_id)
+            prepared, cache_key, results = await self._aprepare(query, history, timings, start)
+            if results is None:
+                rag_chain, inputs, docs, assembly = self._build_chain(query, prepared, history)
+
+                generate_start = time.perf_counter()
+                with metrics.upstream_call("generate"):
+                    answer = await rag_chain.ainvoke(inputs)
+                timings["generate"] = time.perf_counter() - generate_start
+
+                results = self._results(query, answer, docs, timings, assembly)
+                await asyncio.to_thread(self._response_cache_store, cache_key, results, prepared)
+            await self._aremember(query, results, maintain_history, session_id)
+        except Exception as e:
+            print(f"❌ An error occurred in aquery_reasoning: {e}")
+            results = self._error_results(query, timings, e)
 
-            prompt = ChatPromptTemplate.from_messages(messages)
+        self._finish_timings(timings, start)
+        return results
 
-            # Build LCEL RAG pipeline (LangChain 1.0 style)
-            rag_chain = (
-                {
-                    "context": self.retriever | RunnableLambda(self._format_docs),
-                    "input": RunnablePassthrough()
-                }
-                | prompt
-                | self.llm
-                | StrOutputParser()
+    def stream_reasoning(self, query, maintain_history=True, session_id=None):
+        """
+        Streaming variant of query_reasoning.
+        Yields (event, payload) tuples: ("context", docs) as soon as retrieval
+        finishes, ("token", text) for every generated chunk, then ("end", results).
+        """
+        self._initialize_components()
+        history = self._history(maintain_history, session_id)
+        timings = {}
+        cached, vector, cache_info = self._semantic_lookup(query, history, timings)
+        if cached is not None:
+            self._remember(query, cached, maintain_history, session_id)
+            yield from self._replay_cached(cached)
+            return
+
+        start = time.perf_counter()
+        try:
+            prepared, cache_key, results = self._prepare(query, history, timings, start)
+            if results is not None:
+                yield "context", results["context"]
+                yield "token", results["answer"]
+            else:
+                rag_chain, inputs, docs, assembly = self._build_chain(query, prepared, history)
+                yield "context", docs
+
+                parts = []
+                generate_start = time.perf_counter()
+                with metrics.upstream_call("generate"):
+                    for chunk in rag_chain.stream(inputs):
+                        if not chunk:
+                            continue
+                        if not parts:
+                            self._record_ttft(timings, start)
+                        parts.append(chunk)
+                        yield "token", chunk
+                timings["generate"] = time.perf_counter() - generate_start
+
+                results = self._results(query, "".join(parts), docs, timings, assembly)
+                self._response_cache_store(cache_key, results, prepared)
+            self._remember(query, results, maintain_history, session_id)
+        except Exception as e:
+            print(f"❌ An error occurred in stream_reasoning: {e}")
+            results = self._error_results(query, timings, e)
+
+        self._finish_timings(timings, start)
+        self._semantic_store(vector, results, cache_info)
+        yield "end", results
+
+    async def astream_reasoning(self, query, maintain_history=True, session_id=None):
+        """Async counterpart of stream_reasoning."""
+        await self._ainitialize_components()
+        history = await self._ahistory(maintain_history, session_id)
+        timings = {}
+        cached, vector, cache_info = await self._asemantic_lookup(query, history, timings)
+        if cached is not None:
+            await self._aremember(query, cached, maintain_history, session_id)
+            for event in self._replay_cached(cached):
+                yield event
+            return
+
+        start = time.perf_counter()
+        try:
+            prepared, cache_key, results = await self._aprepare(query, history, timings, start)
+            if results is not None:
+                yield "context", results["context"]
+                yield "token", results["answer"]
+            else:
+                rag_chain, inputs, docs, assembly = self._build_chain(query, prepared, history)
+                yield "context", docs
+
+                parts = []
+                generate_start = time.perf_counter()
+                with metrics.upstream_call("generate"):
+                    async for chunk in rag_chain.astream(inputs):
+                        if not chunk:
+                            continue
+                        if not parts:
+                            self._record_ttft(timings, start)
+                        parts.append(chunk)
+                        yield "token", chunk
+                timings["generate"] = time.perf_counter() - generate_start
+
+                results = self._results(query, "".join(parts), docs, timings, assembly)
+                await asyncio.to_thread(self._response_cache_store, cache_key, results, prepared)
+            await self._aremember(query, results, maintain_history, session_id)
+        except Exception as e:
+            print(f"❌ An error occurred in astream_reasoning: {e}")
+            results = self._error_results(query, timings, e)
+
+        self._finish_timings(timings, start)
+        self._semantic_store(vector, results, cache_info)
+        yield "end", results
+
+    # --- Exact-match response cache ---
+    def _model_name(self):
+        return getattr(self.llm, "model_name", None) or type(self.llm).__name__
+
+    def _response_cache_usable(self, history):
+        # Answers that depend on conversation history are never shared
+        return self.response_cache is not None and not history
+
+    def _response_cache_key(self, query, prepared, history):
+        if not self._response_cache_usable(history):
+            return None
+        generation = get_store_generation(self.storeLocation)
+        return self.response_cache.make_key(query, prepared["category"], generation, self._model_name())
+
+    def _response_cache_hit(self, cache_key, query, prepared, timings):
+        """Return cached results for cache_key, refreshing stale hot entries in the background."""
+        if cache_key is None:
+            return None
+        payload, state = self.response_cache.get(cache_key)
+        metrics.cache_lookup("response", payload is not None)
+        if payload is None:
+            return None
+
+        print(f"🎯 Response cache {state} hit for: {query}")
+        self._record_prefetch_hit(query)
+        if state == "stale" and self.response_cache.begin_refresh(cache_key):
+            threading.Thread(
+                target=self._refresh_response, args=(cache_key, query, prepared), daemon=True
+            ).start()
+        return dict(payload, input=query, timings=timings, response_cache={"hit": True, "state": state})
+
+    def _refresh_response(self, cache_key, query, prepared):
+        """Stale-while-revalidate: regenerate a stale entry from freshly retrieved documents."""
+        try:
+            if "docs" not in prepared:
+                prepared = dict(prepared, docs=self._retrieve_prepared(prepared))
+            rag_chain, inputs, docs, _ = self._build_chain(query, prepared, [])
+            with metrics.upstream_call("refresh"):
+                answer = rag_chain.invoke(inputs)
+            self._response_cache_store(cache_key, {"input": query, "answer": answer, "context": docs}, prepared)
+            print(f"♻️ Response cache refreshed for: {query}")
+        except Exception as e:
+            print(f"⚠️ Warning: Response cache refresh failed: {e}")
+        finally:
+            self.response_cache.end_refresh(cache_key)
+
+    def _response_cache_store(self, cache_key, results, prepared):
+        if cache_key is None:
+            return
+        results["response_cache"] = {"hit": False, "state": "miss"}
+        # Only cache complete answers grounded in retrieved context
+        if results.get("error") or not results.get("context"):
+            return
+        try:
+            self.response_cache.put(
+                cache_key, to_payload(results), category=prepared["category"], model=self._model_name()
             )
-            
-            # Invoke the chain with the query
-            answer = rag_chain.invoke(query)
-            
-            # Get context documents separately for the response
-            docs = self.retriever.invoke(query)
-            
-            results = {
-                "input": query,
-                "answer": answer,
-                "context": docs
-            }
-
-            if maintain_history:
-                self._update_conversation_history(query, answer)
-
         except Exception as e:
-            print(f"❌ An error occurred in query_reasoning: {e}")
-            results = {
-                "input": query,
-                "answer": "Sorry, I couldn't process your request.",
-                "context": []
-            }
+            print(f"⚠️ Warning: Could not store response in cache: {e}")
+
+    # --- Semantic answer cache ---
+    def _semantic_enabled(self, history):
+        # Answers that depend on conversation history are never shared
+        if history:
+            return False
+        return self.semantic_cache is not None and self.embeddings is not None
+
+    def _semantic_lookup(self, query, history, timings):
+        """Return (cached results or None, query vector, cache info) for a question; the embedding is timed into timings."""
+        if not self._semantic_enabled(history):
+            return None, None, None
+        start = time.perf_counter()
+        try:
+            # The embedding cache makes the retrieval of the same text free afterwards
+            with metrics.collect_timings(timings):
+                vector = self.embeddings.embed_query(query)
+        except Exception as e:
+            print(f"⚠️ Warning: Semantic cache lookup skipped: {e}")
+            metrics.upstream_error("embed", e)
+            return None, None, None
+        return self._semantic_match(query, vector, start, timings)
+
+    async def _asemantic_lookup(self, query, history, timings):
+        if not self._semantic_enabled(history):
+            return None, None, None
+        start = time.perf_counter()
+        try:
+            with metrics.collect_timings(timings):
+                vector = await self.embeddings.aembed_query(query)
+        except Exception as e:
+            print(f"⚠️ Warning: Semantic cache lookup skipped: {e}")
+            metrics.upstream_error("embed", e)
+            return None, None, None
+        return self._semantic_match(query, vector, start, timings)
+
+    def _semantic_match(self, query, vector, start, timings):
+        payload, score = self.semantic_cache.lookup(vector)
+        cache_info = {
+            "hit": payload is not None,
+            "score": round(score, 4),
+            "hit_rate": round(self.semantic_cache.hit_rate(), 4)
+        }
+        metrics.cache_lookup("semantic", payload is not None)
+        if payload is None:
+            return None, vector, cache_info
+
+        print(f"🎯 Semantic cache hit (score {score:.3f}) for: {query}")
+        self._record_prefetch_hit(query)
+        timings["semantic_lookup"] = time.perf_counter() - start
+        self._finish_timings(timings, start)
+        cached = dict(payload, input=query, timings=timings, semantic_cache=cache_info)
+        cache_info["matched_input"] = payload["input"]
+        return cached, vector, cache_info
+
+    def _semantic_store(self, vector, results, cache_info):
+        if cache_info is None:
+            return
+        results["semantic_cache"] = cache_info
+        # Only cache complete answers grounded in retrieved context
+        if vector is None or results.get("error") or not results.get("context"):
+            return
+        self.semantic_cache.store(vector, {
+            "input": results["input"],
+            "answer": results["answer"],
+            "context": results["context"]
+        })
+
+    def _replay_cached(self, cached):
+        """Yield a cached answer as stream events."""
+        yield "context", cached["context"]
+        yield "token", cached["answer"]
+        yield "end", cached
+
+    def _prepare(self, query, history, timings, start):
+        """
+        Return (prepared, response cache key, cached results or None).
+        With the response cache in play the category is resolved first (it is
+        part of the key) and retrieval only runs on a miss, so a hit costs one
+        embedding lookup at most. Otherwise classification and retrieval overlap.
+        """
+        with metrics.collect_timings(timings):
+            if not self._response_cache_usable(history):
+                prepared = self._prepare_stage(timings).invoke(query)
+                timings["prepare"] = time.perf_counter() - start
+                return prepared, None, None
+            prepared = self._category_stage(timings).invoke(query)
+            cache_key = self._response_cache_key(query, prepared, history)
+            results = self._response_cache_hit(cache_key, query, prepared, timings)
+            if results is None:
+                prepared["docs"] = self._retrieve_stage(timings).invoke(prepared)
+        timings["prepare"] = time.perf_counter() - start
+        return prepared, cache_key, results
+
+    async def _aprepare(self, query, history, timings, start):
+        """Async counterpart of _prepare."""
+        with metrics.collect_timings(timings):
+            if not self._response_cache_usable(history):
+                prepared = await self._prepare_stage(timings).ainvoke(query)
+                timings["prepare"] = time.perf_counter() - start
+                return prepared, None, None
+            prepared = await self._category_stage(timings).ainvoke(query)
+            cache_key = self._response_cache_key(query, prepared, history)
+            # SQLite may wait on another worker's write lock; keep that off the event loop
+            results = await asyncio.to_thread(self._response_cache_hit, cache_key, query, prepared, timings)
+            if results is None:
+                prepared["docs"] = await self._retrieve_stage(timings).ainvoke(prepared)
+        timings["prepare"] = time.perf_counter() - start
+        return prepared, cache_key, results
+
+    def _category_stage(self, timings):
+        """Only the category (and the router's query vector): enough to key the response cache."""
+        if self.category_router is not None and self.embeddings is not None:
+            return RunnableLambda(self._embed_query, afunc=self._aembed_query) | RunnablePassthrough.assign(
+                category=self._timed("classify", self._route_category, timings, afn=self._aroute_category)
+            )
+        return RunnableParallel(
+            query=RunnablePassthrough(),
+            category=self._timed(
+                "classify",
+                lambda q: self.classify_prompt_category(q)[0],
+                timings,
+                afn=self._aclassify_first,
+            ),
+        )
+
+    def _retrieve_stage(self, timings):
+        return self._timed("retrieve", self._retrieve_prepared, timings, afn=self._aretrieve_prepared)
+
+    def _retrieve_prepared(self, prepared):
+        category = self._confident_category(prepared) if "routed" in prepared else None
+        return self._retrieve(prepared["query"], category)
+
+    async def _aretrieve_prepared(self, prepared):
+        category = self._confident_category(prepared) if "routed" in prepared else None
+        return await self._aretrieve(prepared["query"], category)
+
+    def _prepare_stage(self, timings):
+        """
+        Classification and retrieval are independent: run them side by side
+        so the critical path is max(classify, retrieve) + generate.
+        With the category router, the query is embedded once up front; the
+        router classifies from that vector in microseconds and retrieval
+        reuses it through the embedding cache. The embedding cache and the
+        retriever search record the embed and vector_search stages themselves.
+        """
+        if self.category_router is not None and self.embeddings is not None:
+            return RunnableLambda(self._embed_query, afunc=self._aembed_query) | RunnableParallel(
+                category=self._timed("classify", self._route_category, timings, afn=self._aroute_category),
+                docs=self._timed(
+                    "retrieve",
+                    lambda x: self._retrieve(x["query"], self._confident_category(x)),
+                    timings,
+                    afn=lambda x: self._aretrieve(x["query"], self._confident_category(x)),
+                ),
+            )
 
+        return RunnableParallel(
+            category=self._timed(
+                "classify",
+                lambda q: self.classify_prompt_category(q)[0],
+                timings,
+                afn=self._aclassify_first,
+            ),
+            docs=self._timed("retrieve", self._retrieve, timings, afn=self._aretrieve),
+        )
+
+    def _retrieve(self, query, category=None):
+        """
+        Retrieve with a metadata filter built from the question's hints when
+        the store supports it. If the filter leaves fewer chunks than an
+        unfiltered search would return, the unfiltered results top it up.
+        The category's preferred document types then rank first.
+        Documents prefetched for a suggested follow-up are used as they are.
+        """
+        docs = self._prefetched_documents(query)
+        if docs is not None:
+            return self._prefer_doc_types(docs, category)
+        where = self._metadata_filter(query)
+        if where is None:
+            return self._prefer_doc_types(self._search(query), category)
+        docs = self._search(query, filter=where)
+        print(f"🔎 Metadata filter {where} -> {len(docs)} chunks")
+        if len(docs) < self._retrieval_k():
+            docs = self._top_up(docs, self._search(query))
+        return self._prefer_doc_types(docs, category)
+
+    async def _aretrieve(self, query, category=None):
+        """Async counterpart of _retrieve."""
+        if getattr(self.retriever, "ainvoke", None) is None:
+            return self._retrieve(query, category)
+        docs = self._prefetched_documents(query)
+        if docs is not None:
+            return self._prefer_doc_types(docs, category)
+        where = self._metadata_filter(query)
+        if where is None:
+            return self._prefer_doc_types(await self._asearch(query), category)
+        docs = await self._asearch(query, filter=where)
+        print(f"🔎 Metadata filter {where} -> {len(docs)} chunks")
+        if len(docs) < self._retrieval_k():
+            docs = self._top_up(docs, await self._asearch(query))
+        return self._prefer_doc_types(docs, category)
+
+    def _search(self, query, **kwargs):
+        # Similarity search plus BM25 for the hybrid retriever; a query embedding inside counts as "embed"
+        with metrics.timed("vector_search"):
+            return self.retriever.invoke(query, **kwargs)
+
+    async def _asearch(self, query, **kwargs):
+        with metrics.timed("vector_search"):
+            return await self.retriever.ainvoke(query, **kwargs)
+
+    def _metadata_filter(self, query):
+        # Only Chroma understands where filters; test and mock retrievers get none
+        if not self.metadata_filters or not isinstance(getattr(self.retriever, "vectorstore", None), Chroma):
+            return None
+        return query_filter(query, self.recent_years)
+
+    def _prefer_doc_types(self, docs, category):
+        # A ranking boost, not a filter: chunks without a doc_type label stay in
+        return prefer_doc_types(docs, category) if self.metadata_filters else docs
+
+    def _retrieval_k(self):
+        return getattr(self.retriever, "k", None) or getattr(self.retriever, "search_kwargs", {}).get("k", 4)
+
+    def _top_up(self, docs, unfiltered):
+        """Filtered chunks first, then unfiltered ones not already included, up to k."""
+        seen = {(d.id, d.page_content) for d in docs}
+        extra = [d for d in unfiltered if (d.id, d.page_content) not in seen]
+        return docs + extra[:self._retrieval_k() - len(docs)]
+
+    def _confident_category(self, prepared):
+        """The router's category when it is confident (known before retrieval starts), else None."""
+        category, _, confident = prepared["routed"]
+        return category if confident else None
+
+    async def _aclassify_first(self, query):
+        return (await self.aclassify_prompt_category(query))[0]
+
+    def _embed_query(self, query):
+        with metrics.upstream_call("embed"):
+            vector = self.embeddings.embed_query(query)
+        # Routing is a single matrix product, so it happens here and retrieval can filter on it
+        return {"query": query, "vector": vector, "routed": self.category_router.route(vector)}
+
+    async def _aembed_query(self, query):
+        with metrics.upstream_call("embed"):
+            vector = await self.embeddings.aembed_query(query)
+        return {"query": query, "vector": vector, "routed": self.category_router.route(vector)}
+
+    def _route_category(self, prepared):
+        category, score, confident = prepared["routed"]
+        if confident:
+            print(f"🧭 Routed to {category} (score {score:.3f})")
+            return category
+        print(f"🧭 Low router confidence ({category}, {score:.3f}); falling back to LLM classification.")
+        return self.classify_prompt_category(prepared["query"])[0]
+
+    async def _aroute_category(self, prepared):
+        category, score, confident = prepared["routed"]
+        if confident:
+            print(f"🧭 Routed to {category} (score {score:.3f})")
+            return category
+        print(f"🧭 Low router confidence ({category}, {score:.3f}); falling back to LLM classification.")
+        return (await self.aclassify_prompt_category(prepared["query"]))[0]
+
+    def _build_chain(self, query, prepared, history):
+        """Build the generation chain and its inputs from the classify/retrieve results."""
+        prompt_category = prepared["category"]
+        docs = prepared["docs"]
+        print(f"🧠 System prompt category: {prompt_category}")
+
+        # Precompiled prompt | llm | parser; history (a session's running summary
+        # arrives as a system message) fills the MessagesPlaceholder
+        rag_chain = self.prompts.rag_chain(prompt_category, self.llm)
+
+        # Only the chunks that reached {context} are returned as citations
+        context, docs, assembly = self._assemble_context(docs)
+        inputs = {
+            "context": context,
+            "input": query,
+            PromptRegistry.HISTORY: list(history)
+        }
+        return rag_chain, inputs, docs, assembly
+
+    def _assemble_context(self, docs):
+        """
+        The {context} text for docs, the docs it contains, and its token
+        accounting (None when assembly is off or fails).
+        """
+        if self.context_assembler is None:
+            return self._format_docs(docs), docs, None
+        try:
+            context, used, assembly = self.context_assembler.select(docs)
+        except Exception as e:
+            print(f"⚠️ Warning: Context assembly failed, sending every chunk: {e}")
+            return self._format_docs(docs), docs, None
+        print(f"✂️ Context {assembly['tokens_out']}/{assembly['tokens_in']} tokens "
+              f"({assembly['duplicates']} duplicate, {assembly['merged']} merged, {assembly['dropped']} over budget)")
+        return context, used, assembly
+
+    def _results(self, query, answer, docs, timings, assembly=None):
+        results = {
+            "input": query,
+            "answer": answer,
+            "context": docs,
+            "timings": timings
+        }
+        if assembly:
+            results["context_tokens"] = assembly
         return results
 
+    def _error_results(self, query, timings, error):
+        return {
+            "input": query,
+            "answer": "Sorry, I couldn't process your request.",
+            "context": [],
+            "timings": timings,
+            "error": str(error)
+        }
+
+    def _record_ttft(self, timings, start):
+        # Time-to-first-token is measured from the start of the request
+        timings["ttft"] = time.perf_counter() - start
+        print(f"⚡ Time to first token: {timings['ttft'] * 1000:.0f}ms")
+
+    def _finish_timings(self, timings, start):
+        timings["total"] = time.perf_counter() - start
+        metrics.observe_timings(timings)
+        print("⏱️ Stage timings: " + ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in timings.items()))
+
     # --- Utilities ---
+    def _timed(self, stage, fn, timings, afn=None):
+        """Wrap fn (and optionally its async twin afn) in a runnable that records its wall time under timings[stage]."""
+        def run(value):
+            stage_start = time.perf_counter()
+            try:
+                return fn(value)
+            finally:
+                timings[stage] = time.perf_counter() - stage_start
+
+        async def arun(value):
+            stage_start = time.perf_counter()
+            try:
+                return await afn(value)
+            finally:
+                timings[stage] = time.perf_counter() - stage_start
+
+        return RunnableLambda(run, afunc=arun if afn else None)
+
     def _format_docs(self, docs):
         try:
             return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
         except Exception:
             return str(docs)
 
+    # --- Conversation history ---
+    def _history(self, maintain_history, session_id):
+        """Messages that precede the question: the session's summary and recent turns, or this instance's history."""
+        if session_id and self.session_store is not None:
+            try:
+                return self.session_store.history(session_id)
+            except Exception as e:
+                print(f"⚠️ Warning: Could not load session {session_id}: {e}")
+                return []
+        return list(self.conversation_history) if maintain_history else []
+
+    def _remember(self, query, results, maintain_history, session_id):
+        """Record a completed turn (cached answers included) in the session or the instance history."""
+        if results.get("error"):
+            return
+        if session_id and self.session_store is not None:
+            try:
+                self.session_store.append(session_id, query, results["answer"])
+            except Exception as e:
+                print(f"⚠️ Warning: Could not save session {session_id}: {e}")
+        elif maintain_history:
+            self._update_conversation_history(query, results["answer"])
+
+    async def _ahistory(self, maintain_history, session_id):
+        """Async _history: session backends (SQLite, Redis) are read off the event loop."""
+        if session_id and self.session_store is not None:
+            return await asyncio.to_thread(self._history, maintain_history, session_id)
+        return self._history(maintain_history, session_id)
+
+    async def _aremember(self, query, results, maintain_history, session_id):
+        """Async _remember: session writes (and any summarization they trigger) run off the event loop."""
+        if session_id and self.session_store is not None:
+            await asyncio.to_thread(self._remember, query, results, maintain_history, session_id)
+        else:
+            self._remember(query, results, maintain_history, session_id)
+
+    def _summarize_turns(self, summary, turns, max_tokens):
+        """Session summarizer: fold the rolled-up turns into the running summary with the LLM."""
+        self._initialize_components()
+        return self.prompts.chain("summary", self.llm).invoke({
+            "max_words": max(20, max_tokens * 3 // 4),
+            "summary": summary or "(none)",
+            "turns": "\n".join(f"Physician: {turn['human']}\nAssistant: {turn['ai']}" for turn in turns)
+        })
+
     def _update_conversation_history(self, query, answer):
         self.conversation_history.append(HumanMessage(content=query))
         self.conversation_history.append(AIMessage(content=answer))
@@ -198,55 +877,141 @@ class Inference:
     
     
     def generate_followup_questions(self, original_question, previous_results):
-        followup_template = self.promt_categories.get_followup_template()
-        
         try:
-            # Create prompt template
-            followup_prompt = PromptTemplate(
-                input_variables=["original_question", "previous_answer", "context"],
-                template=followup_template
-            )
-            
-            # Build LCEL chain for followup questions (LangChain 1.0 style)
-            followup_chain = followup_prompt | self.llm | StrOutputParser()
-            
             # Get context from previous results
             context = previous_results.get("context", "No context available")
             previous_answer = previous_results.get("answer", "No answer available")
-            
-            # Invoke the chain
-            text = followup_chain.invoke({
-                "original_question": original_question,
-                "previous_answer": previous_answer,
-                "context": context
-            })
-            
-            return (text or "").strip().split("\n")
-            
+            return self._followup_lines(original_question, previous_answer, context)
+
         except Exception as e:
             print(f"Error generating followup questions: {e}")
             return ["Could not generate followup questions"]
+
+    # --- Background follow-ups ---
+    def register_followups(self, query, results, session_id=None):
+        """Id under which follow-ups for this answer can be fetched (see get_followups); None when unavailable."""
+        if self.followups is None or not isinstance(results, dict) or results.get("error") or not results.get("answer"):
+            return None
+        try:
+            return self.followups.create(
+                query, results["answer"], self._context_text(results.get("context", [])), session_id
+            )
+        except Exception as e:
+            print(f"⚠️ Warning: Could not register follow-ups: {e}")
+            return None
+
+    def get_followups(self, followup_id, wait=0.0):
+        """(status, questions) for a registered id; generation starts on the first request for it."""
+        if self.followups is None:
+            return "missing", None
+        return self.followups.get(followup_id, wait)
+
+    def _followup_lines(self, original_question, previous_answer, context):
+        """Run the precompiled follow-up chain; errors propagate to the caller."""
+        self._initialize_components()
+        text = self.prompts.chain("followup", self.llm).invoke({
+            "original_question": original_question,
+            "previous_answer": previous_answer,
+            "context": context
+        })
+        return parse_questions(text)
+
+    def _prefetch_followups(self, followup_id, questions, session_id):
+        """FollowupJobs callback: speculatively warm the caches for the generated questions."""
+        if self.prefetcher is not None:
+            # The budget is per session, or per originating answer for stateless clients
+            self.prefetcher.submit(questions, session_id or followup_id, stateless=not session_id)
+
+    def prefetch_documents(self, question):
+        """(store generation, documents) for a likely next question; the prefetcher hands them back to _retrieve."""
+        self._initialize_components()
+        return get_store_generation(self.storeLocation), self._retrieve(question)
+
+    def _prefetched_documents(self, query):
+        if self.prefetcher is None:
+            return None
+        return self.prefetcher.take_documents(query, get_store_generation(self.storeLocation))
+
+    def _record_prefetch_hit(self, query):
+        if self.prefetcher is not None:
+            self.prefetcher.record_hit(query)
+
+    @staticmethod
+    def _context_text(items):
+        return "\n\n".join(
+            item.get("page_content", "") if isinstance(item, dict) else getattr(item, "page_content", str(item))
+            for item in items
+        )
  
+    def _zero_shot_category(self, query):
+        """The zero-shot model's label, or None (disabled or unavailable) to fall back to the LLM."""
+        if self.zero_shot is None:
+            return None
+        try:
+            return self.zero_shot.classify(query)
+        except Exception as e:
+            print(f"⚠️ Zero-shot classification failed, using the LLM: {e}")
+            return None
+
+    def _remembered_classification(self, query):
+        with self._classifications_lock:
+            lines = self._classifications.get(ResponseCache.normalize(query))
+            if lines is not None:
+                self._classifications.move_to_end(ResponseCache.normalize(query))
+            return lines
+
+    def _remember_classification(self, query, lines):
+        with self._classifications_lock:
+            self._classifications[ResponseCache.normalize(query)] = lines
+            while len(self._classifications) > 4096:
+                self._classifications.popitem(last=False)
+        return lines
+
     def classify_prompt_category(self, query):
         categories = self.promt_categories.get_categories()
-        classification_template_text = self.promt_categories.get_classification_template()
+        remembered = self._remembered_classification(query)
+        if remembered is not None:
+            return remembered
+        label = self._zero_shot_category(query)
+        if label is not None:
+            return [label]
 
         try:
-            classify_prompt = PromptTemplate(
-                input_variables=["query", "context"],
-                template=classification_template_text,
-            )
-            
-            # Build LCEL chain for classification (LangChain 1.0 style)
-            classify_chain = classify_prompt | self.llm | StrOutputParser()
-            
+            # Precompiled LCEL chain for classification
+            classify_chain = self.prompts.chain("classification", self.llm)
+
             text = classify_chain.invoke({
                 "query": query,
                 "context": "No context available"
             })
-            return (text or "").strip().split("\n")
+            return self._remember_classification(query, (text or "").strip().split("\n"))
+        except Exception as e:
+            print(f"⚠️ Error classifying the query: {e}")
+            metrics.upstream_error("classify", e)
+            return categories[0]
+
+    async def aclassify_prompt_category(self, query):
+        """Async counterpart of classify_prompt_category."""
+        categories = self.promt_categories.get_categories()
+        remembered = self._remembered_classification(query)
+        if remembered is not None:
+            return remembered
+        if self.zero_shot is not None:
+            label = await asyncio.to_thread(self._zero_shot_category, query)
+            if label is not None:
+                return [label]
+
+        try:
+            classify_chain = self.prompts.chain("classification", self.llm)
+
+            text = await classify_chain.ainvoke({
+                "query": query,
+                "context": "No context available"
+            })
+            return self._remember_classification(query, (text or "").strip().split("\n"))
         except Exception as e:
             print(f"⚠️ Error classifying the query: {e}")
+            metrics.upstream_error("classify", e)
             return categories[0]
 
 
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# --- Semantic answer cache ---
+class SemanticCache:
+    """
+    In-memory cache of answered questions, looked up by embedding similarity.
+
+    Question vectors live in one preallocated, L2-normalised NumPy matrix so a
+    lookup is a single matrix-vector product over every entry. When the cache
+    is full the least recently used entry is overwritten. Entries are dropped
+    whenever the vector store generation changes, since the stored context
+    may no longer match what retrieval would return.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=1000, generation_fn=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.generation_fn = generation_fn
+        self.lookups = 0
+        self.hits = 0
+        self._generation = generation_fn() if generation_fn else None
+        self._vectors = None
+        self._payloads = [None] * max_entries
+        self._last_used = np.zeros(max_entries)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, generation_fn=None):
+        """Build the cache from SEMANTIC_CACHE_* environment variables; None when disabled."""
+        if os.getenv("SEMANTIC_CACHE", "1").lower() in ("0", "false", "off"):
+            return None
+        return cls(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1000")),
+            generation_fn=generation_fn,
+        )
+
+    def lookup(self, vector):
+        """Return (payload, score) for the closest stored question, payload is None below the threshold."""
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_generation()
+            self.lookups += 1
+            if self._count == 0:
+                return None, 0.0
+
+            scores = self._vectors[:self._count] @ query
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.threshold:
+                return None, score
+
+            self.hits += 1
+            self._last_used[best] = time.monotonic()
+            return self._payloads[best], score
+
+    def store(self, vector, payload):
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_generation()
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+
+            if self._count < self.max_entries:
+                slot = self._count
+                self._count += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+
+            self._vectors[slot] = query
+            self._payloads[slot] = payload
+            self._last_used[slot] = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def stats(self):
+        return {
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hit_rate(), 4)
+        }
+
+    # --- Internals ---
+    def _normalize(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_generation(self):
+        if self.generation_fn is None:
+            return
+        generation = self.generation_fn()
+        if generation != self._generation:
+            if self._count:
+                print("♻️ Vector store changed; semantic cache invalidated.")
+            self._clear()
+            self._generation = generation
+
+    def _clear(self):
+        self._vectors = None
+        self._payloads = [None] * self.max_entries
+        self._last_used = np.zeros(self.max_entries)
+        self._count = 0
@@ -0,0 +1,259 @@
+import copy
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from reference.embeddingscheduler import make_token_counter
+
+
+def new_state():
+    return {"summary": "", "turns": [], "updated": time.time()}
+
+
+def extractive_summary(summary, turns, max_chars):
+    """Fallback summary without an LLM: the first sentence of every rolled-up question and answer."""
+    def first_sentence(text):
+        return re.split(r"(?<=[.!?])\s", " ".join(text.split()), maxsplit=1)[0]
+
+    lines = [summary] if summary else []
+    for turn in turns:
+        lines.append(f"Q: {first_sentence(turn['human'])} A: {first_sentence(turn['ai'])}")
+    text = " ".join(lines)
+    # Keep the newest turns when the summary outgrows its share of the budget
+    return text[-max_chars:] if len(text) > max_chars else text
+
+
+# --- Backends ---
+class MemorySessionBackend:
+    """Sessions in this process only, least recently used evicted beyond max_sessions."""
+
+    def __init__(self, max_sessions=10000, ttl_seconds=86400):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            state = self._live(session_id)
+            return copy.deepcopy(state) if state else None
+
+    def update(self, session_id, mutate):
+        """Apply mutate(state) atomically and return a copy of the new state."""
+        with self._lock:
+            state = self._live(session_id) or new_state()
+            mutate(state)
+            state["updated"] = time.time()
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return copy.deepcopy(state)
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _live(self, session_id):
+        state = self._sessions.get(session_id)
+        if state is None:
+            return None
+        if time.time() - state["updated"] > self.ttl_seconds:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return state
+
+
+class SqliteSessionBackend:
+    """
+    Sessions in SQLite (WAL), shared by every gunicorn worker. update() is
+    a read-modify-write inside BEGIN IMMEDIATE, so two workers appending to
+    the same session never lose a turn.
+    """
+
+    def __init__(self, path, ttl_seconds=86400):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = self._open_db(path)
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM sessions WHERE id = ? AND updated >= ?", (session_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, session_id, mutate):
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT state FROM sessions WHERE id = ? AND updated >= ?", (session_id, now - self.ttl_seconds)
+                ).fetchone()
+                state = json.loads(row[0]) if row else new_state()
+                mutate(state)
+                state["updated"] = now
+                self._db.execute(
+                    "INSERT INTO sessions (id, state, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET state = excluded.state, updated = excluded.updated",
+                    (session_id, json.dumps(state), now)
+                )
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._db.execute("DELETE FROM sessions WHERE updated < ?", (now - self.ttl_seconds,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return state
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    @staticmethod
+    def _open_db(path):
+        # Autocommit mode: update() manages its own transactions
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        return db
+
+
+# --- Session store ---
+class SessionStore:
+    """
+    Conversation history per client session id, bounded by a token budget.
+
+    A session is a running summary plus the most recent turns. When the
+    turns outgrow token_budget, the oldest are rolled into the summary by
+    summarizer(summary, turns) -> text (an LLM call, run on a background
+    thread unless background=False) and the summary is stored with the
+    session, so it is computed once per roll-up rather than per request.
+    The prompt history therefore stays near token_budget however long the
+    conversation runs.
+    """
+
+    def __init__(self, backend, token_budget=2000, summary_share=0.25, summarizer=None, background=True,
+                 model="gpt-4o", token_counter=None):
+        self.backend = backend
+        self.token_budget = token_budget
+        self.summary_share = summary_share
+        self.summarizer = summarizer
+        self.model = model
+        self.summaries = 0
+        self._count_tokens = token_counter
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="session-summary") if background else None
+        self._summarizing = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, summarizer=None):
+        """
+        Build the store from SESSION_* environment variables: SESSION_STORE is
+        "memory" (default), "sqlite" (SESSION_STORE_PATH, shared by workers) or "off".
+        """
+        kind = os.getenv("SESSION_STORE", "memory").lower()
+        ttl = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+        if kind in ("0", "off", "false", "none"):
+            return None
+        if kind == "sqlite":
+            backend = SqliteSessionBackend(os.getenv("SESSION_STORE_PATH", "sessions.sqlite3"), ttl_seconds=ttl)
+        else:
+            backend = MemorySessionBackend(int(os.getenv("SESSION_MAX_SESSIONS", "10000")), ttl_seconds=ttl)
+        return cls(backend, token_budget=int(os.getenv("SESSION_TOKEN_BUDGET", "2000")), summarizer=summarizer)
+
+    def count_tokens(self, text):
+        if self._count_tokens is None:
+            self._count_tokens = make_token_counter(self.model)
+        return self._count_tokens(text)
+
+    # --- History ---
+    def history(self, session_id):
+        """Messages to replay before the next question: the summary (as a system message) and recent turns."""
+        state = self.backend.get(session_id)
+        if not state:
+            return []
+        messages = [SystemMessage(content=f"Summary of the earlier conversation: {state['summary']}")] \
+            if state["summary"] else []
+        for turn in state["turns"]:
+            messages.append(HumanMessage(content=turn["human"]))
+            messages.append(AIMessage(content=turn["ai"]))
+        return messages
+
+    def append(self, session_id, question, answer):
+        """Record a turn; rolls the oldest turns into the summary once the session is over budget."""
+        turn = {"human": question, "ai": answer, "tokens": self.count_tokens(question) + self.count_tokens(answer)}
+        state = self.backend.update(session_id, lambda s: s["turns"].append(turn))
+        rolled = self._overflow(state)
+        if not rolled:
+            return
+        with self._lock:
+            if session_id in self._summarizing:
+                return
+            self._summarizing.add(session_id)
+        if self._pool is None:
+            self._roll_up(session_id, state["summary"], state["turns"][:rolled])
+        else:
+            self._pool.submit(self._roll_up, session_id, state["summary"], state["turns"][:rolled])
+
+    def clear(self, session_id):
+        return self.backend.delete(session_id)
+
+    def stats(self):
+        return {"sessions": len(self.backend), "token_budget": self.token_budget, "summaries": self.summaries}
+
+    # --- Summarisation ---
+    def _overflow(self, state):
+        """Number of oldest turns to roll up so the session fits token_budget (the newest turn always stays)."""
+        total = self.count_tokens(state["summary"]) + sum(turn["tokens"] for turn in state["turns"])
+        rolled = 0
+        while total > self.token_budget and rolled < len(state["turns"]) - 1:
+            total -= state["turns"][rolled]["tokens"]
+            rolled += 1
+        return rolled
+
+    def _roll_up(self, session_id, summary, turns):
+        try:
+            max_tokens = int(self.token_budget * self.summary_share)
+            text = None
+            if self.summarizer is not None:
+                try:
+                    text = self.summarizer(summary, turns, max_tokens)
+                except Exception as e:
+                    print(f"⚠️ Warning: Session summary failed, using an extractive summary: {e}")
+            text = (text or "").strip() or extractive_summary(summary, turns, max_tokens * 4)
+
+            def apply(state):
+                # Another worker may have rolled these turns up already
+                if state["summary"] == summary and state["turns"][:len(turns)] == turns:
+                    state["summary"] = text
+                    del state["turns"][:len(turns)]
+
+            self.backend.update(session_id, apply)
+            self.summaries += 1
+            print(f"🗜️ Rolled {len(turns)} turns of session {session_id} into its summary")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not summarise session {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._summarizing.discard(session_id)
@@ -0,0 +1,16 @@
+import os
+
+
+def get_store_generation(store_location):
+    """
+    Cheap fingerprint of the Chroma persist directory.
+    Chroma writes every add/update/delete through chroma.sqlite3, so its size
+    and modification time change whenever the collection contents change.
+    Caches that depend on retrieved context use this to invalidate themselves.
+    """
+    path = os.path.join(store_location, "chroma.sqlite3")
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "empty"
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
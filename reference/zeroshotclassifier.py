@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+
+from reference.microbatch import MicroBatcher
+
+
+# --- Resident zero-shot classifier with micro-batching ---
+class ZeroShotClassifier:
+    """
+    Keeps one zero-shot-classification pipeline (facebook/bart-large-mnli by
+    default) resident per process and micro-batches concurrent queries.
+
+    classify() hands the query to a MicroBatcher and blocks on its result;
+    queries arriving within max_wait_ms (up to max_batch) run through the
+    pipeline together on a small thread pool (torch releases the GIL).
+
+    backend selects the CPU inference path:
+        "torch" - the stock PyTorch model
+        "int8"  - PyTorch with dynamic int8 quantisation of the Linear layers
+        "onnx"  - an ONNX Runtime graph exported once to onnx_dir on local disk
+
+    A failed load (transformers missing, no model download) is remembered
+    for retry_seconds; until then callers fail fast instead of queueing
+    behind another multi-gigabyte load attempt.
+    """
+
+    def __init__(self, labels, model="facebook/bart-large-mnli", backend="torch", onnx_dir=None,
+                 max_batch=16, max_wait_ms=10, workers=1, retry_seconds=300, pipeline_factory=None):
+        self.labels = list(labels)
+        self.model = model
+        self.backend = backend
+        self.onnx_dir = onnx_dir
+        self.max_batch = max_batch
+        self.retry_seconds = retry_seconds
+        self.batches = 0
+        self.queries = 0
+        self._pipeline_factory = pipeline_factory or self._load_pipeline
+        self._pipeline = None
+        self._load_error = None
+        self._retry_at = 0.0
+        self._load_lock = threading.Lock()
+        self._batcher = MicroBatcher(
+            self.classify_batch, max_batch=max_batch, max_wait_ms=max_wait_ms, workers=workers, name="zeroshot"
+        )
+
+    @classmethod
+    def from_env(cls, labels):
+        """Build the classifier from ZERO_SHOT_* environment variables."""
+        return cls(
+            labels,
+            model=os.getenv("ZERO_SHOT_MODEL", "facebook/bart-large-mnli"),
+            backend=os.getenv("ZERO_SHOT_BACKEND", "torch"),
+            onnx_dir=os.getenv("ZERO_SHOT_ONNX_DIR"),
+            max_batch=int(os.getenv("ZERO_SHOT_MAX_BATCH", "16")),
+            max_wait_ms=float(os.getenv("ZERO_SHOT_MAX_WAIT_MS", "10")),
+            workers=int(os.getenv("ZERO_SHOT_WORKERS", "1")),
+            retry_seconds=float(os.getenv("ZERO_SHOT_RETRY_SECONDS", "300")),
+        )
+
+    # --- Public API ---
+    def classify(self, query):
+        """Return the best label for one query, batched with any concurrent callers."""
+        return self._batcher.submit(query).result()
+
+    def classify_batch(self, queries):
+        """Classify a list of queries in one pipeline call, bypassing the micro-batcher."""
+        if not queries:
+            return []
+        pipe = self._get_pipeline()
+        results = pipe(list(queries), candidate_labels=self.labels, batch_size=self.max_batch)
+        if isinstance(results, dict):
+            results = [results]
+        self.batches += 1
+        self.queries += len(queries)
+        return [result["labels"][0] for result in results]
+
+    def warm_up(self):
+        self._get_pipeline()
+        return self
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "backend": self.backend,
+            "loaded": self._pipeline is not None,
+            "load_error": str(self._load_error) if self._load_error else None,
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0
+        }
+
+    # --- Model loading ---
+    def _get_pipeline(self):
+        if self._pipeline is None:
+            self._check_backoff()
+            with self._load_lock:
+                if self._pipeline is None:
+                    # Callers queued behind a load that just failed give up too
+                    self._check_backoff()
+                    start = time.perf_counter()
+                    try:
+                        self._pipeline = self._pipeline_factory()
+                    except Exception as e:
+                        self._load_error = e
+                        self._retry_at = time.monotonic() + self.retry_seconds
+                        print(f"⚠️ Warning: Zero-shot classifier ({self.model}) failed to load, "
+                              f"retrying in {self.retry_seconds:.0f}s: {e}")
+                        raise
+                    self._load_error = None
+                    print(f"✅ Zero-shot classifier ({self.model}, {self.backend}) loaded in {time.perf_counter() - start:.1f}s")
+        return self._pipeline
+
+    def _check_backoff(self):
+        if self._load_error is not None and time.monotonic() < self._retry_at:
+            raise RuntimeError(f"Zero-shot classifier unavailable: {self._load_error}") from self._load_error
+
+    def _load_pipeline(self):
+        from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
+
+        if self.backend == "onnx":
+            # Requires optimum[onnxruntime]; the graph is exported once and reused from disk
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+
+            onnx_dir = self.onnx_dir or os.path.join("models", self.model.replace("/", "__") + "-onnx")
+            if os.path.isdir(onnx_dir):
+                model = ORTModelForSequenceClassification.from_pretrained(onnx_dir)
+                tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+            else:
+                model = ORTModelForSequenceClassification.from_pretrained(self.model, export=True)
+                tokenizer = AutoTokenizer.from_pretrained(self.model)
+                model.save_pretrained(onnx_dir)
+                tokenizer.save_pretrained(onnx_dir)
+            return pipeline("zero-shot-classification", model=model, tokenizer=tokenizer)
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model)
+        model = AutoModelForSequenceClassification.from_pretrained(self.model)
+        if self.backend == "int8":
+            import torch
+
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.eval()
+        return pipeline("zero-shot-classification", model=model, tokenizer=tokenizer, device=-1)
+
+
+_classifiers = {}
+_classifiers_lock = threading.Lock()
+
+
+def get_zero_shot_classifier(labels):
+    """Process-wide classifier for a label set, created on first use."""
+    key = tuple(labels)
+    with _classifiers_lock:
+        if key not in _classifiers:
+            _classifiers[key] = ZeroShotClassifier.from_env(labels)
+        return _classifiers[key]
@@ -1,4 +1,5 @@
 import pytest
+import app as app_module
 from app import app
 
 @pytest.fixture
@@ -10,3 +11,30 @@ def test_index(client):
     response = client.get('/')
     assert response.status_code == 200
     assert b'Hello there' in response.data
+
+class StubEngine:
+    def __init__(self):
+        self.calls = []
+
+    def run_inference(self, query, maintain_history=True, session_id=None):
+        self.calls.append((query, maintain_history))
+        return {"input": query, "answer": "stub answer", "context": []}
+
+def test_chat_reuses_engine(client, monkeypatch):
+    engine = StubEngine()
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+    monkeypatch.setattr(app_module.engine_manager, "ready", False)
+
+    first = client.post('/chat', json={"message": "q1"})
+    second = client.post('/chat', json={"message": "q2"})
+
+    assert first.headers["X-Engine-State"] == "cold"
+    assert second.headers["X-Engine-State"] == "warm"
+    assert engine.calls == [("q1", False), ("q2", False)]
+    assert app_module.engine_manager.get() is engine
+
+def test_ready_reports_warm_state(client, monkeypatch):
+    monkeypatch.setattr(app_module.engine_manager, "ready", False)
+    assert client.get('/ready').status_code == 503
+    monkeypatch.setattr(app_module.engine_manager, "ready", True)
+    assert client.get('/ready').status_code == 200
@@ -0,0 +1,39 @@
+from langchain_core.documents import Document
+
+from reference.bm25index import BM25Index, tokenize
+
+
+def doc(doc_id, text, source="g.pdf"):
+    return Document(id=doc_id, page_content=text, metadata={"source": source})
+
+
+def test_tokenize_keeps_clinical_terms_whole():
+    assert tokenize("What does the AGA say about 5-ASA and IL-6?") == ["aga", "say", "about", "5-asa", "il-6"]
+
+
+def test_exact_rare_term_ranks_first(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add([
+        doc("a", "Mesalamine (5-ASA) is first line for mild ulcerative colitis."),
+        doc("b", "Ulcerative colitis therapy depends on disease extent and severity."),
+        doc("c", "Colitis severity scores guide escalation of therapy in colitis."),
+    ])
+
+    results = index.search("When is 5-ASA used in colitis?", k=3)
+
+    assert results[0][0] == "a"
+    assert index.get_documents(["a"])[0].metadata == {"source": "g.pdf"}
+
+
+def test_incremental_updates_persist(tmp_path):
+    path = str(tmp_path / "bm25.sqlite3")
+    index = BM25Index(path)
+    assert index.add([doc("a", "Barrett esophagus surveillance"), doc("b", "GERD therapy")]) == 2
+    assert index.add([doc("a", "Barrett esophagus surveillance")]) == 0
+    index.delete(["a"])
+
+    reopened = BM25Index(path)
+
+    assert len(reopened) == 1
+    assert reopened.search("Barrett surveillance") == []
+    assert [doc_id for doc_id, _ in reopened.search("GERD")] == ["b"]
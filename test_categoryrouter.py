@@ -0,0 +1,55 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+
+from reference.categoryrouter import CategoryRouter
+from reference.promptcategories import PromptCategories
+from reference.runinference2 import Inference, MockRetriever
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    batches: int = 0
+
+    def embed_documents(self, texts):
+        self.batches += 1
+        return super().embed_documents(texts)
+
+
+def test_fit_embeds_all_exemplars_in_one_call():
+    embeddings = CountingEmbeddings(size=64)
+    router = CategoryRouter(embeddings, PromptCategories().get_category_exemplars()).fit()
+
+    assert router.ready
+    assert embeddings.batches == 1
+
+
+def test_routes_confident_matches_and_flags_low_confidence():
+    embeddings = DeterministicFakeEmbedding(size=256)
+    router = CategoryRouter(embeddings, PromptCategories().get_category_exemplars(), min_score=0.5).fit()
+
+    category, score, confident = router.route(embeddings.embed_query("Does a low FODMAP diet help IBS?"))
+    assert (category, confident) == ("Lifestyle & Diet in Disease Management", True)
+    assert score > 0.99
+
+    assert router.route(embeddings.embed_query("Write a short poem about the ocean"))[::2] == ("Other", True)
+    # Random fake vectors match nothing: off topic, so "Other" without an LLM call
+    assert router.route(embeddings.embed_query("unrelated text"))[::2] == ("Other", True)
+
+    router.other_below = -1.0
+    _, _, confident = router.route(embeddings.embed_query("unrelated text"))
+    assert not confident
+    assert router.stats()["llm_fallbacks"] == 1
+
+
+def test_query_reasoning_skips_llm_classification_when_confident():
+    embeddings = DeterministicFakeEmbedding(size=256)
+    inference = Inference(storeLocation="unused")
+    inference.embeddings = embeddings
+    inference.retriever = MockRetriever()
+    inference.category_router = CategoryRouter(embeddings, PromptCategories().get_category_exemplars()).fit()
+    # A classification call would consume "first response" and shift the answer
+    inference.llm = FakeListChatModel(responses=["first response", "second response"])
+
+    result = inference.run_inference("What is the mechanism of hepatic encephalopathy?", maintain_history=False)
+
+    assert result["answer"] == "first response"
+    assert inference.llm.i == 1
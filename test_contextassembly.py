@@ -0,0 +1,77 @@
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+
+import app as app_module
+from reference.contextassembly import ContextAssembler, join_overlapping
+from reference.runinference2 import Inference
+
+PAGE = (
+    "Patients with long-segment Barrett's esophagus without dysplasia should undergo surveillance endoscopy "
+    "every three to five years. Those with short-segment disease may be surveilled less often, and biopsies "
+    "follow the Seattle protocol with four-quadrant samples every two centimetres of the columnar segment."
+)
+
+
+def words(text):
+    return len(text.split())
+
+
+def chunk(text, source="aga.pdf", page=3):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def test_join_overlapping_merges_splitter_overlap():
+    first, second = PAGE[:150], PAGE[110:]
+
+    assert join_overlapping(first, second) == PAGE
+    assert join_overlapping(second, first) is None
+
+
+def test_duplicates_dropped_and_adjacent_chunks_merged():
+    assembler = ContextAssembler(token_budget=1000, token_counter=words)
+    docs = [
+        chunk(PAGE[:150]),
+        chunk(PAGE[:150] + " (reprinted)", source="aga-copy.pdf"),
+        chunk(PAGE[110:]),
+        chunk("ACG: eradication therapy for dysplastic Barrett's.", source="acg.pdf"),
+    ]
+
+    context, stats = assembler.assemble(docs)
+
+    assert context.split("\n\n") == [PAGE, "ACG: eradication therapy for dysplastic Barrett's."]
+    assert (stats["chunks"], stats["duplicates"], stats["merged"], stats["dropped"]) == (4, 1, 1, 0)
+    assert stats["tokens_saved"] == stats["tokens_in"] - stats["tokens_out"] > 0
+
+
+def test_budget_filled_by_relevance():
+    assembler = ContextAssembler(token_budget=12, token_counter=words)
+    docs = [
+        chunk("one two three four five six seven eight", source="a.pdf"),
+        chunk("alpha beta gamma delta epsilon zeta eta theta iota", source="b.pdf"),
+        chunk("short last chunk", source="c.pdf"),
+    ]
+
+    context, stats = assembler.assemble(docs)
+
+    assert context == "one two three four five six seven eight\n\nshort last chunk"
+    assert stats["dropped"] == 1 and stats["tokens_out"] <= 12
+
+    _, used, _ = assembler.select(docs)
+    assert [d.metadata["source"] for d in used] == ["a.pdf", "c.pdf"]
+
+
+def test_chat_reports_tokens_saved(monkeypatch):
+    engine = Inference(storeLocation="unused")
+    engine.context_assembler = ContextAssembler(token_budget=1000, token_counter=words)
+    engine.retriever = type("Retriever", (), {"invoke": lambda self, query, **kwargs: [chunk(PAGE), chunk(PAGE)]})()
+    engine.llm = FakeListChatModel(responses=["Treatment Recommendation", "stub answer"])
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+
+    with app_module.app.test_client() as client:
+        response = client.post('/chat', json={"message": "How often is Barrett's surveyed?"})
+
+    assert response.status_code == 200
+    assert int(response.headers["X-Context-Tokens-Saved"]) > 0
+    assert int(response.headers["X-Context-Tokens"]) == words(PAGE)
+    # The duplicate chunk the model never saw is not cited
+    assert len(response.json["context"]) == 1
@@ -0,0 +1,88 @@
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+
+from reference.documentmetadata import current_year, extract_metadata, matches, prefer_doc_types, query_filter
+from reference.ingest import Ingestor, make_splitter
+from reference.fakebackends import FakeEmbeddings
+from reference.runinference2 import Inference
+
+
+def test_extract_metadata_from_first_page():
+    text = ("AGA Clinical Practice Update on the Management of Barrett's Esophagus\n"
+            "Received March 2021. Accepted June 2022. Citing work from 2015 and 2018.")
+
+    assert extract_metadata(text, "guidelines/barrett.pdf") == {
+        "year": 2022, "society": "AGA", "doc_type": "practice update"
+    }
+    assert extract_metadata("no dates here", "ACG_2019_GERD_guideline.pdf") == {
+        "year": 2019, "society": "ACG", "doc_type": "guideline"
+    }
+
+
+def test_query_filter_combines_hints():
+    within = query_filter("Compare AGA and ACG guidelines from the last 2 years")
+    assert within == {"$and": [
+        {"year": {"$gte": current_year() - 2}},
+        {"society": {"$in": ["AGA", "ACG"]}},
+    ]}
+    assert query_filter("What is the latest guidance?", recent_years=3) == {"year": {"$gte": current_year() - 3}}
+    assert query_filter("How does GERD present?") is None
+
+
+def test_category_doc_types_rank_first_without_excluding_unlabelled_chunks():
+    docs = [Document(page_content="unlabelled"), Document(page_content="review", metadata={"doc_type": "review"}),
+            Document(page_content="guideline", metadata={"doc_type": "guideline"})]
+
+    ranked = prefer_doc_types(docs, "Treatment Recommendation")
+
+    assert [d.page_content for d in ranked] == ["guideline", "unlabelled", "review"]
+    assert prefer_doc_types(docs, "Other") is docs
+
+
+def test_clinical_intervals_and_ambiguous_acronyms_are_not_filters():
+    for question in ["Colonoscopy within the last 5 years?", "Repeat EGD within 2 years?",
+                     "PPI dose for a current smoker", "ACS risk with clopidogrel and a PPI"]:
+        assert query_filter(question) is None
+    assert query_filter("Studies from the past five years on IBS") == {"year": {"$gte": current_year() - 5}}
+    assert query_filter("What does the American Cancer Society say?") == {"society": "ACS"}
+
+
+def test_patient_history_years_are_not_filters():
+    for question in ["Patient had a normal colonoscopy in 2019; when is the next one due?",
+                     "Born in 1985 with Lynch syndrome", "On adalimumab since 2020, what do guidelines recommend?",
+                     "Surveillance after 2018 polypectomy"]:
+        assert query_filter(question) is None
+    assert query_filter("Guidelines since 2020 on Barrett's") == {"year": {"$gte": 2020}}
+    assert query_filter("Studies published before 2015") == {"year": {"$lt": 2015}}
+    assert query_filter("What does the 2019 AGA guideline say?") == {"$and": [{"year": 2019}, {"society": "AGA"}]}
+
+
+def test_matches_evaluates_where_filters():
+    metadata = {"year": 2021, "society": "AGA"}
+
+    assert matches(metadata, {"$and": [{"year": {"$gte": 2020}}, {"society": {"$in": ["AGA"]}}]})
+    assert not matches(metadata, {"doc_type": "guideline"})
+
+
+def test_retrieval_filters_on_hints_and_tops_up(tmp_path, monkeypatch):
+    monkeypatch.setenv("HYBRID_RETRIEVAL", "0")
+    source = tmp_path / "docs"
+    source.mkdir()
+    (source / "AGA_2023_barrett_guideline.txt").write_text("Barrett esophagus surveillance interval guideline.")
+    (source / "ACG_2016_barrett_guideline.txt").write_text("Barrett esophagus surveillance interval guideline.")
+    (source / "BSG_2017_barrett_guideline.txt").write_text("Barrett esophagus surveillance interval guideline.")
+    store = str(tmp_path / "store")
+    embeddings = FakeEmbeddings(size=32)
+    Ingestor(store, embeddings=embeddings, splitter=make_splitter(200, 0)).run(str(source))
+
+    engine = Inference(storeLocation=store)
+    engine.embeddings = embeddings
+    engine.retriever = Chroma(collection_name="medcopilot", persist_directory=store,
+                              embedding_function=embeddings).as_retriever(search_kwargs={"k": 3})
+
+    docs = engine._retrieve("What does the AGA recommend for Barrett surveillance?")
+    assert [d.metadata["society"] for d in docs][0] == "AGA"
+    assert len(docs) == 3  # topped up from the unfiltered search
+
+    engine.retriever.search_kwargs["k"] = 1
+    assert [d.metadata["society"] for d in engine._retrieve("Barrett surveillance since 2017")] in (["AGA"], ["BSG"])
@@ -0,0 +1,62 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from reference.embeddingcache import CachedEmbeddings
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return super().embed_query(text)
+
+
+def test_repeated_query_hits_cache():
+    inner = CountingEmbeddings(size=8)
+    cache = CachedEmbeddings(inner, model_name="m1")
+
+    first = cache.embed_query("First-line treatment for  HTN?")
+    second = cache.embed_query("first-line treatment for htn?")
+
+    assert first == second
+    assert inner.calls == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_lru_and_ttl_bounds():
+    inner = CountingEmbeddings(size=8)
+    cache = CachedEmbeddings(inner, model_name="m1", max_entries=2, ttl_seconds=0)
+
+    for text in ["a", "b", "c"]:
+        cache.embed_query(text)
+    assert cache.stats()["size"] == 2
+
+    cache.embed_query("c")  # expired immediately with a zero TTL
+    assert inner.calls == 4
+
+
+def test_disk_tier_is_shared_and_keyed_by_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    inner = CountingEmbeddings(size=8)
+    CachedEmbeddings(inner, model_name="m1", persist_path=path).embed_query("barrett's screening")
+
+    other_worker = CachedEmbeddings(inner, model_name="m1", persist_path=path)
+    other_worker.embed_query("barrett's screening")
+    assert inner.calls == 1
+    assert other_worker.stats()["disk_hits"] == 1
+
+    new_model = CachedEmbeddings(inner, model_name="m2", persist_path=path)
+    new_model.embed_query("barrett's screening")
+    assert inner.calls == 2
+
+
+def test_documents_keyed_on_exact_text_and_queries_primed_in_batch():
+    inner = CountingEmbeddings(size=8)
+    cache = CachedEmbeddings(inner, model_name="m1")
+
+    cache.embed_documents(["PPI therapy", "ppi  THERAPY"])
+    assert cache.stats()["misses"] == 2
+
+    cache.embed_queries(["How is GERD treated?"])
+    cache.embed_query("how is gerd  treated?")
+    assert inner.calls == 0 and cache.stats()["hits"] == 1
@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from reference.embeddingcoalescer import CoalescingEmbeddings
+
+
+class BatchCountingEmbeddings(DeterministicFakeEmbedding):
+    batches: int = 0
+
+    def embed_documents(self, texts):
+        self.batches += 1
+        return super().embed_documents(texts)
+
+
+def test_concurrent_queries_share_upstream_calls():
+    inner = BatchCountingEmbeddings(size=8)
+    coalescer = CoalescingEmbeddings(inner, window_ms=50, max_batch=32)
+    texts = [f"question {i}" for i in range(32)]
+
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        vectors = list(pool.map(coalescer.embed_query, texts))
+
+    assert vectors == [inner.embed_query(t) for t in texts]
+    assert inner.batches < 8
+    assert coalescer.stats()["items"] == 32
+
+
+def test_async_queries_are_coalesced_too():
+    inner = BatchCountingEmbeddings(size=8)
+    coalescer = CoalescingEmbeddings(inner, window_ms=50, max_batch=16)
+
+    async def run():
+        return await asyncio.gather(*(coalescer.aembed_query(f"q{i}") for i in range(16)))
+
+    vectors = asyncio.run(run())
+
+    assert vectors[3] == inner.embed_query("q3")
+    assert inner.batches == 1
+
+
+def test_cancelled_caller_does_not_fail_its_batch():
+    inner = BatchCountingEmbeddings(size=8)
+    coalescer = CoalescingEmbeddings(inner, window_ms=50, max_batch=16)
+
+    async def run():
+        first = asyncio.create_task(coalescer.aembed_query("cancelled"))
+        second = asyncio.create_task(coalescer.aembed_query("kept"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == inner.embed_query("kept")
+    assert inner.batches == 1
@@ -0,0 +1,74 @@
+import openai
+import pytest
+
+from benchmarks.stub_openai import StubOpenAIServer, stub_vector
+from reference.embeddingscheduler import EmbeddingScheduler, pack_batches, parse_duration
+
+
+@pytest.fixture
+def limited_server():
+    server = StubOpenAIServer(embed_latency=0.01, dim=8, request_limit=4, rate_window=0.5).start()
+    yield server
+    server.stop()
+
+
+def make_scheduler(server, **kwargs):
+    client = openai.OpenAI(base_url=server.base_url, api_key="stub", max_retries=0)
+    options = dict(client=client, max_batch_tokens=10, max_batch_size=4, initial_concurrency=4,
+                   max_concurrency=8, backoff_base=0.05, backoff_cap=0.5, token_counter=lambda text: 1)
+    options.update(kwargs)
+    return EmbeddingScheduler(**options)
+
+
+def test_pack_batches_respects_token_and_size_budgets():
+    items = list(enumerate(["a" * 4, "b" * 8, "c" * 4, "d", "e", "f"]))
+
+    batches = list(pack_batches(items, len, max_tokens=12, max_size=2))
+
+    assert [[i for i, _ in batch] for batch, _ in batches] == [[0, 1], [2, 3], [4, 5]]
+    assert [tokens for _, tokens in batches] == [12, 5, 2]
+
+
+def test_parse_duration():
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("250ms") == 0.25
+    assert parse_duration("1.5") == 1.5
+
+
+def test_rate_limits_are_retried_and_reduce_concurrency(limited_server):
+    scheduler = make_scheduler(limited_server)
+    texts = [f"chunk {i}" for i in range(40)]
+
+    vectors = scheduler.embed_documents(texts)
+
+    assert [v[:3] for v in vectors] == [stub_vector(t, 8)[:3] for t in texts]
+    stats = scheduler.stats()
+    assert limited_server.rate_limited > 0
+    assert stats["rate_limited"] > 0 and stats["retries"] > 0
+    assert stats["batches"] == 10
+    assert stats["concurrency"] < 4
+
+
+def test_checkpoint_skips_completed_batches(limited_server, tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    texts = [f"chunk {i}" for i in range(12)]
+    make_scheduler(limited_server, checkpoint_path=path).embed_documents(texts[:8])
+    limited_server.reset_counters()
+
+    resumed = make_scheduler(limited_server, checkpoint_path=path)
+    vectors = resumed.embed_documents(texts)
+
+    assert resumed.stats()["reused"] == 8
+    assert limited_server.embedding_requests == 1
+    assert vectors[0][:3] == stub_vector(texts[0], 8)[:3]
+
+
+def test_forget_drops_checkpoint_rows(limited_server, tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    texts = [f"chunk {i}" for i in range(4)]
+    scheduler = make_scheduler(limited_server, checkpoint_path=path)
+    scheduler.embed_documents(texts)
+
+    scheduler.forget(texts[:3])
+
+    assert scheduler._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0] == 1
@@ -0,0 +1,49 @@
+import asyncio
+
+import numpy as np
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from reference.fakebackends import FakeChatModel, FakeEmbeddings, embeddings_backend, llm_backend
+
+
+def test_embeddings_are_deterministic_and_word_sensitive():
+    embeddings = FakeEmbeddings(size=64)
+
+    a = np.array(embeddings.embed_query("GERD treatment options"))
+    again = np.array(embeddings.embed_query("GERD treatment options"))
+    related = np.array(embeddings.embed_query("treatment of GERD"))
+    unrelated = np.array(embeddings.embed_query("colon cancer screening age"))
+
+    assert np.allclose(a, again)
+    assert abs(np.linalg.norm(a) - 1.0) < 1e-9
+    assert a @ related > a @ unrelated
+
+
+def test_chat_model_answers_and_classifies():
+    llm = FakeChatModel(category="Drug Therapy", answer_template="A: {question}")
+
+    assert llm.invoke([SystemMessage("ctx"), HumanMessage("How is GERD treated?")]).content == "A: How is GERD treated?"
+    assert llm.invoke("You are an expert at classifying medical text into categories.").content == "Drug Therapy"
+
+
+def test_chat_model_streams_word_chunks():
+    llm = FakeChatModel(answer_template="one two three {question}")
+
+    chunks = [chunk.content for chunk in llm.stream("four") if chunk.content]
+    achunks = asyncio.run(_collect(llm.astream("four")))
+
+    assert chunks == ["one ", "two ", "three ", "four"]
+    assert achunks == chunks
+
+
+def test_backend_selection(monkeypatch):
+    monkeypatch.delenv("MEDCOPILOT_LLM_BACKEND", raising=False)
+    monkeypatch.delenv("MEDCOPILOT_EMBEDDINGS_BACKEND", raising=False)
+    assert llm_backend() == "openai"
+
+    monkeypatch.setenv("MEDCOPILOT_LLM_BACKEND", "fake")
+    assert embeddings_backend() == "fake"
+
+
+async def _collect(stream):
+    return [chunk.content async for chunk in stream if chunk.content]
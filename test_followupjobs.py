@@ -0,0 +1,64 @@
+import threading
+
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+
+import app as app_module
+from reference.followupjobs import FollowupJobs
+from reference.runinference2 import Inference
+
+
+def test_generated_only_when_asked_and_cached(tmp_path):
+    calls = []
+
+    def generate(question, answer, context):
+        calls.append(question)
+        return ["What dose?", "", "How long?"]
+
+    jobs = FollowupJobs(str(tmp_path / "followups.sqlite3"), generate)
+    key = jobs.create("How is GERD treated?", "PPIs.", "ctx")
+
+    assert calls == []
+    assert jobs.get(key, wait=5) == ("done", ["What dose?", "How long?"])
+    assert jobs.create("how is  GERD treated?", "PPIs.") == key
+    assert jobs.get(key) == ("done", ["What dose?", "How long?"])
+    assert calls == ["How is GERD treated?"]
+    assert jobs.get("unknown") == ("missing", None)
+
+
+def test_full_queue_leaves_job_pending_and_failures_reported(tmp_path):
+    release = threading.Event()
+
+    def generate(question, answer, context):
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    jobs = FollowupJobs(str(tmp_path / "followups.sqlite3"), generate, max_workers=1, max_queue=1)
+    first = jobs.create("q1", "a1")
+    second = jobs.create("q2", "a2")
+
+    assert jobs.get(first)[0] == "running"
+    assert jobs.get(second)[0] == "pending"
+    release.set()
+    assert jobs.get(first, wait=5) == ("failed", None)
+
+
+def test_chat_returns_followup_id_and_endpoint_serves_questions(monkeypatch):
+    engine = Inference(storeLocation="unused")
+    engine.retriever = type("Retriever", (), {"invoke": lambda self, query, **kwargs: [
+        Document(page_content="ACG guideline: PPI therapy for GERD.", metadata={"source": "acg.pdf"})
+    ]})()
+    engine.llm = FakeListChatModel(responses=["Treatment Recommendation", "stub answer",
+                                              "What dose?\nHow long?\nAny risks?"])
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+
+    with app_module.app.test_client() as client:
+        response = client.post('/chat', json={"message": "How is GERD treated?"})
+        followup_id = response.headers["X-Followups-Id"]
+        followups = client.get(f'/chat/followups/{followup_id}?wait=5')
+        missing = client.get('/chat/followups/nope?wait=0')
+
+    assert set(response.json) == {"input", "answer", "context"}
+    assert followups.status_code == 200
+    assert followups.json["questions"] == ["What dose?", "How long?", "Any risks?"]
+    assert missing.status_code == 404
@@ -0,0 +1,65 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from reference.bm25index import BM25Index
+from reference.hybridretriever import HybridRetriever, reciprocal_rank_fusion
+
+
+def test_rrf_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b", "d"]], rrf_k=60)
+
+    assert fused[:2] == ["b", "c"] or fused[:2] == ["c", "b"]
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_rrf_ties_do_not_depend_on_list_order():
+    vector, lexical = ["v1", "shared", "v3"], ["l1", "l2", "shared"]
+
+    fused = reciprocal_rank_fusion([vector, lexical])
+
+    assert fused == reciprocal_rank_fusion([lexical, vector])
+    assert fused[:3] == ["shared", "l1", "v1"]
+    assert reciprocal_rank_fusion([["b", "x"], ["y", "a"]])[:2] == ["b", "y"]
+
+
+def test_hybrid_finds_exact_term_the_embedding_misses(tmp_path):
+    docs = [Document(id=f"d{i}", page_content=f"General gastroenterology guidance paragraph {i}.",
+                     metadata={"source": f"{i}.pdf"}) for i in range(30)]
+    docs.append(Document(id="target", page_content="Vedolizumab dosing for Crohn disease.", metadata={"source": "t.pdf"}))
+    # Random vectors: the vector side effectively never finds the target
+    store = InMemoryVectorStore(embedding=DeterministicFakeEmbedding(size=8))
+    store.add_documents(docs)
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add(docs)
+
+    retriever = HybridRetriever(vectorstore=store, index=index, k=3, candidates=5)
+    results = retriever.invoke("vedolizumab dosing")
+
+    assert len(results) == 3
+    assert "target" in [d.id for d in results]
+
+
+def test_async_lexical_search_runs_off_the_event_loop(tmp_path, monkeypatch):
+    import asyncio
+    import threading
+
+    docs = [Document(id="target", page_content="Vedolizumab dosing for Crohn disease.", metadata={"source": "t.pdf"})]
+    store = InMemoryVectorStore(embedding=DeterministicFakeEmbedding(size=8))
+    store.add_documents(docs)
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    index.add(docs)
+    retriever = HybridRetriever(vectorstore=store, index=index, k=1, candidates=5)
+    threads = []
+    search = index.search
+
+    def recording_search(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(index, "search", recording_search)
+
+    results = asyncio.run(retriever.ainvoke("vedolizumab dosing"))
+
+    assert [d.id for d in results] == ["target"]
+    assert threads and threads[0] is not threading.main_thread()
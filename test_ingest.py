@@ -0,0 +1,141 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from reference.ingest import Ingestor, make_splitter
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings that count embedded documents"""
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def write_docs(folder, docs):
+    folder.mkdir(exist_ok=True)
+    for name, text in docs.items():
+        (folder / name).write_text(text)
+
+
+def make_ingestor(tmp_path, embeddings):
+    return Ingestor(str(tmp_path / "store"), embeddings=embeddings,
+                    splitter=make_splitter(chunk_size=60, chunk_overlap=0), batch_size=4)
+
+
+def paragraph(topic, n):
+    return "\n\n".join(f"{topic} recommendation number {i} for adult patients." for i in range(n))
+
+
+def test_rerun_embeds_only_new_or_changed_chunks(tmp_path):
+    source = tmp_path / "docs"
+    write_docs(source, {"acg.txt": paragraph("GERD", 5), "aga.txt": paragraph("Barrett", 5)})
+    embeddings = CountingEmbeddings(size=8)
+
+    first = make_ingestor(tmp_path, embeddings).run(str(source))
+    assert first["chunks"] == 10 and embeddings.embedded == 10
+
+    second = make_ingestor(tmp_path, embeddings).run(str(source))
+    assert second["skipped"] == 2 and embeddings.embedded == 10
+
+    write_docs(source, {"acg.txt": paragraph("GERD", 5) + "\n\nGERD recommendation added in 2024 update."})
+    third = make_ingestor(tmp_path, embeddings).run(str(source))
+    assert embeddings.embedded == 11
+    assert third["deleted"] == 0
+
+
+def test_changed_and_removed_documents_drop_stale_chunks(tmp_path):
+    source = tmp_path / "docs"
+    write_docs(source, {"acg.txt": paragraph("GERD", 4), "aga.txt": paragraph("Barrett", 3)})
+    ingestor = make_ingestor(tmp_path, CountingEmbeddings(size=8))
+    ingestor.run(str(source))
+
+    write_docs(source, {"acg.txt": paragraph("GERD", 2)})
+    (source / "aga.txt").unlink()
+    stats = ingestor.run(str(source))
+
+    assert stats["removed"] == 1
+    assert stats["deleted"] == 2 + 3
+    stored = ingestor.vectorstore.get(include=["metadatas"])
+    assert len(stored["ids"]) == 2
+    assert {m["source"] for m in stored["metadatas"]} == {"acg.txt"}
+    assert len(ingestor.index) == 2
+    assert {doc_id for doc_id, _ in ingestor.index.search("Barrett recommendation")} <= set(stored["ids"])
+
+
+def test_parallel_parsing_matches_sequential(tmp_path):
+    source = tmp_path / "docs"
+    write_docs(source, {f"doc{i}.txt": paragraph(f"Topic{i}", 4) for i in range(5)})
+
+    sequential = Ingestor(str(tmp_path / "seq"), embeddings=CountingEmbeddings(size=8),
+                          splitter=make_splitter(chunk_size=60, chunk_overlap=0))
+    parallel = Ingestor(str(tmp_path / "par"), embeddings=CountingEmbeddings(size=8),
+                        splitter=make_splitter(chunk_size=60, chunk_overlap=0), workers=2, queue_size=2)
+
+    assert sequential.run(str(source))["chunks"] == parallel.run(str(source))["chunks"] == 20
+    assert set(sequential.vectorstore.get(include=[])["ids"]) == set(parallel.vectorstore.get(include=[])["ids"])
+
+
+def test_interrupted_run_resumes_from_checkpoint(tmp_path):
+    class FlakyEmbeddings(CountingEmbeddings):
+        fail_after: int = 10
+
+        def embed_documents(self, texts):
+            if self.embedded + len(texts) > self.fail_after:
+                raise RuntimeError("rate limited")
+            return super().embed_documents(texts)
+
+    source = tmp_path / "docs"
+    write_docs(source, {"a.txt": paragraph("GERD", 4), "b.txt": paragraph("Barrett", 8)})
+    embeddings = FlakyEmbeddings(size=8)
+
+    with pytest.raises(RuntimeError):
+        make_ingestor(tmp_path, embeddings).run(str(source))
+    # a.txt is checkpointed; b.txt stored its first batch of 4 before failing
+    assert embeddings.embedded == 8
+
+    embeddings.fail_after = 100
+    stats = make_ingestor(tmp_path, embeddings).run(str(source))
+
+    assert stats["skipped"] == 1
+    assert embeddings.embedded == 12
+
+
+def test_subdirectory_run_only_syncs_that_subdirectory(tmp_path):
+    source = tmp_path / "docs"
+    source.mkdir()
+    write_docs(source / "gi", {"acg.txt": paragraph("GERD", 3)})
+    write_docs(source / "cardio", {"acc.txt": paragraph("Hypertension", 2)})
+    embeddings = CountingEmbeddings(size=8)
+    make_ingestor(tmp_path, embeddings).run(str(source))
+
+    (source / "gi" / "aga.txt").write_text(paragraph("Barrett", 2))
+    ingestor = make_ingestor(tmp_path, embeddings)
+    stats = ingestor.run(str(source / "gi"))
+
+    assert (stats["skipped"], stats["removed"], stats["deleted"]) == (1, 0, 0)
+    assert embeddings.embedded == 5 + 2
+    stored = ingestor.vectorstore.get(include=["metadatas"])
+    assert {m["source"] for m in stored["metadatas"]} == {"gi/acg.txt", "gi/aga.txt", "cardio/acc.txt"}
+
+    (source / "gi" / "aga.txt").unlink()
+    assert ingestor.run(str(source / "gi"))["removed"] == 1
+    with pytest.raises(ValueError):
+        ingestor.run(str(tmp_path))
+
+
+def test_committed_documents_leave_no_embedding_checkpoint(tmp_path):
+    class CheckpointedEmbeddings(CountingEmbeddings):
+        forgotten: list = []
+
+        def forget(self, texts):
+            self.forgotten.extend(texts)
+
+    source = tmp_path / "docs"
+    write_docs(source, {"acg.txt": paragraph("GERD", 3)})
+    embeddings = CheckpointedEmbeddings(size=8)
+
+    make_ingestor(tmp_path, embeddings).run(str(source))
+
+    assert len(embeddings.forgotten) == embeddings.embedded == 3
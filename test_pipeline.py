@@ -0,0 +1,253 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.vectorstores import InMemoryVectorStore
+
+import app as app_module
+from reference.runinference2 import Inference
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic embeddings that count query embedding calls"""
+    query_calls: int = 0
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def embeddings():
+    return CountingEmbeddings(size=16)
+
+
+@pytest.fixture
+def engine(embeddings):
+    store = InMemoryVectorStore(embedding=embeddings)
+    store.add_documents([
+        Document(page_content="ACG guideline: PPI therapy for GERD.", metadata={"source": "acg.pdf"}),
+        Document(page_content="AGA guideline: Barrett's esophagus screening.", metadata={"source": "aga.pdf"}),
+    ])
+    inference = Inference(storeLocation="unused")
+    inference.retriever = store.as_retriever(search_kwargs={"k": 2})
+    inference.llm = FakeListChatModel(responses=["Treatment Recommendation", "stub answer"])
+    return inference
+
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+    with app_module.app.test_client() as client:
+        yield client
+
+
+def test_chat_embeds_query_once(client, embeddings):
+    response = client.post('/chat', json={"message": "How is GERD treated?"})
+
+    assert response.status_code == 200
+    assert embeddings.query_calls == 1
+
+
+def test_context_matches_prompt_documents(engine):
+    result = engine.run_inference("How is GERD treated?", maintain_history=False)
+
+    assert len(result["context"]) == 2
+    assert {d.metadata["source"] for d in result["context"]} == {"acg.pdf", "aga.pdf"}
+
+
+def test_classify_and_retrieve_overlap(engine, monkeypatch):
+    import time
+
+    class SlowRetriever:
+        def invoke(self, query):
+            time.sleep(0.2)
+            return []
+
+    def slow_classify(query):
+        time.sleep(0.2)
+        return ["Other"]
+
+    engine.retriever = SlowRetriever()
+    monkeypatch.setattr(engine, "classify_prompt_category", slow_classify)
+
+    timings = engine.run_inference("q", maintain_history=False)["timings"]
+
+    assert timings["classify"] >= 0.2 and timings["retrieve"] >= 0.2
+    assert timings["prepare"] < 0.35
+
+
+def test_chat_stream_sends_context_tokens_and_end(client):
+    response = client.post('/chat/stream', json={"message": "How is GERD treated?"})
+
+    assert response.mimetype == 'text/event-stream'
+    events = [frame.split("\n")[0] for frame in response.get_data(as_text=True).strip().split("\n\n")]
+    assert events[0] == "event: context"
+    assert "event: token" in events
+    assert events[-1] == "event: end"
+    assert '"ttft"' in response.get_data(as_text=True)
+
+
+def test_asgi_chat_matches_flask_contract(engine, monkeypatch):
+    import asyncio
+    import httpx
+    import asgi
+
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+    origin = app_module.allowed_origins[0]
+
+    async def post():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post('/chat', json={"message": "How is GERD treated?"}, headers={"Origin": origin})
+
+    response = asyncio.run(post())
+
+    assert response.status_code == 200
+    assert set(response.json()) == {"input", "answer", "context"}
+    assert response.headers["access-control-allow-origin"] == origin
+    assert response.headers["access-control-allow-credentials"] == "true"
+
+
+def test_flask_and_asgi_agree_on_event_stream_accept_headers(client, engine, monkeypatch):
+    import asyncio
+    import httpx
+    import asgi
+
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+
+    async def post(accept):
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as asgi_client:
+            return await asgi_client.post('/chat', json={"message": "How is GERD treated?"}, headers={"Accept": accept})
+
+    for accept, streams in [("text/event-stream", True), ("text/event-stream, application/json", True),
+                            ("application/json, text/event-stream;q=0.1", False),
+                            ("application/json, text/event-stream", False)]:
+        flask_type = client.post('/chat', json={"message": "How is GERD treated?"}, headers={"Accept": accept}).mimetype
+        asgi_type = asyncio.run(post(accept)).headers["content-type"].split(";")[0]
+        assert flask_type == asgi_type == ("text/event-stream" if streams else "application/json")
+
+
+def test_semantic_cache_serves_repeat_without_llm(client, engine, embeddings):
+    from reference.embeddingcache import CachedEmbeddings
+    from reference.semanticcache import SemanticCache
+
+    engine.embeddings = CachedEmbeddings(embeddings)
+    engine.semantic_cache = SemanticCache(threshold=0.95)
+    engine.llm = FakeListChatModel(responses=["Other", "first answer", "Other", "second answer"])
+
+    first = client.post('/chat', json={"message": "How is GERD treated?"})
+    second = client.post('/chat', json={"message": "how is GERD treated?"})
+
+    assert first.headers["X-Semantic-Cache"] == "MISS"
+    assert second.headers["X-Semantic-Cache"] == "HIT"
+    assert float(second.headers["X-Semantic-Cache-Score"]) >= 0.95
+    assert second.json["answer"] == "first answer"
+    assert len(second.json["context"]) == 2
+
+
+def test_response_cache_hit_and_admin_purge(client, engine, tmp_path, monkeypatch):
+    from reference.responsecache import ResponseCache
+
+    engine.response_cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    engine.llm = FakeListChatModel(responses=["Other", "cached answer", "Other", "fresh answer"])
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+    first = client.post('/chat', json={"message": "How is GERD treated?"})
+    # A hit must need neither retrieval nor another classification call
+    class FailingRetriever:
+        def invoke(self, query, **kwargs):
+            raise AssertionError("retrieval on a cache hit")
+
+    retriever, engine.retriever = engine.retriever, FailingRetriever()
+    engine.llm = FakeListChatModel(responses=[])
+    second = client.post('/chat', json={"message": "How is GERD treated?"})
+    engine.retriever = retriever
+
+    assert first.headers["X-Response-Cache"] == "MISS"
+    assert second.headers["X-Response-Cache"] == "FRESH"
+    assert second.json == first.json
+
+    assert client.get('/admin/response-cache').status_code == 403
+    listing = client.get('/admin/response-cache', headers={"X-Admin-Token": "secret"})
+    assert listing.json["stats"]["entries"] == 1
+    purge = client.delete('/admin/response-cache', headers={"X-Admin-Token": "secret"})
+    assert purge.json == {"purged": 1}
+
+
+def test_chat_batch_streams_ndjson_with_per_item_errors(client, engine, monkeypatch):
+    import json
+
+    original = engine.run_inference
+
+    def flaky(message, maintain_history=True):
+        if message == "boom":
+            raise RuntimeError("upstream failed")
+        return original(message, maintain_history)
+
+    monkeypatch.setattr(engine, "run_inference", flaky)
+    engine.llm = FakeListChatModel(responses=["Other", "batch answer"])
+
+    response = client.post('/chat/batch', json={"messages": ["How is GERD treated?", "boom", {"id": "x", "message": "Barrett's?"}]})
+
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    items = sorted(lines[:-1], key=lambda line: line["index"])
+    assert response.mimetype == 'application/x-ndjson'
+    assert [item["status"] for item in items] == ["ok", "error", "ok"]
+    assert items[2]["id"] == "x"
+    assert lines[-1]["done"] and lines[-1]["errors"] == 1
+
+
+def test_chat_batch_rejects_bad_input(client):
+    assert client.post('/chat/batch', json={"messages": []}).status_code == 400
+    assert client.post('/chat/batch', json={"messages": ["ok", 3]}).status_code == 400
+    bad_concurrency = client.post('/chat/batch', json={"messages": ["ok"], "concurrency": "abc"})
+    assert bad_concurrency.status_code == 400 and "concurrency" in bad_concurrency.json["error"]
+
+
+def test_async_inference_initializes_off_the_event_loop(engine, monkeypatch):
+    import asyncio
+    import threading
+
+    threads = []
+
+    def build():
+        threads.append(threading.current_thread())
+        engine.llm = FakeListChatModel(responses=["Treatment Recommendation", "stub answer"])
+
+    engine.llm = None
+    monkeypatch.setattr(engine, "_build_components", build)
+
+    result = asyncio.run(engine.arun_inference("How is GERD treated?", maintain_history=False))
+
+    assert result["answer"] == "stub answer"
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_asgi_admin_response_cache(engine, tmp_path, monkeypatch):
+    import asyncio
+    import httpx
+    import asgi
+    from reference.responsecache import ResponseCache
+
+    engine.response_cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    admin = {"X-Admin-Token": "secret"}
+
+    async def exercise():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post('/chat', json={"message": "How is GERD treated?"})
+            return (
+                await client.get('/admin/response-cache'),
+                await client.get('/admin/response-cache?limit=x', headers=admin),
+                await client.delete('/admin/response-cache', headers=admin),
+            )
+
+    forbidden, listing, purge = asyncio.run(exercise())
+
+    assert forbidden.status_code == 403
+    assert listing.json()["stats"]["entries"] == 1
+    assert purge.json() == {"purged": 1}
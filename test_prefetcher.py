@@ -0,0 +1,111 @@
+import time
+
+from langchain_core.documents import Document
+
+import app as app_module
+from reference.fakebackends import FakeChatModel
+from reference.prefetcher import FollowupPrefetcher
+from reference.responsecache import ResponseCache
+from reference.runinference2 import Inference
+
+
+class StubEngine:
+    response_cache = object()
+
+    def __init__(self):
+        self.primed = []
+        self.retrieved = []
+        self.answered = []
+
+    def prime_embeddings(self, questions):
+        self.primed.append(list(questions))
+
+    def prefetch_documents(self, question):
+        self.retrieved.append(question)
+        return "g1", [Document(page_content=f"docs for {question}")]
+
+    def run_inference(self, question, maintain_history=True):
+        self.answered.append(question)
+        return {"input": question, "answer": "ten words " * 5, "context_tokens": {"tokens_out": 90}}
+
+
+def words(text):
+    return len(text.split())
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+def test_answers_respect_session_budget_and_count_hits():
+    engine = StubEngine()
+    prefetcher = FollowupPrefetcher(engine, mode="answer", max_tokens_per_session=150, token_counter=words)
+
+    prefetcher.submit(["What dose?", "How long?", "Any risks?"], origin="s1")
+    assert wait_for(lambda: prefetcher.over_budget == 1)
+
+    assert engine.primed == [["What dose?", "How long?", "Any risks?"]]
+    assert engine.answered == ["What dose?", "How long?"]
+    assert prefetcher.record_hit("what  dose?") and not prefetcher.record_hit("What dose?")
+    stats = prefetcher.stats()
+    assert (stats["answers"], stats["hits"], stats["hit_rate"]) == (2, 1, 0.5)
+    assert stats["tokens_spent"] == 2 * (90 + 2 + 10) and stats["wasted_tokens"] == 102
+
+
+def test_retrieval_only_for_sessions_and_per_minute_cap():
+    engine = StubEngine()
+    prefetcher = FollowupPrefetcher(engine, mode="answer", max_answers_per_minute=1, token_counter=words)
+
+    prefetcher.submit(["In a session?"], origin="s1", stateless=False)
+    prefetcher.submit(["First?", "Second?"], origin="job")
+    assert wait_for(lambda: prefetcher.over_budget == 1)
+
+    assert engine.answered == ["First?"]
+    assert len(engine.primed) == 2
+
+
+def test_clicked_followup_served_from_prefetched_answer(tmp_path, monkeypatch):
+    monkeypatch.setenv("PREFETCH", "answer")
+    engine = Inference(storeLocation="unused")
+    engine.response_cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    engine.retriever = type("Retriever", (), {"invoke": lambda self, query, **kwargs: [
+        Document(page_content="ACG guideline: PPI therapy for GERD.", metadata={"source": "acg.pdf"})
+    ]})()
+    engine.llm = FakeChatModel(category="Drug Therapy", answer_template="Answer to {question}")
+    engine.followups.generate = lambda question, answer, context: ["What dose of omeprazole?"]
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+
+    with app_module.app.test_client() as client:
+        first = client.post('/chat', json={"message": "How is GERD treated?"})
+        client.get(f'/chat/followups/{first.headers["X-Followups-Id"]}?wait=5')
+        assert wait_for(lambda: engine.prefetcher.answers == 1)
+        click = client.post('/chat', json={"message": "What dose of omeprazole?"})
+
+    assert click.headers["X-Response-Cache"] == "FRESH"
+    assert engine.prefetcher.stats()["hits"] == 1
+
+
+def test_retrieval_mode_serves_prefetched_documents_to_the_click():
+    searches = []
+
+    class CountingRetriever:
+        def invoke(self, query, **kwargs):
+            searches.append(query)
+            return [Document(page_content="ACG guideline: PPI therapy for GERD.", metadata={"source": "acg.pdf"})]
+
+    engine = Inference(storeLocation="unused")
+    engine.retriever = CountingRetriever()
+    engine.llm = FakeChatModel(category="Drug Therapy", answer_template="Answer to {question}")
+    engine.prefetcher = FollowupPrefetcher(engine, mode="retrieval")
+
+    engine.prefetcher.submit(["What dose of omeprazole?"], origin="s1")
+    assert wait_for(lambda: engine.prefetcher.retrieved == 1)
+    results = engine.run_inference("What dose of omeprazole?", maintain_history=False)
+
+    assert searches == ["What dose of omeprazole?"]
+    assert results["context"][0].page_content.startswith("ACG guideline")
+    assert engine.prefetcher.stats()["retrieval_hits"] == 1
+    assert engine.prefetcher.take_documents("What dose of omeprazole?", "any") is None
@@ -0,0 +1,45 @@
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from reference.promptcategories import PromptCategories
+from reference.promptregistry import PromptRegistry, compile_text
+from reference.runinference2 import Inference
+
+
+def test_compile_text_escapes_literal_braces():
+    text = compile_text(("Q: {question} as JSON: {", " answer: text ", "}"), ["question"])
+
+    assert text == "Q: {question} as JSON: {{ answer: text }}"
+
+
+def test_rag_prompt_takes_history_through_placeholder():
+    registry = PromptRegistry(PromptCategories())
+    history = [SystemMessage("Summary of the earlier conversation: asked about {dosing}"),
+               HumanMessage("What about {x}?"), AIMessage("Use {y}.")]
+
+    messages = registry.rag_prompt("Drug Therapy").invoke(
+        {"context": "ctx", "input": "next", PromptRegistry.HISTORY: history}
+    ).to_messages()
+
+    assert "ctx" in messages[0].content
+    assert [m.content for m in messages[1:]] == [m.content for m in history] + ["next"]
+    assert len(registry.rag_prompt("Unknown").invoke({"context": "", "input": "q"}).to_messages()) == 2
+
+
+def test_chains_built_once_per_llm():
+    registry = PromptRegistry(PromptCategories())
+    llm = FakeListChatModel(responses=["a"])
+
+    first = registry.rag_chain("Drug Therapy", llm)
+    assert registry.rag_chain("Drug Therapy", llm) is first
+    assert registry.chain("followup", llm) is registry.chain("followup", llm)
+    assert registry.rag_chain("Drug Therapy", FakeListChatModel(responses=["b"])) is not first
+
+
+def test_followup_questions_use_compiled_template():
+    engine = Inference(storeLocation="unused")
+    engine.llm = FakeListChatModel(responses=["What dose?\nHow long?\nAny risks?"])
+
+    questions = engine.generate_followup_questions("How is GERD treated?", {"answer": "PPIs", "context": "ctx"})
+
+    assert questions == ["What dose?", "How long?", "Any risks?"]
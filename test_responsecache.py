@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from reference.responsecache import ResponseCache
+
+PAYLOAD = {"input": "q", "answer": "a", "context": [{"metadata": {}, "page_content": "doc"}]}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "responses.sqlite3"))
+
+
+def test_key_covers_question_category_generation_and_model(cache):
+    key = cache.make_key("What is GERD?", "Other", "g1", "gpt-4o")
+
+    assert key == cache.make_key("  what is  GERD? ", "Other", "g1", "gpt-4o")
+    assert key != cache.make_key("What is GERD?", "Drug Therapy", "g1", "gpt-4o")
+    assert key != cache.make_key("What is GERD?", "Other", "g2", "gpt-4o")
+    assert key != cache.make_key("What is GERD?", "Other", "g1", "gpt-4o-mini")
+
+
+def test_round_trip_is_shared_between_instances(cache):
+    cache.put("k", PAYLOAD)
+
+    other_worker = ResponseCache(cache.path)
+    assert other_worker.get("k") == (PAYLOAD, "fresh")
+    assert other_worker.get("missing") == (None, "miss")
+
+
+def test_stale_entries_are_served_only_when_hot(cache):
+    cache.fresh_seconds = 0
+    cache.swr_min_hits = 1
+    cache.put("k", PAYLOAD)
+    time.sleep(0.01)
+
+    assert cache.get("k") == (None, "miss")
+    cache.fresh_seconds = 60
+    cache.get("k")
+    cache.fresh_seconds = 0
+    assert cache.get("k") == (PAYLOAD, "stale")
+
+
+def test_evicts_by_size_and_purges(cache):
+    cache.max_bytes = 200
+    for key in ["a", "b", "c"]:
+        cache.put(key, PAYLOAD)
+
+    assert cache.get("a") == (None, "miss")
+    assert cache.stats()["entries"] == 2
+    assert cache.purge(key="b") == 1
+    assert cache.purge() == 1
+
+
+def test_hits_are_buffered_instead_of_written_per_lookup(cache):
+    cache.put("k", PAYLOAD)
+    cache.get("k")
+    cache.get("k")
+
+    other_worker = ResponseCache(cache.path)
+    assert other_worker.entries()[0]["hits"] == 0
+    assert cache.stats()["hits"] == 2
+    assert other_worker.entries()[0]["hits"] == 2
@@ -0,0 +1,34 @@
+from reference.semanticcache import SemanticCache
+
+
+def test_lookup_respects_threshold():
+    cache = SemanticCache(threshold=0.9, max_entries=4)
+    cache.store([1.0, 0.0, 0.0], {"answer": "a"})
+
+    payload, score = cache.lookup([0.99, 0.1, 0.0])
+    assert payload == {"answer": "a"} and score > 0.9
+
+    payload, score = cache.lookup([0.0, 1.0, 0.0])
+    assert payload is None and score < 0.9
+    assert cache.stats()["hits"] == 1 and cache.stats()["lookups"] == 2
+
+
+def test_evicts_least_recently_used():
+    cache = SemanticCache(threshold=0.99, max_entries=2)
+    cache.store([1.0, 0.0], {"answer": "x"})
+    cache.store([0.0, 1.0], {"answer": "y"})
+    cache.lookup([1.0, 0.0])
+    cache.store([-1.0, 0.0], {"answer": "z"})
+
+    assert cache.lookup([1.0, 0.0])[0] == {"answer": "x"}
+    assert cache.lookup([0.0, 1.0])[0] is None
+
+
+def test_invalidated_when_store_generation_changes():
+    generation = ["g1"]
+    cache = SemanticCache(threshold=0.9, generation_fn=lambda: generation[0])
+    cache.store([1.0, 0.0], {"answer": "a"})
+
+    generation[0] = "g2"
+    assert cache.lookup([1.0, 0.0])[0] is None
+    assert cache.stats()["entries"] == 0
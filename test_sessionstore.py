@@ -0,0 +1,108 @@
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import app as app_module
+from reference.runinference2 import Inference
+from reference.sessionstore import MemorySessionBackend, SessionStore, SqliteSessionBackend
+
+
+def words(text):
+    return len(text.split())
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemorySessionBackend(max_sessions=2)
+    for session in ("a", "b"):
+        backend.update(session, lambda s: s["turns"].append({"human": "q", "ai": "a", "tokens": 2}))
+    backend.get("a")
+    backend.update("c", lambda s: None)
+
+    assert backend.get("b") is None
+    assert backend.get("a") is not None and len(backend) == 2
+
+
+def test_turns_roll_into_summary_within_budget(tmp_path):
+    calls = []
+
+    def summarizer(summary, turns, max_tokens):
+        calls.append([turn["human"] for turn in turns])
+        return " ".join(filter(None, [summary] + [turn["human"] for turn in turns]))
+
+    store = SessionStore(SqliteSessionBackend(str(tmp_path / "sessions.sqlite3")), token_budget=20,
+                         summarizer=summarizer, background=False, token_counter=words)
+    for i in range(6):
+        store.append("s1", f"question {i}", "answer with four words")
+
+    history = store.history("s1")
+    assert isinstance(history[0], SystemMessage) and "question 0" in history[0].content
+    assert [m.content for m in history[-2:]] == ["question 5", "answer with four words"]
+    assert sum(words(m.content) for m in history) <= 20 + words("Summary of the earlier conversation:")
+    assert calls and store.history("other") == []
+
+
+def test_extractive_summary_when_summarizer_fails():
+    def broken(summary, turns, max_tokens):
+        raise RuntimeError("upstream down")
+
+    store = SessionStore(MemorySessionBackend(), token_budget=15, summary_share=1.0, summarizer=broken,
+                         background=False, token_counter=words)
+    store.append("s1", "Is PPI therapy safe long term? More detail.", "Generally yes. With caveats.")
+    store.append("s1", "And in pregnancy?", "Discuss with obstetrics.")
+
+    summary = store.history("s1")[0].content
+    assert "Q: Is PPI therapy safe long term? A: Generally yes." in summary
+
+
+def test_chat_session_replays_history(monkeypatch):
+    engine = Inference(storeLocation="unused")
+    engine.session_store = SessionStore(MemorySessionBackend(), token_budget=1000, background=False,
+                                        token_counter=words)
+    engine.retriever = type("Retriever", (), {"invoke": lambda self, query, **kwargs: [
+        Document(page_content="ACG guideline: PPI therapy for GERD.", metadata={"source": "acg.pdf"})
+    ]})()
+    engine.llm = FakeListChatModel(responses=["Treatment Recommendation", "first answer",
+                                              "Treatment Recommendation", "second answer"])
+    prompts = []
+    original = engine._build_chain
+    monkeypatch.setattr(engine, "_build_chain", lambda query, prepared, history: (
+        prompts.append(list(history)) or original(query, prepared, history)
+    ))
+    monkeypatch.setattr(app_module.engine_manager, "_engine", engine)
+
+    with app_module.app.test_client() as client:
+        first = client.post('/chat', json={"message": "How is GERD treated?"}, headers={"X-Session-Id": "abc"})
+        client.post('/chat', json={"message": "For how long?", "session_id": "abc"})
+        client.post('/chat', json={"message": "Stateless question"})
+
+    assert first.headers["X-Session-Id"] == "abc"
+    assert prompts[0] == [] and prompts[2] == []
+    assert prompts[1] == [HumanMessage(content="How is GERD treated?"), AIMessage(content="first answer")]
+    assert engine.conversation_history == []
+
+
+def test_async_inference_reads_and_writes_sessions_off_the_event_loop():
+    import asyncio
+    import threading
+
+    class ThreadRecordingBackend(MemorySessionBackend):
+        threads = []
+
+        def get(self, session_id):
+            self.threads.append(threading.current_thread())
+            return super().get(session_id)
+
+        def update(self, session_id, mutate):
+            self.threads.append(threading.current_thread())
+            return super().update(session_id, mutate)
+
+    engine = Inference(storeLocation="unused")
+    engine.session_store = SessionStore(ThreadRecordingBackend(), token_budget=1000, background=False,
+                                        token_counter=words)
+    engine.retriever = type("Retriever", (), {"invoke": lambda self, query, **kwargs: []})()
+    engine.llm = FakeListChatModel(responses=["Other", "answer"])
+
+    asyncio.run(engine.arun_inference("How is GERD treated?", session_id="abc"))
+
+    assert ThreadRecordingBackend.threads
+    assert threading.main_thread() not in ThreadRecordingBackend.threads
@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from reference.zeroshotclassifier import ZeroShotClassifier
+
+
+class FakePipeline:
+    """Stands in for the transformers pipeline: picks the label named in the text"""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, texts, candidate_labels, batch_size):
+        with self.lock:
+            self.calls.append(len(texts))
+        return [
+            {"labels": sorted(candidate_labels, key=lambda label: label not in text)}
+            for text in texts
+        ]
+
+
+def test_pipeline_loaded_once_and_queries_batched():
+    pipe = FakePipeline()
+    loads = []
+
+    def factory():
+        loads.append(1)
+        return pipe
+
+    classifier = ZeroShotClassifier(["alpha", "beta"], max_batch=8, max_wait_ms=50, pipeline_factory=factory)
+    queries = ["about beta", "about alpha"] * 8
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        labels = list(pool.map(classifier.classify, queries))
+
+    assert labels == ["beta", "alpha"] * 8
+    assert loads == [1]
+    assert sum(pipe.calls) == 16
+    assert len(pipe.calls) < 16
+
+
+def test_failed_load_is_remembered_until_retry():
+    loads = []
+
+    def factory():
+        loads.append(1)
+        raise ImportError("No module named 'transformers'")
+
+    classifier = ZeroShotClassifier(["alpha"], retry_seconds=60, pipeline_factory=factory)
+
+    for _ in range(3):
+        with pytest.raises(Exception):
+            classifier.classify("about alpha")
+    assert loads == [1]
+    assert "transformers" in classifier.stats()["load_error"]
+
+    classifier.retry_seconds = 0
+    classifier._retry_at = 0.0
+    with pytest.raises(ImportError):
+        classifier.classify_batch(["about alpha"])
+    assert loads == [1, 1]
+
+
+def test_engine_uses_zero_shot_before_the_llm():
+    from langchain_core.language_models import FakeListChatModel
+
+    from reference.runinference2 import Inference
+
+    inference = Inference(storeLocation="unused")
+    inference.llm = FakeListChatModel(responses=["Other"])
+    categories = inference.promt_categories.get_categories()
+    inference.zero_shot = ZeroShotClassifier(categories, pipeline_factory=FakePipeline)
+
+    assert inference.classify_prompt_category(f"Question about {categories[1]}") == [categories[1]]
+    assert inference.llm.i == 0
+
+    inference.zero_shot = ZeroShotClassifier(categories, pipeline_factory=lambda: 1 / 0)
+    assert inference.classify_prompt_category("Unknown question") == ["Other"]
+
+
+def test_micro_batcher_fails_short_batches_instead_of_hanging():
+    from reference.microbatch import MicroBatcher
+
+    batcher = MicroBatcher(lambda items: items[:1], max_batch=2, max_wait_ms=50)
+    futures = [batcher.submit("a"), batcher.submit("b")]
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    assert batcher.stats()["batches"] == 0